@@ -0,0 +1,86 @@
+"""
+只读副本的数据库路由。
+
+DATABASE_REPLICAS 列出只读副本的别名，为空时所有查询都走主库（default）。
+只有 replica_reads 装饰的视图在处理 GET/HEAD 请求时从副本读，其余的读和所有写都走主库。
+一个请求只选一次副本，请求内的读都走这个副本，看到的是同一个时间点的数据。
+副本有复制延迟，为了让用户马上看到自己写入的内容，ReplicaPinMiddleware 在请求写过数据库后
+给这个浏览器设置一个短期 cookie，REPLICA_PIN_SECONDS 秒内它的读请求仍走主库；
+同一个请求里写过之后的读也走主库。
+会话的保存和 unpinned() 中的写入（浏览量、最后访问时间等顺带写回的计数）与这个用户自己的内容无关，
+不算作写过，否则碰巧触发写回的访客都会被固定到主库。
+"""
+import random
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+DEFAULT_DB = 'default'
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+UNPINNED_APPS = ('sessions',)   # 这些应用的写入不固定到主库
+
+_state = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if replica and not getattr(_state, 'wrote', False):
+            return replica
+        return DEFAULT_DB
+
+    def db_for_write(self, model, **hints):
+        if not getattr(_state, 'unpinned', False) and model._meta.app_label not in UNPINNED_APPS:
+            _state.wrote = True
+        return DEFAULT_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本和主库是同一份数据
+        return True
+
+
+def replica_reads(view):
+    """视图中的读查询走只读副本，用于列表、个人主页、排行榜等只读页面"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or PIN_COOKIE in request.COOKIES or not replicas():
+            return view(request, *args, **kwargs)
+        _state.replica = random.choice(replicas())
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.replica = None
+    return wrapper
+
+
+@contextmanager
+def unpinned():
+    """块中的写入不让当前浏览器固定到主库"""
+    previous = getattr(_state, 'unpinned', False)
+    _state.unpinned = True
+    try:
+        yield
+    finally:
+        _state.unpinned = previous
+
+
+class ReplicaPinMiddleware(object):
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.wrote = False
+        response = self.get_response(request)
+        if replicas() and (_state.wrote or request.method not in SAFE_METHODS):
+            response.set_cookie(PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                                httponly=True)
+        _state.wrote = False
+        return response
@@ -0,0 +1,59 @@
+"""
+每个请求的 SQL 查询统计。
+
+记录查询数、SQL 总耗时和重复查询数（同一条 SQL 执行多次，通常是 N+1），
+写入响应头 X-Query-Count / X-Query-Time / X-Query-Duplicates 并输出一行日志。
+统计所有数据库别名（主库和只读副本）上的查询。由 QUERY_STATS 开关控制，默认跟随 DEBUG，测试时关闭。
+"""
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def summarize(queries):
+    """返回 (查询数, 总耗时毫秒, 重复查询数)"""
+    total_time = sum(float(query['time']) for query in queries) * 1000
+    duplicates = sum(n - 1 for n in Counter(query['sql'] for query in queries).values())
+    return len(queries), total_time, duplicates
+
+
+def _connections():
+    # 测试时副本是主库的镜像，两个别名是同一个连接对象，只算一次
+    unique = {}
+    for conn in connections.all():
+        unique.setdefault(id(conn), conn)
+    return list(unique.values())
+
+
+class QueryStatsMiddleware(object):
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_STATS', settings.DEBUG):
+            return self.get_response(request)
+
+        # 与 CaptureQueriesContext 相同：临时打开每个连接的查询日志，请求结束后取出新增的部分
+        started = []
+        for conn in _connections():
+            started.append((conn, conn.force_debug_cursor, len(conn.queries_log)))
+            conn.force_debug_cursor = True
+        try:
+            response = self.get_response(request)
+        finally:
+            queries = []
+            for conn, force_debug_cursor, start in started:
+                conn.force_debug_cursor = force_debug_cursor
+                queries.extend(list(conn.queries_log)[start:])
+        count, total_time, duplicates = summarize(queries)
+
+        response['X-Query-Count'] = count
+        response['X-Query-Time'] = '{:.1f}ms'.format(total_time)
+        response['X-Query-Duplicates'] = duplicates
+        logger.info('{} {} {} queries={} time={:.1f}ms duplicates={}'.format(
+            request.method, request.get_full_path(), response.status_code, count, total_time, duplicates))
+        return response
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -25,6 +26,8 @@ SECRET_KEY = 'g0^qg9ei*7d3r1#42wdtx&&8ex_nc&9gtpj+@jdbula+zn^+ga'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 ALLOWED_HOSTS = []
 
 
@@ -41,10 +44,14 @@ INSTALLED_APPS = [
     'people',
     'question',
     'sites',
+    'search',
 ]
 
 MIDDLEWARE = [
+    'QA.querystats.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'QA.staticfiles.StaticFilesMiddleware',
+    'QA.dbrouter.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,6 +63,8 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'QA.urls'
 
+TEST_RUNNER = 'question.testing.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -67,6 +76,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'question.context_processors.sidebar_counts',
             ],
         },
     },
@@ -82,8 +92,29 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # 只读副本，由数据库自身的复制保持同步；本地可以指向另一个 SQLite 文件或 PostgreSQL 库，
+    # 测试时作为 default 的镜像，不单独建库
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['QA.dbrouter.ReplicaRouter']
+DATABASE_REPLICAS = []          # 启用的只读副本别名，如 ['replica']；为空时所有查询都走主库
+REPLICA_PIN_SECONDS = 10        # 写入后这么多秒内同一浏览器的读请求仍走主库，等副本追上
+
+# 整页缓存、分类树的版本号和各种计数缓存必须在所有 worker 进程之间共享，生产环境使用 memcached；
+# 进程内的 LocMemCache 只用于开发和测试，部署检查（manage.py check --deploy）会报错
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('MEMCACHED_LOCATION', '127.0.0.1:11211'),
+    },
+}
+if DEBUG or TESTING:
+    CACHES['default'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
 
 
 # Password validation
@@ -123,20 +154,33 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
 STATIC_URL = '/static/'
-STATICFILE_DIRS = (
+STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
 )
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')     # collectstatic 的输出目录
+# 文件名加内容哈希并写出 .gz/.br 压缩副本，由 QA.staticfiles.StaticFilesMiddleware 提供
+STATICFILES_STORAGE = 'QA.staticfiles.CompressedManifestStaticFilesStorage'
+STATIC_MAX_AGE = 60             # 不带哈希的静态文件的缓存秒数
 
 
 AUTH_USER_MODEL = 'people.Member'
 
 NUM_TOPIC_PAGE = 10
 NUM_COMMENT_PAGE = 10
+NUM_NOTICE_PAGE = 20
 
 GRAVATAR_URL_PREFIX = 'http://www.gravatar.com/'
 GRAVATAR_DEFAULT_IMAGE = ''
 GRAVATAR_DEFAULT_RATING = 'g'
 GRAVATAR_DEFAULT_SIZE = '48'
+GRAVATAR_CACHE_SIZE = 4096       # 头像地址 LRU 缓存的条目数
+GRAVATAR_ENABLED = True          # 为 False 时未上传头像的用户显示默认头像，不请求 Gravatar
+
+AVATAR_STORAGE = 'people.avatars.LocalAvatarStorage'    # 七牛：people.avatars.QiniuAvatarStorage
+AVATAR_ROOT = os.path.join(BASE_DIR, 'media', 'avatars')
+AVATAR_SIZES = (24, 48, 73, 120)     # 上传时预先生成的头像尺寸，与模板中用到的尺寸一致
+AVATAR_MAX_SIZE = 300 * 1024         # 上传头像的最大字节数
+AVATAR_MAX_DIMENSION = 4096          # 上传头像的最大宽高（像素），在解码前检查
 
 LOGIN_URL = '/login/'
 
@@ -151,9 +195,57 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = '163邮箱地址'
 EMAIL_HOST_PASSWORD = '163邮箱授权码'
 
+OUTBOX_BATCH_SIZE = 50          # 每个 SMTP 连接发送的邮件数
+OUTBOX_MAX_ATTEMPTS = 5         # 发送失败的邮件最多尝试次数
+OUTBOX_RETRY_DELAY = 60         # 第一次重试前等待的秒数，之后每次翻倍
+
 EMAIL_TOKEN_SALT = 'qwertyuiopmnbvcxz'
 
 
 AK = 'key'
 SK = 'key'
 QINIU_URL = '七牛存储地址'
+
+VIEW_FLUSH_INTERVAL = 30        # 浏览量最长缓冲秒数
+VIEW_FLUSH_THRESHOLD = 500      # 缓冲的浏览次数达到该值时立即写回
+
+HOT_TOPICS_HOURS = 24           # 今日热议的统计窗口（小时）
+HOT_TOPICS_NUM = 10
+HOT_TOPICS_CACHE_SECONDS = 60   # 今日热议结果的缓存时间（秒）
+
+KEYSET_PAGINATE_THRESHOLD = 1000    # 总数超过该值的列表改用游标分页
+
+SEARCH_MAX_TERMS = 10           # 查询最多使用的词数
+SEARCH_MAX_RESULTS = 200        # 搜索结果最多返回的主题数
+SEARCH_TERM_POSTINGS = 1000     # 每个词最多读取的倒排记录数（按权重从高到低）
+
+MAX_MENTIONS = 10               # 每条回复最多通知的被 @ 用户数
+
+LAST_SEEN_INTERVAL = 300        # 同一用户 IP 不变时，最近访问记录最多隔多少秒写一次库
+LAST_SEEN_FLUSH_INTERVAL = 60   # 待写的访问记录最长缓冲秒数
+LAST_SEEN_BATCH_SIZE = 100
+PAGE_CACHE_TIMEOUT = 3600       # 未登录用户整页缓存的超时秒数，内容变化时通过版本号立即失效
+TAXONOMY_TIMEOUT = 300          # 节点、酷站分类树的缓存秒数，修改时通过版本号立即失效，超时只是兜底
+
+QUERY_STATS = DEBUG and not TESTING   # 是否在响应头和日志中记录每个请求的 SQL 查询数和耗时
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'QA.querystats': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+FEED_FANOUT_LIMIT = 1000        # 粉丝数超过这个值的用户发帖时不再逐个写入粉丝的动态，改为读取时合并
+# 推送连接等待期间占用一个 worker 线程，需要用 gthread/gevent worker 或单独的进程提供 /events/，见 question/events.py
+EVENTS_STREAM_TIMEOUT = 5       # 推送连接没有变化时最多等待的秒数，到时断开
+EVENTS_RETRY = 15000            # 断开后浏览器等待多少毫秒重连
+API_PAGE_SIZE = 20              # JSON API 每页的条目数
@@ -0,0 +1,153 @@
+"""
+静态文件的指纹、预压缩和长期缓存。
+
+collectstatic 时由 CompressedManifestStaticFilesStorage 把文件名改成带内容哈希的版本（css/main.3f2a….css），
+并为文本类文件写出 .gz 和 .br（安装了 brotli 时）压缩副本；模板里的 static 标签自动输出带哈希的地址。
+StaticFilesMiddleware 直接从 STATIC_ROOT 提供这些文件：按 Accept-Encoding 选择压缩副本，
+带哈希的文件内容永远不变，返回 immutable 的长期缓存头，其余文件短期缓存并支持 If-Modified-Since。
+"""
+import gzip
+import io
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_MAX_AGE = getattr(settings, 'STATIC_MAX_AGE', 60)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+COMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map', '.eot', '.ttf')
+# 压缩后至少要小这么多才值得保存
+COMPRESS_MIN_RATIO = 0.95
+
+# (Accept-Encoding 中的名字, 副本后缀)，按优先顺序
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def gzip_compress(content):
+    buf = io.BytesIO()
+    # mtime 固定为 0，相同内容每次生成相同的文件
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(content)
+    return buf.getvalue()
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def url_converter(self, name, hashed_files, template=None):
+        converter = super(CompressedManifestStaticFilesStorage, self).url_converter(name, hashed_files, template)
+
+        def convert(matchobj):
+            try:
+                return converter(matchobj)
+            except ValueError:
+                return matchobj.group(0)    # 引用的文件不存在（如 bootstrap 的字体），保持原样
+        return convert
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name     # 还没有运行 collectstatic（开发和测试环境），使用原文件名
+        return super(CompressedManifestStaticFilesStorage, self).stored_name(name)
+
+    def post_process(self, *args, **kwargs):
+        processed = super(CompressedManifestStaticFilesStorage, self).post_process(*args, **kwargs)
+        for post_processed in processed:
+            yield post_processed
+        if kwargs.get('dry_run'):
+            return
+        # 等所有文件的引用都替换完之后再压缩，hashed_files 里是最终的文件名
+        for name, hashed_name in self.hashed_files.items():
+            for path in (name, hashed_name):
+                if path.endswith(COMPRESS_EXTENSIONS):
+                    self.compress(path)
+
+    def compress(self, path):
+        with self.open(path) as f:
+            content = f.read()
+        compressors = [('.gz', gzip_compress)]
+        if brotli is not None:
+            compressors.append(('.br', brotli.compress))
+        for suffix, compressor in compressors:
+            compressed = compressor(content)
+            if self.exists(path + suffix):
+                self.delete(path + suffix)
+            if len(compressed) < len(content) * COMPRESS_MIN_RATIO:
+                self.save(path + suffix, ContentFile(compressed))
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware(object):
+    """从 STATIC_ROOT 提供 collectstatic 之后的静态文件，找不到的交给后面的视图"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.root = settings.STATIC_ROOT
+        self.hashed_names = None
+
+    def __call__(self, request):
+        if self.root and request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            response = self.serve(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def immutable(self, name):
+        if self.hashed_names is None:
+            self.hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return name in self.hashed_names
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        immutable = self.immutable(name)
+        if not immutable and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                                                    stat.st_mtime, stat.st_size):
+            return HttpResponseNotModified()
+
+        content_type, _ = mimetypes.guess_type(path)
+        encoding = None
+        accepted = accepted_encodings(request)
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(path + suffix):
+                encoding, path = coding, path + suffix
+                break
+
+        response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream')
+        response['Content-Length'] = os.path.getsize(path)
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if immutable:
+            response['Cache-Control'] = 'public, max-age={}, immutable'.format(IMMUTABLE_MAX_AGE)
+        else:
+            response['Cache-Control'] = 'public, max-age={}'.format(STATIC_MAX_AGE)
+        return response
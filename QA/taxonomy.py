@@ -0,0 +1,46 @@
+"""
+分类树缓存。
+
+节点、酷站这类分类数据很少变化，却在首页、侧栏等处频繁读取。
+每棵分类树用一两条查询整体载入，存成普通的列表和字典（不是查询集）放进缓存；
+后台保存或删除相关模型时，信号把版本号加一，下次读取时按新版本重新载入。
+版本号要在共享缓存里才对所有进程生效，另外缓存的树最多保存 TAXONOMY_TIMEOUT 秒，
+即使版本号没有传到（如直接改了数据库），过期内容也不会一直留着。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+
+TAXONOMY_TIMEOUT = getattr(settings, 'TAXONOMY_TIMEOUT', 300)
+
+
+class Taxonomy(object):
+    def __init__(self, name, loader, timeout=TAXONOMY_TIMEOUT):
+        self.name = name
+        self.loader = loader
+        self.timeout = timeout
+        self.version_key = '{}_version'.format(name)
+
+    def version(self):
+        return cache.get(self.version_key, 1)
+
+    def get(self):
+        key = '{}_{}'.format(self.name, self.version())
+        tree = cache.get(key)
+        if tree is None:
+            tree = self.loader()
+            cache.set(key, tree, self.timeout)
+        return tree
+
+    def bump(self, sender=None, **kwargs):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 2, None)    # 不存在时视为 1
+
+    def watch(self, *models):
+        """这些模型保存或删除时让缓存失效"""
+        for model in models:
+            uid = '{}_{}'.format(self.name, model.__name__)
+            post_save.connect(self.bump, sender=model, weak=False, dispatch_uid=uid)
+            post_delete.connect(self.bump, sender=model, weak=False, dispatch_uid=uid)
@@ -19,6 +19,8 @@ from django.contrib import admin
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^sites/', include('sites.urls', namespace='sites')),
+    url(r'^search/', include('search.urls', namespace='search')),
+    url(r'^api/v1/', include('question.api', namespace='api')),
     url(r'^', include('question.urls', namespace='question')),
     url(r'^', include('people.urls', namespace='user')),
 ]
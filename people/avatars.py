@@ -0,0 +1,145 @@
+"""
+头像存储。
+
+AVATAR_STORAGE 指定存储后端，Member.avatar 中保存的是后端自己的文件标识：
+- LocalAvatarStorage：保存在本地 AVATAR_ROOT，上传时按 AVATAR_SIZES 预先生成各个尺寸的缩略图，
+  文件名包含内容的哈希，由 serve 视图（或前端服务器）以长期缓存的响应头提供；
+- QiniuAvatarStorage：浏览器直接上传到七牛，七牛回调 upload_headimage。
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.utils.module_loading import import_string
+from django.views.static import serve as static_serve
+from PIL import Image
+
+AVATAR_STORAGE = getattr(settings, 'AVATAR_STORAGE', 'people.avatars.LocalAvatarStorage')
+AVATAR_ROOT = getattr(settings, 'AVATAR_ROOT', os.path.join(settings.BASE_DIR, 'media', 'avatars'))
+AVATAR_SIZES = getattr(settings, 'AVATAR_SIZES', (24, 48, 73, 120))
+AVATAR_MAX_SIZE = getattr(settings, 'AVATAR_MAX_SIZE', 300 * 1024)
+# 压缩率很高的图片文件很小，解码后却很大，在解码之前按图片头里的宽高拒绝
+AVATAR_MAX_DIMENSION = getattr(settings, 'AVATAR_MAX_DIMENSION', 4096)
+AVATAR_CACHE_MAX_AGE = 365 * 24 * 3600
+
+NAME_PATTERN = re.compile(r'^[0-9a-f]{20}$')
+
+
+class AvatarError(Exception):
+    pass
+
+
+class LocalAvatarStorage(object):
+    direct_upload = False
+
+    def save(self, upload):
+        """保存上传的图片，生成各尺寸缩略图，返回头像标识（内容哈希）"""
+        if upload.size > AVATAR_MAX_SIZE:
+            raise AvatarError('图片不能超过 {}KB'.format(AVATAR_MAX_SIZE // 1024))
+
+        content = upload.read()
+        name = hashlib.sha1(content).hexdigest()[:20]
+        try:
+            image = Image.open(io.BytesIO(content))
+        except Image.DecompressionBombError:
+            raise AvatarError('图片尺寸过大')
+        except (IOError, ValueError):
+            raise AvatarError('无法识别的图片')
+        if max(image.size) > AVATAR_MAX_DIMENSION:
+            raise AvatarError('图片的宽和高不能超过 {} 像素'.format(AVATAR_MAX_DIMENSION))
+        try:
+            image = image.convert('RGB')
+        except (IOError, ValueError):
+            raise AvatarError('无法识别的图片')
+
+        # 从中间裁成正方形
+        width, height = image.size
+        side = min(width, height)
+        left, top = (width - side) // 2, (height - side) // 2
+        image = image.crop((left, top, left + side, top + side))
+
+        os.makedirs(AVATAR_ROOT, exist_ok=True)
+        for size in AVATAR_SIZES:
+            path = os.path.join(AVATAR_ROOT, self.filename(name, size))
+            if not os.path.exists(path):
+                image.resize((size, size), Image.LANCZOS).save(path, 'JPEG', quality=90)
+        return name
+
+    def filename(self, name, size):
+        return '{}_{}.jpg'.format(name, size)
+
+    def url(self, name, size):
+        if not NAME_PATTERN.match(name):
+            return settings.QINIU_URL + name    # 切换到本地存储前上传到七牛的旧头像
+        # 取不小于所需尺寸的最小缩略图，浏览器按 width/height 缩放
+        size = int(size)
+        fit = min((s for s in AVATAR_SIZES if s >= size), default=max(AVATAR_SIZES))
+        return reverse('user:avatar', kwargs={'filename': self.filename(name, fit)})
+
+    def delete(self, name):
+        if not NAME_PATTERN.match(name or ''):
+            return False
+        for size in AVATAR_SIZES:
+            path = os.path.join(AVATAR_ROOT, self.filename(name, size))
+            if os.path.exists(path):
+                os.remove(path)
+        return True
+
+    def upload_form(self, user):
+        return {'action': reverse('user:upload_headimage'), 'fields': {}}
+
+
+class QiniuAvatarStorage(object):
+    direct_upload = True
+    bucket_name = 'avatar'
+
+    def auth(self):
+        from qiniu import Auth
+        return Auth(settings.AK, settings.SK)
+
+    def saved_name(self, request):
+        """七牛上传完成后回调带回的文件名"""
+        ret = json.loads(base64.urlsafe_b64decode(request.GET.get('upload_ret', '').encode('utf-8')))
+        if not ret or not ret.get('key'):
+            raise AvatarError('上传结果无效')
+        return ret['key']
+
+    def url(self, name, size):
+        return settings.QINIU_URL + name
+
+    def delete(self, name):
+        from qiniu import BucketManager
+        ret, info = BucketManager(self.auth()).delete(self.bucket_name, name)
+        return bool(ret)
+
+    def upload_form(self, user):
+        key_name = 'avatar/' + user.username
+        policy = {
+            'callbackUrl': settings.SITE_URL + reverse('user:upload_headimage'),
+            'callbackBody': 'filename=$(fname)&filesize=$(fsize)',
+            'mimeLimit': 'image/jpeg; image/png',
+        }
+        uptoken = self.auth().upload_token(self.bucket_name, key_name, 3600, policy)
+        return {'action': 'http://up-z0.qiniup.com', 'fields': {'key': key_name, 'token': uptoken}}
+
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = import_string(AVATAR_STORAGE)()
+    return _storage
+
+
+def serve(request, filename):
+    """提供本地头像文件；文件名带内容哈希，可以长期缓存"""
+    response = static_serve(request, filename, document_root=AVATAR_ROOT)
+    response['Cache-Control'] = 'public, max-age={}, immutable'.format(AVATAR_CACHE_MAX_AGE)
+    return response
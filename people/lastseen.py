@@ -0,0 +1,119 @@
+"""
+用户最近访问的时间和 IP。
+
+每次请求只更新缓存；IP 变化或距上次写库超过 LAST_SEEN_INTERVAL 秒时才把这个用户加入待写队列，
+队列攒够 LAST_SEEN_BATCH_SIZE 个用户或距上次写回超过 LAST_SEEN_FLUSH_INTERVAL 秒时，用一条 UPDATE 写回。
+写回在请求中进行，失败时只记日志，待写的记录留到下次。
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import Case, DateTimeField, GenericIPAddressField, Value, When
+from django.utils import timezone
+
+from QA.dbrouter import unpinned
+from people.models import Member
+
+LAST_SEEN_INTERVAL = getattr(settings, 'LAST_SEEN_INTERVAL', 300)
+LAST_SEEN_FLUSH_INTERVAL = getattr(settings, 'LAST_SEEN_FLUSH_INTERVAL', 60)
+LAST_SEEN_BATCH_SIZE = getattr(settings, 'LAST_SEEN_BATCH_SIZE', 100)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = {}       # user_id -> (ip, time)
+_last_flush = time.time()
+
+
+def _key(user_id):
+    return 'last_seen_{}'.format(user_id)
+
+
+def get_client_ip(request):
+    if 'HTTP_X_FORWARDED_FOR' in request.META:
+        return request.META['HTTP_X_FORWARDED_FOR'].split(',')[0].strip()
+    return request.META['REMOTE_ADDR']
+
+
+def touch(user, ip):
+    """记录一次访问"""
+    now = timezone.now()
+    seen = cache.get(_key(user.id))
+    if seen:
+        last_ip, last_time, written = seen
+    else:
+        last_ip, written = user.last_ip, user.last_seen
+
+    due = ip != last_ip or written is None or (now - written).total_seconds() >= LAST_SEEN_INTERVAL
+    if due:
+        written = now
+    cache.set(_key(user.id), (ip, now, written), LAST_SEEN_INTERVAL * 2)
+    if not due:
+        return
+
+    with _lock:
+        _pending[user.id] = (ip, now)
+        flush_due = (len(_pending) >= LAST_SEEN_BATCH_SIZE or
+                     time.time() - _last_flush >= LAST_SEEN_FLUSH_INTERVAL)
+    if flush_due:
+        try:
+            flush()
+        except DatabaseError:
+            logger.exception('写回访问记录失败，稍后重试')
+
+
+def get(user):
+    """返回 (ip, 时间)，优先取缓存里的最新值"""
+    seen = cache.get(_key(user.id))
+    if seen:
+        return seen[0], seen[1]
+    return user.last_ip, user.last_seen
+
+
+def flush():
+    """把待写的访问记录用一条 UPDATE 写回，返回写回的用户数"""
+    global _last_flush
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.time()
+    if not batch:
+        return 0
+
+    try:
+        with unpinned():
+            Member.objects.filter(id__in=list(batch)).update(
+                last_ip=Case(*[When(id=user_id, then=Value(ip)) for user_id, (ip, seen) in batch.items()],
+                             output_field=GenericIPAddressField()),
+                last_seen=Case(*[When(id=user_id, then=Value(seen)) for user_id, (ip, seen) in batch.items()],
+                               output_field=DateTimeField()),
+            )
+    except DatabaseError:
+        with _lock:
+            for user_id, value in batch.items():
+                _pending.setdefault(user_id, value)
+        raise
+    return len(batch)
+
+
+def reset():
+    """丢弃待写的访问记录，供测试在切换数据库前后调用"""
+    global _last_flush
+    with _lock:
+        _pending.clear()
+        _last_flush = time.time()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except DatabaseError:
+        logger.exception('进程退出时写回访问记录失败')
+
+
+atexit.register(_flush_at_exit)
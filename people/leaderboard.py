@@ -0,0 +1,67 @@
+"""
+用户活跃度排行榜。
+
+直接查数据库，按 (-au, id) 排序，由 member_au_rank_idx 索引支持，各操作的代价：
+- 前 N 名：一次索引范围扫描，读 N 行；
+- 名次：排在他前面的人数加一，一次只读索引的 COUNT，扫描的行数与名次成正比，不是 O(log n)；
+- 前后的用户：以他的 (au, id) 为边界各取 num 条，与 KeysetPaginator 的做法相同，外加一次上面的 COUNT；
+- 总人数：Member 全表 COUNT，缓存 LEADERBOARD_COUNT_SECONDS 秒。
+
+这里没有另外维护有序结构：进程内的有序表无法在多个 worker 之间保持一致，
+共享的有序集合（如 Redis 的 sorted set）需要引入新的服务。活跃度在发帖和回复时已经用 F() 原子地更新，
+所有进程读到的是同一份数据；论坛的用户数下名次的 COUNT 足够快，用户量大到不够用时再换成有序集合。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from people.models import Member
+
+LEADERBOARD_COUNT_SECONDS = getattr(settings, 'LEADERBOARD_COUNT_SECONDS', 300)
+
+COUNT_KEY = 'leaderboard_count'
+
+# 模板中显示用户名和头像用到的字段
+MEMBER_FIELDS = ('id', 'username', 'email', 'avatar', 'au')
+
+
+def _members():
+    return Member.objects.only(*MEMBER_FIELDS)
+
+
+def _ahead_of(au, user_id):
+    """排在 (au, user_id) 前面的用户"""
+    return Q(au__gt=au) | Q(au=au, id__lt=user_id)
+
+
+def _behind(au, user_id):
+    """排在 (au, user_id) 后面的用户"""
+    return Q(au__lt=au) | Q(au=au, id__gt=user_id)
+
+
+def top(num):
+    """前 num 名，[(名次, member)]"""
+    return [(i + 1, member) for i, member in enumerate(_members().order_by('-au', 'id')[:num])]
+
+
+def rank(member):
+    """member 的名次，从 1 开始"""
+    return Member.objects.filter(_ahead_of(member.au, member.id)).count() + 1
+
+
+def around(member, num=2):
+    """member 本人及前后各 num 名，[(名次, member)]"""
+    my_rank = rank(member)
+    above = list(_members().filter(_ahead_of(member.au, member.id)).order_by('au', '-id')[:num])
+    below = list(_members().filter(_behind(member.au, member.id)).order_by('-au', 'id')[:num])
+    members = above[::-1] + [member] + below
+    start = my_rank - len(above)
+    return [(start + i, m) for i, m in enumerate(members)]
+
+
+def count():
+    num = cache.get(COUNT_KEY)
+    if num is None:
+        num = Member.objects.count()
+        cache.set(COUNT_KEY, num, LEADERBOARD_COUNT_SECONDS)
+    return num
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from people import outbox
+
+
+class Command(BaseCommand):
+    help = '批量发送发件箱中到期的邮件；加 --loop 时作为常驻进程持续发送'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.OUTBOX_BATCH_SIZE,
+                            help='每批（每个 SMTP 连接）发送的邮件数')
+        parser.add_argument('--loop', action='store_true', help='发完后不退出，继续等待新邮件')
+        parser.add_argument('--interval', type=float, default=5, help='常驻时没有邮件可发的等待秒数')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = outbox.send_batch(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write('发送 {} 封，失败 {} 封'.format(total_sent, total_failed))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='fav_num',
+            field=models.IntegerField(default=0, verbose_name='收藏数'),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='following_num',
+            field=models.IntegerField(default=0, verbose_name='关注数'),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='unread_notice_num',
+            field=models.IntegerField(default=0, verbose_name='未读通知数'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:44
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0002_member_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='上次访问时间'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('people', '0003_member_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='follower_num',
+            field=models.IntegerField(default=0, verbose_name='粉丝数'),
+        ),
+    ]
@@ -3,6 +3,8 @@ import random
 import string
 
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.models import BaseUserManager, AbstractBaseUser, PermissionsMixin
 from django.utils import timezone
 
@@ -30,6 +32,20 @@ class MyUserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def incr_counter(self, user_ids, field, n=1):
+        """原子地增减计数字段，user_ids 可以是单个 id 或 id 列表"""
+        if not isinstance(user_ids, (list, tuple, set)):
+            user_ids = [user_ids]
+        return self.filter(id__in=user_ids).update(**{field: F(field) + n})
+
+    def incr_posts(self, user_id, topics=0, comments=0):
+        """发帖或回复后原子地更新帖子数、评论数和活跃度"""
+        return self.filter(id=user_id).update(
+            topic_num=F('topic_num') + topics,
+            comment_num=F('comment_num') + comments,
+            au=F('au') + topics * self.model.AU_PER_TOPIC + comments * self.model.AU_PER_COMMENT,
+        )
+
 
 class Member(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(verbose_name='邮箱', max_length=255, unique=True)
@@ -41,18 +57,33 @@ class Member(AbstractBaseUser, PermissionsMixin):
     avatar = models.CharField(verbose_name='头像', max_length=255, blank=True, null=True)
     au = models.IntegerField(verbose_name='用户活跃度', default=0)
     last_ip = models.GenericIPAddressField(verbose_name='上次访问IP', default='0.0.0.0')
+    last_seen = models.DateTimeField(verbose_name='上次访问时间', blank=True, null=True)
     email_verified = models.BooleanField(verbose_name='邮箱是否验证', default=False)
     date_joined = models.DateTimeField(verbose_name='用户注册时间', default=timezone.now)
     topic_num = models.IntegerField(verbose_name='帖子数', default=0)
     comment_num = models.IntegerField(verbose_name='评论数', default=0)
+    fav_num = models.IntegerField(verbose_name='收藏数', default=0)
+    following_num = models.IntegerField(verbose_name='关注数', default=0)
+    follower_num = models.IntegerField(verbose_name='粉丝数', default=0)
+    unread_notice_num = models.IntegerField(verbose_name='未读通知数', default=0)
+    feed_broadcast = models.BooleanField(verbose_name='动态是否读扩散', default=False)
     is_active = models.BooleanField(default=True, verbose_name='是否活跃')
     is_admin = models.BooleanField(default=False, verbose_name='是否是管理员')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    AU_PER_TOPIC = 5        # 每个主题计入的活跃度
+    AU_PER_COMMENT = 1      # 每条评论计入的活跃度
+
     objects = MyUserManager()
 
+    class Meta:
+        indexes = [
+            # 用户榜按 (-au, id) 排序和计算名次
+            models.Index(fields=['-au', 'id'], name='member_au_rank_idx'),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -76,7 +107,7 @@ class Member(AbstractBaseUser, PermissionsMixin):
         return self.is_admin
 
     def calculate_au(self):
-        self.au = self.topic_num * 5 + self.comment_num
+        self.au = self.topic_num * self.AU_PER_TOPIC + self.comment_num * self.AU_PER_COMMENT
         return self.au
 
     def is_email_verified(self):
@@ -97,6 +128,21 @@ class Follower(models.Model):
         return '{} following {}'.format(self.user_b, self.user_a)
 
 
+def follower_created(sender, **kwargs):
+    if kwargs.get('created', False):
+        Member.objects.incr_counter(kwargs['instance'].user_a_id, 'following_num')
+        Member.objects.incr_counter(kwargs['instance'].user_b_id, 'follower_num')
+
+
+def follower_deleted(sender, **kwargs):
+    Member.objects.incr_counter(kwargs['instance'].user_a_id, 'following_num', -1)
+    Member.objects.incr_counter(kwargs['instance'].user_b_id, 'follower_num', -1)
+
+
+post_save.connect(follower_created, sender=Follower)
+post_delete.connect(follower_deleted, sender=Follower)
+
+
 class EmailVerified(models.Model):
     """邮箱验证"""
     user = models.OneToOneField(Member)
@@ -139,3 +185,38 @@ class FindPassword(models.Model):
         date = '{}-{}-{}'.format(year, month, day)
         token = hashlib.md5((self.random_str() + date).encode('utf-8')).hexdigest()
         return token
+
+
+class OutgoingEmail(models.Model):
+    """待发送的邮件，由 send_outbox 命令批量发送"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, '待发送'),
+        (STATUS_SENT, '已发送'),
+        (STATUS_FAILED, '发送失败'),
+    )
+
+    subject = models.CharField(max_length=255, verbose_name='标题')
+    body = models.TextField(verbose_name='内容')
+    from_email = models.CharField(max_length=255, verbose_name='发件人')
+    to = models.TextField(verbose_name='收件人')     # 多个收件人以换行分隔
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='状态')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='尝试次数')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='下次发送时间')
+    last_error = models.TextField(blank=True, default='', verbose_name='最后一次错误')
+    created_on = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    sent_on = models.DateTimeField(blank=True, null=True, verbose_name='发送时间')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return '{}: {}'.format(self.to, self.subject)
+
+    @property
+    def recipients(self):
+        return self.to.split('\n')
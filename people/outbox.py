@@ -0,0 +1,88 @@
+"""
+邮件发件箱。
+
+视图只调用 enqueue() 把邮件写入 OutgoingEmail 表，不在请求中连接 SMTP 服务器；
+send_outbox 命令每批取出到期的邮件，复用同一个 SMTP 连接发送。
+发送失败的邮件按 OUTBOX_RETRY_DELAY * 2^(尝试次数-1) 秒退避重试，超过 OUTBOX_MAX_ATTEMPTS 次后标记为失败。
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from people.models import OutgoingEmail
+
+OUTBOX_BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 50)
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+OUTBOX_RETRY_DELAY = getattr(settings, 'OUTBOX_RETRY_DELAY', 60)
+OUTBOX_LEASE = 300      # 取出的一批邮件在这段时间内不会被其他发送进程取走
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(subject, message, from_email, recipient_list):
+    """参数与 send_mail 相同，返回 OutgoingEmail"""
+    return OutgoingEmail.objects.create(subject=subject, body=message, from_email=from_email,
+                                        to='\n'.join(recipient_list))
+
+
+def retry_delay(attempts):
+    return datetime.timedelta(seconds=OUTBOX_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def _claim(batch_size):
+    """取出一批到期的邮件，并把它们的下次发送时间推后，避免被其他进程重复发送"""
+    now = timezone.now()
+    lease_until = now + datetime.timedelta(seconds=OUTBOX_LEASE)
+    due = OutgoingEmail.objects.filter(status=OutgoingEmail.STATUS_PENDING, next_attempt_at__lte=now)
+    ids = list(due.order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    due.filter(id__in=ids).update(next_attempt_at=lease_until)
+    return list(OutgoingEmail.objects.filter(id__in=ids, next_attempt_at=lease_until).order_by('id'))
+
+
+def _failed(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= OUTBOX_MAX_ATTEMPTS:
+        email.status = OutgoingEmail.STATUS_FAILED
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    logger.warning('邮件 {} 第 {} 次发送失败：{}'.format(email.id, email.attempts, error))
+
+
+def send_batch(batch_size=OUTBOX_BATCH_SIZE):
+    """发送一批邮件，返回 (发送成功数, 失败数)；没有到期的邮件时返回 (0, 0)"""
+    emails = _claim(batch_size)
+    if not emails:
+        return 0, 0
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # 连不上服务器，这一批都按失败处理
+        for email in emails:
+            _failed(email, e)
+        return 0, len(emails)
+
+    sent_ids = []
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email, email.recipients,
+                                   connection=connection)
+            try:
+                message.send()
+            except Exception as e:
+                _failed(email, e)
+            else:
+                sent_ids.append(email.id)
+    finally:
+        connection.close()
+
+    OutgoingEmail.objects.filter(id__in=sent_ids).update(status=OutgoingEmail.STATUS_SENT, sent_on=timezone.now())
+    return len(sent_ids), len(emails) - len(sent_ids)
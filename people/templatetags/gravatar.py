@@ -1,34 +1,53 @@
+from functools import lru_cache
 from urllib import parse
 import hashlib
 
 from django import template
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.contrib.staticfiles.templatetags.staticfiles import static
+
+from people.avatars import get_storage
 
 GRAVATAR_URL_PREFIX = getattr(settings, 'GRAVATAR_URL_PREFIX', 'http://www.gravatar.com/')
 GRAVATAR_DEFAULT_IMAGE = getattr(settings, 'GRAVATAR_DEFAULT_IMAGE', '')
 GRAVATAR_DEFAULT_RATING = getattr(settings, 'GRAVATAR_DEFAULT_RATING', 'g')
 GRAVATAR_DEFAULT_SIZE = getattr(settings, 'GRAVATAR_DEFAULT_SIZE', 48)
-QINIU_URL = getattr(settings, 'QINIU_URL')
+GRAVATAR_CACHE_SIZE = getattr(settings, 'GRAVATAR_CACHE_SIZE', 4096)
+GRAVATAR_ENABLED = getattr(settings, 'GRAVATAR_ENABLED', True)
 
 User = get_user_model()
 register = template.Library()
 
 
-def get_user(user):
-    if not isinstance(user, User):
-        try:
-            User.objects.get(username=user)
-        except User.DoesNotExist:
-            raise Exception('用户未注册！')
-    return user.email
-
-
 def get_gravatar_id(email):
     email = email.encode()
     return hashlib.md5(email).hexdigest()
 
 
+@lru_cache(maxsize=GRAVATAR_CACHE_SIZE)
+def avatar_url(avatar, email, size):
+    """
+    头像地址。上传过头像的由头像存储给出地址，否则用 Gravatar，关闭 Gravatar 时用默认头像。
+    头像和邮箱都是缓存键的一部分，用户修改后自然取到新的地址，旧的条目被 LRU 淘汰。
+    """
+    if avatar:
+        return get_storage().url(avatar, size)
+    if not GRAVATAR_ENABLED:
+        return static('img/default.jpg')
+
+    gravatar_url = '{}avatar/{}'.format(GRAVATAR_URL_PREFIX, get_gravatar_id(email))
+    parameters = [p for p in (('d', GRAVATAR_DEFAULT_IMAGE), ('s', size), ('r', GRAVATAR_DEFAULT_RATING)) if p[1]]
+
+    if parameters:
+        gravatar_url += '?' + parse.urlencode(parameters, doseq=True)
+    return gravatar_url
+
+
+def _size(size):
+    return int(size or GRAVATAR_DEFAULT_SIZE)
+
+
 @register.simple_tag
 def gravatar(user, size=None):
     try:
@@ -41,19 +60,13 @@ def gravatar(user, size=None):
 
 @register.simple_tag
 def gravatar_url_for_user(user, size=None):
-    if user.avatar and user.avatar != '':
-        img = QINIU_URL + user.avatar
-        return img
-    else:
-        email = get_user(user)
-        return gravatar_url_for_email(email, size)
+    """user 必须是已经加载的用户对象（列表页用 select_related 取出作者），这里不再查询数据库"""
+    if not isinstance(user, User):
+        raise template.TemplateSyntaxError('gravatar_url_for_user 需要用户对象')
+    return avatar_url(user.avatar, user.email, _size(size))
 
 
 @register.simple_tag
 def gravatar_url_for_email(email, size=None):
-    gravatar_url = '{}avatar/{}'.format(GRAVATAR_URL_PREFIX, get_gravatar_id(email))
-    parameters = [p for p in (('d', GRAVATAR_DEFAULT_IMAGE), ('s', size or GRAVATAR_DEFAULT_SIZE), ('r', GRAVATAR_DEFAULT_RATING)) if p[1]]
+    return avatar_url(None, email, _size(size))
 
-    if parameters:
-        gravatar_url += '?' + parse.urlencode(parameters, doseq=True)
-    return gravatar_url
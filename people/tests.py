@@ -1,3 +1,410 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import struct
+import tempfile
+import warnings
+import zlib
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.template import Context, Template, TemplateSyntaxError
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from people import avatars, lastseen, leaderboard, outbox
+from people.models import Follower, Member, OutgoingEmail
+from people.templatetags import gravatar
+from question.models import Comment, FavoritedTopic, Notice
+from question.testing import PASSWORD, QueryBudgetMixin, seed_forum
+
+
+@override_settings(QUERY_STATS=False)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """用户相关页面的查询数预算；LargeSeedQueryBudgetTests 用几倍的数据再跑一遍，查询数随条目数增加时超出预算"""
+    SEED = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(**cls.SEED)
+
+    def login(self, user=None):
+        user = user or self.users[0]
+        self.client.login(username=user.email, password=PASSWORD)
+
+    def test_user_pages(self):
+        self.login()
+        uid = self.users[1].id
+        self.assertQueryBudget(6, reverse('user:user', kwargs={'uid': uid}))
+        self.assertQueryBudget(5, reverse('user:user_topics', kwargs={'uid': uid}))
+        self.assertQueryBudget(5, reverse('user:user_comments', kwargs={'uid': uid}))
+
+    def test_lists(self):
+        self.login()
+        self.assertQueryBudget(7, reverse('user:au_top'))
+        self.assertQueryBudget(3, reverse('user:following'))
+
+    def test_settings(self):
+        self.login()
+        self.assertQueryBudget(2, reverse('user:settings'))
+        self.assertQueryBudget(2, reverse('user:password'))
+
+    def test_password(self):
+        self.login()
+        data = {'old_password': PASSWORD, 'password1': 'new-password', 'password2': 'new-password'}
+        self.assertQueryBudget(5, reverse('user:password'), method='post', data=data, status_code=302)
+
+    def test_follow(self):
+        self.login(self.users[1])
+        uid = self.users[2].id
+        self.assertQueryBudget(6, reverse('user:follow', kwargs={'uid': uid}), method='post', status_code=302)
+        self.assertQueryBudget(8, reverse('user:unfollow', kwargs={'uid': uid}), method='post', status_code=302)
+
+    def test_register(self):
+        self.assertQueryBudget(0, reverse('user:register'))
+        data = {'username': 'newbie', 'email': 'newbie@example.com',
+                'password1': PASSWORD, 'password2': PASSWORD}
+        self.assertQueryBudget(15, reverse('user:register'), method='post', data=data, status_code=302)
+
+    def test_login(self):
+        self.assertQueryBudget(0, reverse('user:login'))
+        data = {'username': self.users[1].username, 'password': PASSWORD}
+        self.assertQueryBudget(12, reverse('user:login'), method='post', data=data, status_code=302)
+
+
+class LargeSeedQueryBudgetTests(QueryBudgetTests):
+    SEED = {'num_users': 6, 'num_topics': 60, 'num_comments': 60}
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException('服务器拒绝')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.user = Member.objects.create_user(email='a@example.com', username='a', password=PASSWORD)
+
+    def test_view_only_enqueues(self):
+        self.client.post(reverse('user:find_pass'), {'email': self.user.email})
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.recipients, [self.user.email])
+        self.assertEqual(email.status, OutgoingEmail.STATUS_PENDING)
+
+    def test_send_batches(self):
+        for i in range(5):
+            outbox.enqueue('标题 {}'.format(i), '内容', 'from@example.com', ['to{}@example.com'.format(i)])
+        call_command('send_outbox', batch_size=2, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].to, ['to0@example.com'])
+        self.assertFalse(OutgoingEmail.objects.exclude(status=OutgoingEmail.STATUS_SENT).exists())
+
+    @override_settings(EMAIL_BACKEND='people.tests.FailingBackend')
+    def test_retry_with_backoff(self):
+        email = outbox.enqueue('标题', '内容', 'from@example.com', ['to@example.com'])
+        with self.assertLogs('people.outbox', 'WARNING'):
+            self.assertEqual(outbox.send_batch(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.status, OutgoingEmail.STATUS_PENDING)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(outbox.send_batch(), (0, 0))   # 尚未到重试时间
+
+        OutgoingEmail.objects.update(attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        with self.assertLogs('people.outbox', 'WARNING'):
+            outbox.send_batch()
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.STATUS_FAILED)
+
+
+class AvatarTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        patcher = mock.patch('people.avatars.AVATAR_ROOT', self.root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = avatars.LocalAvatarStorage()
+        self.user = Member.objects.create_user('avatar', 'avatar@example.com', PASSWORD)
+        self.client.login(username='avatar@example.com', password=PASSWORD)
+
+    def test_url_picks_smallest_fitting_size(self):
+        name = 'a' * 20
+        self.assertTrue(self.storage.url(name, 24).endswith('/{}_24.jpg'.format(name)))
+        self.assertTrue(self.storage.url(name, 30).endswith('/{}_48.jpg'.format(name)))
+        self.assertTrue(self.storage.url(name, 500).endswith('/{}_120.jpg'.format(name)))
+
+    def test_serve_is_cached_forever(self):
+        with open(os.path.join(self.root, self.storage.filename('a' * 20, 48)), 'wb') as f:
+            f.write(b'jpeg')
+        response = self.client.get(self.storage.url('a' * 20, 48))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_upload_without_file(self):
+        self.client.post(reverse('user:upload_headimage'))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+
+    def test_upload_generates_sizes(self):
+        content = io.BytesIO()
+        avatars.Image.new('RGB', (200, 100), 'red').save(content, 'PNG')
+        content.seek(0)
+        content.name = 'avatar.png'
+        self.client.post(reverse('user:upload_headimage'), {'file': content})
+
+        self.user.refresh_from_db()
+        self.assertRegex(self.user.avatar, avatars.NAME_PATTERN)
+        for size in avatars.AVATAR_SIZES:
+            path = os.path.join(self.root, self.storage.filename(self.user.avatar, size))
+            self.assertEqual(avatars.Image.open(path).size, (size, size))
+
+        self.client.get(reverse('user:delete_headimage'))
+        self.assertEqual(os.listdir(self.root), [])
+
+    def png_header(self, width, height):
+        """只有文件头的 PNG：宽高很大，文件只有几十字节"""
+        def chunk(kind, data):
+            return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+        header = chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0))
+        content = io.BytesIO(b'\x89PNG\r\n\x1a\n' + header + chunk(b'IDAT', zlib.compress(b'')) + chunk(b'IEND', b''))
+        content.name = 'avatar.png'
+        return content
+
+    def test_upload_rejects_huge_images(self):
+        # 超过 Pillow 解压炸弹上限两倍的会直接报错，略低于两倍的只是警告，都不能进入解码
+        for side in (15000, 10000, avatars.AVATAR_MAX_DIMENSION + 1):
+            with mock.patch.object(avatars.Image.Image, 'convert') as convert, warnings.catch_warnings():
+                warnings.simplefilter('ignore', avatars.Image.DecompressionBombWarning)
+                response = self.client.post(reverse('user:upload_headimage'), {'file': self.png_header(side, side)})
+            self.assertEqual(response.status_code, 302)
+            self.assertFalse(convert.called)
+            self.user.refresh_from_db()
+            self.assertFalse(self.user.avatar)
+
+
+class LastSeenTests(TestCase):
+
+    def setUp(self):
+        self.users = [Member.objects.create_user(email='{}@example.com'.format(name), username=name,
+                                                 password=PASSWORD) for name in ('a', 'b', 'c')]
+        cache.clear()
+        lastseen.reset()
+        self.addCleanup(lastseen.reset)
+
+    def stored(self, user):
+        return Member.objects.values_list('last_ip', 'last_seen').get(id=user.id)
+
+    def test_first_visit_is_queued(self):
+        user = self.users[0]
+        lastseen.touch(user, '10.0.0.1')
+        self.assertEqual(lastseen.get(user)[0], '10.0.0.1')
+        self.assertEqual(self.stored(user), ('0.0.0.0', None))
+        self.assertEqual(lastseen.flush(), 1)
+        self.assertEqual(self.stored(user)[0], '10.0.0.1')
+
+    def test_interval(self):
+        user = self.users[0]
+        lastseen.touch(user, '10.0.0.1')
+        lastseen.flush()
+        # 间隔内同一 IP 的访问只更新缓存
+        lastseen.touch(user, '10.0.0.1')
+        self.assertEqual(lastseen.flush(), 0)
+
+        later = timezone.now() + timezone.timedelta(seconds=lastseen.LAST_SEEN_INTERVAL)
+        with mock.patch('people.lastseen.timezone.now', return_value=later):
+            lastseen.touch(user, '10.0.0.1')
+        self.assertEqual(lastseen.flush(), 1)
+        self.assertEqual(self.stored(user)[1], later)
+
+    def test_ip_change(self):
+        user = self.users[0]
+        lastseen.touch(user, '10.0.0.1')
+        lastseen.flush()
+        lastseen.touch(user, '10.0.0.2')
+        self.assertEqual(lastseen.flush(), 1)
+        self.assertEqual(self.stored(user)[0], '10.0.0.2')
+
+    @mock.patch('people.lastseen.LAST_SEEN_BATCH_SIZE', 3)
+    def test_batch_flush(self):
+        for i, user in enumerate(self.users[:2]):
+            lastseen.touch(user, '10.0.0.{}'.format(i))
+        self.assertEqual([self.stored(user)[0] for user in self.users], ['0.0.0.0'] * 3)
+        with self.assertNumQueries(1):
+            lastseen.touch(self.users[2], '10.0.0.2')
+        self.assertEqual([self.stored(user)[0] for user in self.users], ['10.0.0.0', '10.0.0.1', '10.0.0.2'])
+
+    @mock.patch('people.lastseen.LAST_SEEN_BATCH_SIZE', 1)
+    def test_failed_flush_is_logged(self):
+        user = self.users[0]
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=DatabaseError), \
+                self.assertLogs('people.lastseen', 'ERROR'):
+            lastseen.touch(user, '10.0.0.1')
+        self.assertEqual(lastseen.flush(), 1)
+        self.assertEqual(self.stored(user)[0], '10.0.0.1')
+
+
+class MemberCounterTests(TestCase):
+    """收藏数、关注数、粉丝数和未读通知数由信号维护，repair_counters 可以从原始数据重算"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_comments=3)
+
+    def counters(self, user, *fields):
+        return tuple(Member.objects.values_list(*fields).get(id=user.id))
+
+    def test_favorites(self):
+        user = self.users[1]
+        favorite = FavoritedTopic.objects.create(user=user, topic=self.topic)
+        self.assertEqual(self.counters(user, 'fav_num'), (1,))
+        favorite.delete()
+        self.assertEqual(self.counters(user, 'fav_num'), (0,))
+
+    def test_follow(self):
+        a, b = self.users[1], self.users[2]
+        before_a = self.counters(a, 'following_num', 'follower_num')
+        before_b = self.counters(b, 'following_num', 'follower_num')
+        follow = Follower.objects.create(user_a=a, user_b=b)
+        self.assertEqual(self.counters(a, 'following_num', 'follower_num'), (before_a[0] + 1, before_a[1]))
+        self.assertEqual(self.counters(b, 'following_num', 'follower_num'), (before_b[0], before_b[1] + 1))
+        follow.delete()
+        self.assertEqual(self.counters(a, 'following_num', 'follower_num'), before_a)
+        self.assertEqual(self.counters(b, 'following_num', 'follower_num'), before_b)
+
+    def test_unread_notices(self):
+        user = self.users[1]
+        Notice.objects.create(from_user=self.users[0], to_user=user, topic=self.topic, content='新回复')
+        Notice.objects.create(from_user=self.users[0], to_user=user, topic=self.topic, content='已读', is_readed=True)
+        self.assertEqual(self.counters(user, 'unread_notice_num'), (1,))
+
+    def test_sidebar_uses_loaded_user(self):
+        self.client.login(username=self.users[0].email, password=PASSWORD)
+        response = self.client.get(reverse('user:settings'))
+        user = Member.objects.get(id=self.users[0].id)
+        self.assertEqual(response.context['fav_count'], user.fav_num)
+        self.assertEqual(response.context['following_count'], user.following_num)
+        self.assertEqual(response.context['unread_notice_count'], user.unread_notice_num)
+
+    def test_repair_counters(self):
+        expected = {user.id: self.counters(user, 'fav_num', 'following_num', 'follower_num', 'unread_notice_num')
+                    for user in self.users}
+        self.assertEqual(expected[self.users[0].id], (2, 2, 0, 3))
+        Member.objects.update(fav_num=99, following_num=-1, follower_num=7, unread_notice_num=42)
+
+        call_command('repair_counters', stdout=StringIO())
+        for user in self.users:
+            self.assertEqual(self.counters(user, 'fav_num', 'following_num', 'follower_num', 'unread_notice_num'),
+                             expected[user.id])
+
+
+class LeaderboardTests(TestCase):
+    """用户榜按活跃度从高到低排列，活跃度相同时先注册的在前"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # 活跃度：u0=5, u1=20, u2=10, u3=10, u4=0, u5=10
+        cls.users = [Member.objects.create_user('u{}'.format(i), 'u{}@example.com'.format(i), PASSWORD)
+                     for i in range(6)]
+        for user, au in zip(cls.users, [5, 20, 10, 10, 0, 10]):
+            Member.objects.filter(id=user.id).update(au=au)
+        u = cls.users
+        cls.order = [u[1], u[2], u[3], u[5], u[0], u[4]]
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, ranked):
+        return [(rank, member.id) for rank, member in ranked]
+
+    def test_top(self):
+        self.assertEqual(self.ids(leaderboard.top(4)), [(i + 1, user.id) for i, user in enumerate(self.order[:4])])
+        self.assertEqual(len(leaderboard.top(20)), len(self.order))
+
+    def test_rank(self):
+        for i, user in enumerate(self.order):
+            self.assertEqual(leaderboard.rank(Member.objects.get(id=user.id)), i + 1)
+
+    def test_rank_follows_activity(self):
+        Member.objects.incr_posts(self.users[4].id, topics=5)
+        self.assertEqual(leaderboard.rank(Member.objects.get(id=self.users[4].id)), 1)
+        self.assertEqual(leaderboard.rank(Member.objects.get(id=self.users[1].id)), 2)
+
+    def test_around(self):
+        u = Member.objects.in_bulk([user.id for user in self.users])
+        u = [u[user.id] for user in self.users]
+        middle = leaderboard.around(u[3])
+        self.assertEqual(self.ids(middle), [(1, u[1].id), (2, u[2].id), (3, u[3].id), (4, u[5].id), (5, u[0].id)])
+        self.assertEqual([member.au for rank, member in middle], [20, 10, 10, 10, 5])
+        self.assertEqual(self.ids(leaderboard.around(u[1], num=1)), [(1, u[1].id), (2, u[2].id)])
+        self.assertEqual(self.ids(leaderboard.around(u[4], num=1)), [(5, u[0].id), (6, u[4].id)])
+
+    def test_count(self):
+        self.assertEqual(leaderboard.count(), len(self.users))
+        Member.objects.create_user('u6', 'u6@example.com', PASSWORD)
+        self.assertEqual(leaderboard.count(), len(self.users))     # 缓存中的总数
+        cache.clear()
+        self.assertEqual(leaderboard.count(), len(self.users) + 1)
+
+    def test_view(self):
+        self.client.login(username=self.users[3].email, password=PASSWORD)
+        response = self.client.get(reverse('user:au_top'))
+        self.assertEqual(response.context['au_list'], self.order)
+        self.assertEqual(response.context['my_rank'], 3)
+        self.assertEqual(response.context['user_count'], len(self.users))
+        self.assertContains(response, '第 3 名')
+
+
+class GravatarTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_comments=6)
+
+    def setUp(self):
+        gravatar.avatar_url.cache_clear()
+
+    def test_gravatar_url(self):
+        user = self.users[0]
+        url = gravatar.gravatar_url_for_user(user, 48)
+        prefix = gravatar.GRAVATAR_URL_PREFIX + 'avatar/' + gravatar.get_gravatar_id(user.email)
+        self.assertTrue(url.startswith(prefix))
+        self.assertIn('s=48', url)
+        self.assertEqual(gravatar.gravatar(user.email, 48), url)
+
+    def test_uploaded_avatar(self):
+        user = Member(email='x@example.com', username='x', avatar='0123456789abcdef0123')
+        self.assertEqual(gravatar.gravatar(user, 48),
+                         reverse('user:avatar', kwargs={'filename': '0123456789abcdef0123_48.jpg'}))
+
+    @mock.patch('people.templatetags.gravatar.GRAVATAR_ENABLED', False)
+    def test_disabled(self):
+        self.assertTrue(gravatar.gravatar(self.users[0], 48).endswith('img/default.jpg'))
+
+    def test_memoized(self):
+        user = self.users[0]
+        gravatar.gravatar(user, 48)
+        gravatar.gravatar(user, 48)
+        self.assertEqual(gravatar.avatar_url.cache_info().hits, 1)
+
+    def test_list_rendering_runs_no_queries(self):
+        comments = list(Comment.objects.filter(topic=self.topic).select_related('author'))
+        template = Template('{% load gravatar %}{% for c in comments %}{% gravatar c.author 48 %} {% endfor %}')
+        with self.assertNumQueries(0):
+            html = template.render(Context({'comments': comments}))
+        self.assertEqual(len(html.split()), len(comments))
+
+    def test_username_is_not_looked_up(self):
+        with self.assertRaises(TemplateSyntaxError):
+            gravatar.gravatar_url_for_user(self.users[0].username)
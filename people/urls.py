@@ -1,4 +1,5 @@
 from django.conf.urls import url
+from people import avatars
 from people.views import follower, handle, setting
 from question import views as question_views
 
@@ -30,4 +31,5 @@ urlpatterns = [
 
     url(r'^settings/upload_headimage/$', setting.upload_headimage, name='upload_headimage'),
     url(r'^settings/delete_headimage/$', setting.delete_headimage, name='delete_headimage'),
+    url(r'^avatars/(?P<filename>[0-9a-f]+_\d+\.jpg)$', avatars.serve, name='avatar'),
 ]
@@ -1,6 +1,7 @@
 from .handle import *
 from .setting import *
 from .follower import *
+from people import lastseen
 
 
 class MyMiddleware(object):
@@ -8,16 +9,11 @@ class MyMiddleware(object):
         self.get_response = get_response
 
     def __call__(self, request):
+        self.process_request(request)
         response = self.get_response(request)
         return response
 
     def process_request(self, request):
-        if 'HTTP_X_FORWARDED_FOR' in request.META:
-            ip = request.META['HTTP_X_FORWARDED_FOR']
-        else:
-            ip = request.META['REMOTE_ADDR']
-
         if request.user.is_authenticated():
-            request.user.last_ip = ip
-            request.user.save()
+            lastseen.touch(request.user, lastseen.get_client_ip(request))
         return None
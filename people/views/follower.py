@@ -53,5 +53,5 @@ def unfollow(request, uid):
 
 @login_required
 def following(request):
-    following_list = Follower.objects.filter(user_a=request.user).all()
+    following_list = Follower.objects.filter(user_a=request.user).select_related('user_b')
     return render(request, 'people/following.html', locals())
@@ -6,15 +6,15 @@ from django.core.urlresolvers import reverse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.core.cache import cache
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from django.core.mail import send_mail
 from django.contrib.auth import logout as auth_logout, authenticate, login as auth_login
 
+from QA.dbrouter import replica_reads
 from QA.settings import NUM_COMMENT_PAGE, NUM_TOPIC_PAGE, SITE_URL, FROM_EMAIL
 from people.models import Member, Follower, EmailVerified as Email, FindPassword
 from question.models import Topic, Comment
+from question.paginator import paginate
 from people.forms import RegisterForm, LoginForm
+from people import lastseen, leaderboard, outbox
 
 
 @csrf_protect
@@ -36,7 +36,7 @@ def register(request):
                 SITE_URL,
                 reverse('user:email_verified',kwargs={'uid': new_user.id, 'token': email_verified.token})
             )
-            send_mail('欢迎加入', msg, FROM_EMAIL, [data['email']])
+            outbox.enqueue('欢迎加入', msg, FROM_EMAIL, [data['email']])
             messages.success(request, '注册成功，请去你的邮箱进行验证！')
 
             user = authenticate(email=data['email'], password=data['password2'])
@@ -90,21 +90,21 @@ def logout(request):
     return redirect(reverse('question:index'))
 
 
+@replica_reads
 def au_top(request):
     """用户榜"""
-    au_list = cache.get('au_top_list')
-    if not au_list:
-        au_list = Member.objects.order_by('-au')[:20]
-        cache.set('au_top_list', au_list, 60)
-
-    user_count = cache.get('user_count')
-    if not user_count:
-        user_count = Member.objects.all().count()
-        cache.set('user_count', user_count, 60)
+    au_list = [member for rank, member in leaderboard.top(20)]
+    neighbour_list = []
+    my_rank = None
+    if request.user.is_authenticated():
+        neighbour_list = [(rank, member, member.au) for rank, member in leaderboard.around(request.user)]
+        my_rank = next((rank for rank, member, au in neighbour_list if member.id == request.user.id), None)
+    user_count = leaderboard.count()
 
     return render(request, 'people/au_top.html', locals())
 
 
+@replica_reads
 def user(request, uid):
     try:
         user_from_id = Member.objects.get(pk=uid)
@@ -118,47 +118,38 @@ def user(request, uid):
         except Follower.DoesNotExist:
             follower = None     # 没有关注
 
-        topic_list = Topic.objects.filter(author_id=uid).order_by('-created_on')[:NUM_TOPIC_PAGE]
-        comment_list = Comment.objects.filter(author_id=uid).order_by('-created_on')[:NUM_COMMENT_PAGE]
+        last_ip, last_seen = lastseen.get(user_from_id)
+        topic_list = Topic.objects.filter(author_id=uid).select_related('author', 'node', 'last_reply')\
+            .order_by('-created_on')[:NUM_TOPIC_PAGE]
+        comment_list = Comment.objects.filter(author_id=uid).select_related('topic')\
+            .order_by('-created_on')[:NUM_COMMENT_PAGE]
         return render(request, 'people/user.html', locals())
     else:
         return redirect(reverse('question:index'))
 
 
+@replica_reads
 def user_topics(request, uid):
     try:
         this_user = Member.objects.get(pk=uid)
     except Member.DoesNotExist:
         raise Http404
 
-    topic_list = Topic.objects.filter(author_id=uid).order_by('-created_on')
-    paginator = Paginator(topic_list, NUM_TOPIC_PAGE)
-    page = request.GET.get('page', 1)
-    try:
-        topic_list = paginator.page(page)
-    except PageNotAnInteger:
-        topic_list = paginator.page(1)
-    except EmptyPage:
-        topic_list = paginator.page(paginator.num_pages)
+    topics = Topic.objects.filter(author_id=uid).select_related('author', 'node', 'last_reply')
+    topic_list = paginate(request, topics, NUM_TOPIC_PAGE, count=this_user.topic_num)
 
     return render(request, 'people/user_topics.html', locals())
 
 
+@replica_reads
 def user_comments(request, uid):
     try:
         this_user = Member.objects.get(pk=uid)
     except Member.DoesNotExist:
         raise Http404
 
-    comment_list = Comment.objects.filter(author_id=uid).order_by('-created_on')
-    paginator = Paginator(comment_list, NUM_COMMENT_PAGE)
-    page = request.GET.get('page', 1)
-    try:
-        comment_list = paginator.page(page)
-    except PageNotAnInteger:
-        comment_list = paginator.page(1)
-    except EmptyPage:
-        comment_list = paginator.page(paginator.num_pages)
+    comment_list = paginate(request, Comment.objects.filter(author_id=uid).select_related('topic'), NUM_COMMENT_PAGE,
+                            count=this_user.comment_num)
 
     return render(request, 'people/user_comments.html', locals())
 
@@ -192,7 +183,7 @@ def send_verified_email(request):
                 SITE_URL,
                 reverse('user:email_verified', kwargs={'uid': user.id, 'token': email.token})
             )
-            send_mail('欢迎加入！', msg, FROM_EMAIL, [user.email])
+            outbox.enqueue('欢迎加入！', msg, FROM_EMAIL, [user.email])
             messages.success(request, '邮件已发送，请去邮箱验证！')
     return redirect(reverse('user:settings'))
 
@@ -243,7 +234,7 @@ def find_password(request):
             SITE_URL,
             reverse('user:first_reset_password', kwargs={'uid': user.id, 'token': find_pass.token})
         )
-        send_mail('重置密码', msg, FROM_EMAIL, [email])
+        outbox.enqueue('重置密码', msg, FROM_EMAIL, [email])
         messages.success(request, '密码找回邮件已发送！')
     return redirect(reverse('question:index'))
 
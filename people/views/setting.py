@@ -1,23 +1,13 @@
-import base64
-import json
-
-from django.shortcuts import render, redirect, Http404
+from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_protect
 from django.contrib.auth import logout as auth_logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from QA import settings
+from people.avatars import AvatarError, get_storage
 from people.forms import ProfileForm, PasswordChangeForm
 from people.models import Member
-
-from qiniu import Auth
-import qiniu.config
-from qiniu import BucketManager
-
-SITE_URL = getattr(settings, 'SITE_URL')
-AK = settings.AK
-SK = settings.SK
+from question import pagecache
 
 
 @csrf_protect
@@ -30,48 +20,47 @@ def profile(request):
         if form.is_valid():
             form.save(commit=True)
             messages.success(request, '设置成功！')
-            return render(request, 'people/settings.html', {'form': form})
     else:
         form = ProfileForm(instance=user)
-    q = Auth(AK, SK)
-    buket_name = 'avatar'
-    key_name = 'avatar/' + user.username
-    callbackBody = 'filename=$(fname)&filesize=$(fsize)'
-    callbackUrl = SITE_URL + reverse('user:upload_headimage')
-    mimeLimit = 'image/jpeg; image/png'
-    policy = {
-        'callbackUrl': callbackUrl,
-        'callbackBody': callbackBody,
-        'mimeLimit': mimeLimit,
-    }
-    uptoken = q.upload_token(buket_name, key_name, 3600, policy)
-    return render(request, 'people/settings.html', {'form': form, 'user': user, 'uptoken': uptoken})
+    storage = get_storage()
+    return render(request, 'people/settings.html', {'form': form, 'user': user, 'upload': storage.upload_form(user),
+                                                    'direct_upload': storage.direct_upload})
 
 
 @csrf_protect
 @login_required
 def upload_headimage(request):
-    """上传头像"""
-    print(request, ' 11111111')
+    """上传头像：本地存储时接收表单上传的文件，七牛存储时处理七牛的回调"""
     if request.method == 'POST':
-        print(request, '1212111112')
+        storage = get_storage()
+        user = request.user
         try:
-            retstr = request.GET.get('upload_ret')
-            print(retstr, '=-=-==-=')
-            retstr = retstr.encode('utf-8')
-            dec = base64.urlsafe_b64decode(retstr)
-            ret = json.loads(dec)
-            if ret and ret['key']:
-                request.user.avatar = ret['key']
-                request.user.save()
+            if storage.direct_upload:
+                avatar = storage.saved_name(request)
+            elif 'file' in request.FILES:
+                avatar = storage.save(request.FILES['file'])
             else:
-                raise Http404
-            messages.success(request, '头像上传成功！')
-        except:
+                raise AvatarError('请选择一张图片')
+        except AvatarError as e:
+            messages.error(request, '头像上传失败：{}'.format(e))
+        except (KeyError, ValueError):
             messages.error(request, '头像上传失败！')
+        else:
+            old, user.avatar = user.avatar, avatar
+            user.save(update_fields=['avatar'])
+            if old and old != avatar and not storage.direct_upload:
+                _delete_unused(storage, old)
+            messages.success(request, '头像上传成功！')
     return redirect(reverse('user:settings'))
 
 
+def _delete_unused(storage, avatar):
+    # 缓存的页面里还引用着旧头像的地址；本地头像按内容命名，相同的图片可能被多个用户使用
+    pagecache.invalidate_all()
+    if not Member.objects.filter(avatar=avatar).exists():
+        storage.delete(avatar)
+
+
 @csrf_protect
 @login_required
 def delete_headimage(request):
@@ -79,17 +68,19 @@ def delete_headimage(request):
     user = request.user
     if not user.avatar:
         messages.error(request, '你还没有上传头像！')
-    else:
-        q = Auth(AK, SK)
-        buket = BucketManager(q)
-        buket_name = 'avatar'
-        ret, info = buket.delete(buket_name, user.avatar)
-        if ret:
-            user.avatar = ''
-            user.save()
-            messages.success(request, '头像删除成功！')
-        else:
-            messages.error(request, '头像删除失败！')
+        return redirect(reverse('user:settings'))
+
+    storage = get_storage()
+    avatar = user.avatar
+    if storage.direct_upload and not storage.delete(avatar):
+        messages.error(request, '头像删除失败！')
+        return redirect(reverse('user:settings'))
+
+    user.avatar = ''
+    user.save(update_fields=['avatar'])
+    if not storage.direct_upload:
+        _delete_unused(storage, avatar)
+    messages.success(request, '头像删除成功！')
     return redirect(reverse('user:settings'))
 
 
@@ -1,12 +1,20 @@
 from django.contrib import admin
 from question.models import *
+from search import indexer
 
 
 class TopicAdmin(admin.ModelAdmin):
     list_display = ['id', 'title', 'node', 'author', 'num_views', 'num_comments', 'created_on', 'updated_on']
-    search_fields = ['id', 'title', 'node']
+    search_fields = ['title']
     list_filter = ['node__name']
 
+    def get_search_results(self, request, queryset, search_term):
+        """使用全文索引搜索，不做 LIKE 扫描"""
+        if not search_term:
+            return queryset, False
+        topic_ids = [topic_id for topic_id, hits, score in indexer.search(search_term)]
+        return queryset.filter(id__in=topic_ids), False
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ['id', 'topic', 'author', 'content', 'created_on']
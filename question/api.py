@@ -0,0 +1,187 @@
+"""
+只读 JSON API（v1），供移动客户端使用。
+
+- nodes/                        节点分类树
+- topics/?node=<slug>           主题列表，新的在前
+- topics/<id>/                  主题详情
+- topics/<id>/comments/         评论，按楼层顺序
+
+只输出客户端需要的字段，列表用游标分页（after 参数，响应中的 next 为下一页的游标）。
+每个资源都有强 ETag：主题和评论取自主题的 updated_on、评论数和渲染版本，
+主题列表取自整页缓存的全站或节点版本号（发帖、回复、编辑、删除时加一，见 pagecache），节点树取自缓存内容的哈希。
+输出中带有用户名，用户改名时更新缓存中的 authors 版本号，三种 ETag 都包含它。
+客户端带 If-None-Match 轮询时，内容没变的主题列表只读缓存，主题和评论只需一次主键查询就返回 304，不做序列化。
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.conf.urls import url
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_http_methods
+
+from QA.dbrouter import replica_reads
+from people.models import Member
+from question import pagecache
+from question.models import Comment, Topic
+from question.paginator import InvalidCursor, KeysetPaginator
+from question.render import RENDER_VERSION
+from question.taxonomy import node_tree
+
+API_PAGE_SIZE = getattr(settings, 'API_PAGE_SIZE', 20)
+API_VERSION = 'v1'
+
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+AUTHORS_VERSION_KEY = 'api_authors_version'
+
+TOPIC_FIELDS = ('id', 'title', 'num_comments', 'created_on', 'updated_on', 'node', 'author', 'last_reply',
+                'node__name', 'node__slug', 'author__username', 'last_reply__username')
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params=JSON_PARAMS)
+
+
+def _not_found():
+    return _json({'detail': '不存在'}, status=404)
+
+
+def _time(value):
+    return value.isoformat() if value else None
+
+
+def authors_version():
+    """用户名的版本号；缓存被清空后换一个新值，客户端重新取一次即可"""
+    version = cache.get(AUTHORS_VERSION_KEY)
+    if version is None:
+        cache.add(AUTHORS_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(AUTHORS_VERSION_KEY, 0)
+    return version
+
+
+def _etag(*parts):
+    return '-'.join([API_VERSION] + [str(part) for part in parts])
+
+
+def _serialize_topic(topic):
+    return {
+        'id': topic.id,
+        'title': topic.title,
+        'node': {'name': topic.node.name, 'slug': topic.node.slug},
+        'author': {'id': topic.author_id, 'username': topic.author.username},
+        'last_reply': topic.last_reply.username if topic.last_reply_id else None,
+        'num_comments': topic.num_comments,
+        'created_on': _time(topic.created_on),
+        'updated_on': _time(topic.updated_on),
+    }
+
+
+def _serialize_comment(comment):
+    return {
+        'id': comment.id,
+        'author': {'id': comment.author_id, 'username': comment.author.username},
+        'content_html': comment.rendered_content,
+        'created_on': _time(comment.created_on),
+    }
+
+
+def _page(request, queryset, serialize, descending):
+    """一页结果和下一页的游标；游标无效时返回 None"""
+    paginator = KeysetPaginator(queryset, API_PAGE_SIZE, request.GET, descending=descending)
+    try:
+        page = paginator.page(after=request.GET.get('after'))
+    except InvalidCursor:
+        return None
+    return {
+        'results': [serialize(obj) for obj in page],
+        'next': paginator.cursor_for(page[-1], page.end_index()) if page.has_next() else None,
+    }
+
+
+def _topic_queryset(request):
+    topics = Topic.objects.all()
+    node_slug = request.GET.get('node')
+    if node_slug:
+        topics = topics.filter(node__slug=node_slug)
+    return topics
+
+
+def nodes_etag(request):
+    tree = json.dumps(node_tree.get(), sort_keys=True).encode('utf-8')
+    return _etag(hashlib.md5(tree).hexdigest())
+
+
+def topics_etag(request):
+    return _etag(pagecache.list_version(request.GET.get('node') or None), authors_version())
+
+
+def topic_etag(request, topic_id):
+    row = Topic.objects.filter(id=topic_id).values_list('updated_on', 'num_comments', 'render_version').first()
+    if row is None:
+        return None
+    updated_on, num_comments, render_version = row
+    return _etag(topic_id, updated_on.timestamp() if updated_on else 0, num_comments,
+                 render_version, RENDER_VERSION, authors_version())
+
+
+@require_http_methods(['GET', 'HEAD'])
+@condition(etag_func=nodes_etag)
+def nodes(request):
+    return _json({'results': node_tree.get()})
+
+
+@require_http_methods(['GET', 'HEAD'])
+@replica_reads
+@condition(etag_func=topics_etag)
+def topics(request):
+    topics = _topic_queryset(request).select_related('node', 'author', 'last_reply').only(*TOPIC_FIELDS)
+    data = _page(request, topics, _serialize_topic, descending=True)
+    if data is None:
+        return _json({'detail': '游标无效'}, status=400)
+    return _json(data)
+
+
+@require_http_methods(['GET', 'HEAD'])
+@condition(etag_func=topic_etag)
+def topic(request, topic_id):
+    topic = Topic.objects.select_related('node', 'author', 'last_reply')\
+        .only('content', 'content_html', 'render_version', *TOPIC_FIELDS).filter(id=topic_id).first()
+    if topic is None:
+        return _not_found()
+    data = _serialize_topic(topic)
+    data['content_html'] = topic.rendered_content
+    return _json(data)
+
+
+@require_http_methods(['GET', 'HEAD'])
+@condition(etag_func=topic_etag)
+def comments(request, topic_id):
+    if not Topic.objects.filter(id=topic_id).exists():
+        return _not_found()
+    comments = Comment.objects.filter(topic_id=topic_id).select_related('author')\
+        .only('id', 'content', 'content_html', 'render_version', 'created_on', 'author', 'author__username')
+    data = _page(request, comments, _serialize_comment, descending=False)
+    if data is None:
+        return _json({'detail': '游标无效'}, status=400)
+    return _json(data)
+
+
+def member_saved(sender, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if not kwargs.get('created', False) and (update_fields is None or 'username' in update_fields):
+        cache.delete(AUTHORS_VERSION_KEY)
+
+
+post_save.connect(member_saved, sender=Member)
+
+
+urlpatterns = [
+    url(r'^nodes/$', nodes, name='nodes'),
+    url(r'^topics/$', topics, name='topics'),
+    url(r'^topics/(?P<topic_id>\d+)/$', topic, name='topic'),
+    url(r'^topics/(?P<topic_id>\d+)/comments/$', comments, name='comments'),
+]
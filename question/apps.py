@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class QuestionConfig(AppConfig):
     name = 'question'
+
+    def ready(self):
+        from question import api, checks, events, feed, hot, taxonomy    # noqa 注册信号和部署检查
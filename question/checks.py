@@ -0,0 +1,25 @@
+"""
+部署检查。
+
+整页缓存、分类树和计数都用缓存里的版本号做失效，版本号只有在共享缓存里才对所有 worker 进程可见；
+进程内的缓存会让别的进程长时间返回过期页面。
+"""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in LOCAL_CACHE_BACKENDS:
+        return [Error(
+            '默认缓存 {} 不在进程之间共享'.format(backend),
+            hint='在 CACHES 中配置 memcached 或 redis 等共享缓存',
+            id='question.E001',
+        )]
+    return []
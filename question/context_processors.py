@@ -0,0 +1,10 @@
+def sidebar_counts(request):
+    """侧边栏的收藏数、关注数和未读通知数，直接取自已经加载的用户行，不再单独查询"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated():
+        return {}
+    return {
+        'fav_count': user.fav_num,
+        'following_count': user.following_num,
+        'unread_notice_count': user.unread_notice_num,
+    }
@@ -0,0 +1,151 @@
+"""
+未读通知数和新回复的服务器推送（Server-Sent Events），用短时的长轮询实现。
+
+写入评论和通知的地方在事务提交后调用 comment_added / unread_changed，
+通过进程内的发布订阅唤醒订阅了对应频道的连接，连接被唤醒后查一次数据库再把变化推给浏览器。
+每个连接开始时先查一次数据库，有变化立即返回；没有就最多等 EVENTS_STREAM_TIMEOUT 秒，
+然后结束，由浏览器在 EVENTS_RETRY 毫秒后重连。别的进程写入的变化在下次重连时查到，
+因此多进程部署不需要轮询，也不需要共享的消息队列。
+事件 id 记录"最后一条评论 id-未读数"，浏览器重连时通过 Last-Event-ID 带回，没有变化就不重复推送。
+
+部署要求：等待期间连接占用一个 worker 线程。同步 worker（如 gunicorn 默认的 sync）会被这些连接占满，
+应使用多线程或协程 worker（gunicorn --worker-class gthread / gevent），
+或者由前端服务器把 /events/ 转发到单独的一组进程。推送只在主题页和通知页为登录用户打开。
+"""
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from people.models import Member
+from question.models import Comment, Notice
+
+EVENTS_STREAM_TIMEOUT = getattr(settings, 'EVENTS_STREAM_TIMEOUT', 5)
+EVENTS_RETRY = getattr(settings, 'EVENTS_RETRY', 15000)
+
+_lock = threading.Lock()
+_subscribers = defaultdict(set)     # 频道 -> {threading.Event}
+
+
+def user_channel(user_id):
+    return 'user:{}'.format(user_id)
+
+
+def topic_channel(topic_id):
+    return 'topic:{}'.format(topic_id)
+
+
+def subscribe(channels):
+    event = threading.Event()
+    with _lock:
+        for channel in channels:
+            _subscribers[channel].add(event)
+    return event
+
+
+def unsubscribe(event, channels):
+    with _lock:
+        for channel in channels:
+            _subscribers[channel].discard(event)
+            if not _subscribers[channel]:
+                del _subscribers[channel]
+
+
+def publish(*channels):
+    with _lock:
+        events = set().union(*(_subscribers.get(channel, ()) for channel in channels))
+    for event in events:
+        event.set()
+
+
+def comment_added(topic_id):
+    transaction.on_commit(lambda: publish(topic_channel(topic_id)))
+
+
+def unread_changed(*user_ids):
+    transaction.on_commit(lambda: publish(*[user_channel(user_id) for user_id in user_ids]))
+
+
+def format_event(name, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append('id: {}'.format(event_id))
+    lines.append('event: {}'.format(name))
+    lines.append('data: {}'.format(json.dumps(data, ensure_ascii=False)))
+    return '\n'.join(lines) + '\n\n'
+
+
+def parse_event_id(value):
+    """Last-Event-ID 解析为 (最后一条评论 id, 未读数)，缺少的部分为 None"""
+    comment_id, _, unread = (value or '').partition('-')
+    return (int(comment_id) if comment_id.isdigit() else None,
+            int(unread) if unread.isdigit() else None)
+
+
+class Stream(object):
+    """登录用户的一次连接：推送未读数，topic_id 不为空时同时推送这个主题的新回复"""
+
+    def __init__(self, user_id, topic_id=None, last_event_id=None):
+        self.user_id = user_id
+        self.topic_id = topic_id
+        self.last_comment_id, self.unread = parse_event_id(last_event_id)
+        self.channels = [user_channel(user_id)]
+        if topic_id:
+            self.channels.append(topic_channel(topic_id))
+
+    def event_id(self):
+        return '{}-{}'.format(self.last_comment_id or 0, self.unread)
+
+    def changes(self):
+        """与上次相比的变化，返回要发送的事件"""
+        events = []
+        unread = Member.objects.filter(id=self.user_id).values_list('unread_notice_num', flat=True).first()
+        if unread is not None and unread != self.unread:
+            self.unread = unread
+            events.append(('unread', {'count': unread}))
+        if self.topic_id:
+            comments = Comment.objects.filter(topic_id=self.topic_id)
+            if self.last_comment_id is None:
+                # 刚打开页面时从最新的一条开始，之前的回复已经在页面上了
+                self.last_comment_id = comments.order_by('-id').values_list('id', flat=True).first() or 0
+            else:
+                new = list(comments.filter(id__gt=self.last_comment_id).order_by('id')
+                           .values_list('id', 'author__username'))
+                if new:
+                    self.last_comment_id = new[-1][0]
+                    events.append(('comment', {
+                        'count': len(new),
+                        'authors': list(dict.fromkeys(username for comment_id, username in new)),
+                    }))
+        return [format_event(name, data, event_id=self.event_id()) for name, data in events]
+
+    def __iter__(self):
+        event = subscribe(self.channels)
+        try:
+            yield 'retry: {}\n\n'.format(EVENTS_RETRY)
+            messages = self.changes()
+            if not messages and event.wait(EVENTS_STREAM_TIMEOUT):
+                messages = self.changes()
+            for message in messages:
+                yield message
+        finally:
+            unsubscribe(event, self.channels)
+
+
+def comment_saved(sender, **kwargs):
+    comment = kwargs.get('instance', None)
+    if comment and kwargs.get('created', False):
+        comment_added(comment.topic_id)
+
+
+def notice_saved(sender, **kwargs):
+    notice = kwargs.get('instance', None)
+    if notice:
+        unread_changed(notice.to_user_id)
+
+
+post_save.connect(comment_saved, sender=Comment)
+post_save.connect(notice_saved, sender=Notice)
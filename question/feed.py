@@ -0,0 +1,66 @@
+"""
+关注动态。
+
+普通用户发帖或回复时，给每个粉丝写一行 Timeline（写扩散），读取时按 (user, time, id) 索引做一次范围查询。
+粉丝数超过 FEED_FANOUT_LIMIT 的用户只写一行 user 为空的记录（读扩散），并把 feed_broadcast 标为 True，
+一次发帖不会写入成千上万行。粉丝读取时对关注的每个 feed_broadcast 用户再按 (actor, time, id) 索引
+各做一次只取一页的范围查询，由分页器在内存中合并；不用 OR 把它们拼成一条查询，
+那样没有索引能同时满足条件和排序，数据库要把热门用户的全部记录排序之后才能取出一页。
+feed_broadcast 不会被清除：粉丝数降回限额以下后新的动态重新写扩散，以前那些 user 为空的记录仍然会被合并。
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete
+
+from people.models import Follower, Member
+from question.models import Timeline
+from question.paginator import paginate
+
+FEED_FANOUT_LIMIT = getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+NUM_TIMELINE_PAGE = getattr(settings, 'NUM_TIMELINE_PAGE', settings.NUM_TOPIC_PAGE)
+
+
+def _publish(actor, topic, comment, time):
+    if actor.follower_num > FEED_FANOUT_LIMIT:
+        if not actor.feed_broadcast:
+            Member.objects.filter(id=actor.id).update(feed_broadcast=True)
+            actor.feed_broadcast = True
+        Timeline.objects.create(user=None, actor=actor, topic=topic, comment=comment, time=time)
+        return 1
+
+    follower_ids = list(Follower.objects.filter(user_b=actor).values_list('user_a', flat=True))
+    Timeline.objects.bulk_create([
+        Timeline(user_id=user_id, actor=actor, topic=topic, comment=comment, time=time)
+        for user_id in follower_ids
+    ])
+    return len(follower_ids)
+
+
+def publish_topic(topic):
+    """新主题写入粉丝的动态，返回写入的行数"""
+    return _publish(topic.author, topic, None, topic.created_on)
+
+
+def publish_comment(comment):
+    return _publish(comment.author, comment.topic, comment, comment.created_on)
+
+
+def timeline_sources(user):
+    """时间线的各个来源：写给这个用户的记录，和关注的每个读扩散用户的记录"""
+    popular_ids = Follower.objects.filter(user_a=user, user_b__feed_broadcast=True).values_list('user_b', flat=True)
+    sources = [Timeline.objects.filter(user=user)]
+    sources += [Timeline.objects.filter(user__isnull=True, actor_id=actor_id) for actor_id in popular_ids]
+    return [source.select_related('actor', 'topic', 'comment') for source in sources]
+
+
+def timeline_page(request, user):
+    return paginate(request, timeline_sources(user), NUM_TIMELINE_PAGE, field='time')
+
+
+def follower_deleted(sender, **kwargs):
+    # 取消关注后，对方的动态从时间线中移除
+    follower = kwargs.get('instance', None)
+    if follower:
+        Timeline.objects.filter(user_id=follower.user_a_id, actor_id=follower.user_b_id).delete()
+
+
+post_delete.connect(follower_deleted, sender=Follower)
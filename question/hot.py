@@ -0,0 +1,96 @@
+"""
+今日热议：滑动窗口内评论数最多的主题。
+
+评论数按 (小时, 主题) 保存在 HotTopicCount 表里，评论保存时用一条 UPDATE ... SET num_comments = num_comments + 1
+给当前小时的计数加一（第一条评论时插入），多个进程同时写也不会丢失；
+读取时对最近 HOT_TOPICS_HOURS 小时的行按主题求和取前 N 个，结果缓存 HOT_TOPICS_CACHE_SECONDS 秒。
+计数表可以随时用 rebuild 从评论表重建（repair_counters 会调用）。
+"""
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncHour
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from question.models import Comment, HotTopicCount, Topic
+
+HOT_TOPICS_HOURS = getattr(settings, 'HOT_TOPICS_HOURS', 24)
+HOT_TOPICS_NUM = getattr(settings, 'HOT_TOPICS_NUM', settings.NUM_COMMENT_PAGE)
+HOT_TOPICS_CACHE_SECONDS = getattr(settings, 'HOT_TOPICS_CACHE_SECONDS', 60)
+
+CACHE_KEY = 'hot_topic_ids_{}'
+
+
+def _hour(dt):
+    return int(dt.timestamp() // 3600)
+
+
+def _window_start(now_hour):
+    return now_hour - HOT_TOPICS_HOURS + 1
+
+
+def rebuild():
+    """从评论表重建窗口内的计数，返回写入的行数"""
+    now_hour = _hour(timezone.now())
+    start_hour = _window_start(now_hour)
+    start_time = datetime.datetime.fromtimestamp(start_hour * 3600, tz=timezone.utc)
+
+    rows = Comment.objects.filter(created_on__gte=start_time)\
+        .annotate(hour=TruncHour('created_on')).values('hour', 'topic')\
+        .annotate(count=Count('id')).order_by()
+    counts = [HotTopicCount(hour=_hour(row['hour']), topic_id=row['topic'], num_comments=row['count'])
+              for row in rows]
+    with transaction.atomic():
+        HotTopicCount.objects.all().delete()
+        HotTopicCount.objects.bulk_create(counts)
+    cache.delete(CACHE_KEY.format(HOT_TOPICS_NUM))
+    return len(counts)
+
+
+def _incr(hour, topic_id):
+    return HotTopicCount.objects.filter(hour=hour, topic_id=topic_id).update(num_comments=F('num_comments') + 1)
+
+
+def record_comment(sender, **kwargs):
+    """新评论计入当前小时的计数"""
+    comment = kwargs.get('instance', None)
+    if not comment or not kwargs.get('created', False):
+        return
+
+    hour = _hour(comment.created_on)
+    if _incr(hour, comment.topic_id):
+        return
+    try:
+        with transaction.atomic():
+            HotTopicCount.objects.create(hour=hour, topic_id=comment.topic_id, num_comments=1)
+    except IntegrityError:
+        _incr(hour, comment.topic_id)     # 别的进程刚插入了这一行
+        return
+    # 每个主题每小时只会走到这里一次，顺便删掉滑出窗口的行
+    HotTopicCount.objects.filter(hour__lt=_window_start(hour)).delete()
+
+
+def top_topic_ids(num=HOT_TOPICS_NUM):
+    key = CACHE_KEY.format(num)
+    topic_ids = cache.get(key)
+    if topic_ids is None:
+        start_hour = _window_start(_hour(timezone.now()))
+        rows = HotTopicCount.objects.filter(hour__gte=start_hour).values('topic')\
+            .annotate(count=Sum('num_comments')).order_by('-count', '-topic')[:num]
+        topic_ids = [row['topic'] for row in rows]
+        cache.set(key, topic_ids, HOT_TOPICS_CACHE_SECONDS)
+    return topic_ids
+
+
+def top_topics(num=HOT_TOPICS_NUM):
+    """热议主题列表，按评论数从高到低"""
+    topic_ids = top_topic_ids(num)
+    topics = Topic.objects.select_related('author').in_bulk(topic_ids)
+    return [topics[topic_id] for topic_id in topic_ids if topic_id in topics]
+
+
+post_save.connect(record_comment, sender=Comment)
@@ -0,0 +1,43 @@
+"""
+通知收件箱。
+
+列表按 (to_user, is_deleted, time) 游标分页，不做 COUNT(*)；未读数取自 Member.unread_notice_num。
+标记已读是一条带水位线（通知 id）的 UPDATE，未读计数按实际更新的行数减少。
+"""
+from django.conf import settings
+from django.db.models import Max
+
+from people.models import Member
+from question import events
+from question.models import Notice
+from question.paginator import paginate
+
+NUM_NOTICE_PAGE = getattr(settings, 'NUM_NOTICE_PAGE', 20)
+
+
+def notice_page(request, user):
+    notices = Notice.objects.filter(to_user=user, is_deleted=False).select_related('from_user', 'topic')
+    return paginate(request, notices, NUM_NOTICE_PAGE, field='time')
+
+
+def watermark(user, page):
+    """
+    标记已读的水位线：收件箱中最新一条通知的 id。
+    第一页最上面的一条就是最新的，翻到后面的页时查一次。
+    """
+    if len(page) and not page.has_previous():
+        return page[0].id
+    return Notice.objects.filter(to_user=user, is_deleted=False).aggregate(latest=Max('id'))['latest']
+
+
+def mark_read(user, up_to=None):
+    """把 id 不大于 up_to 的未读通知标为已读（up_to 为空时全部标记），返回标记的条数"""
+    notices = Notice.objects.filter(to_user=user, is_readed=False, is_deleted=False)
+    if up_to is not None:
+        notices = notices.filter(id__lte=up_to)
+    # 只减去这次实际标记的条数，同时到达的新通知仍计为未读
+    count = notices.update(is_readed=True)
+    if count:
+        Member.objects.incr_counter(user.id, 'unread_notice_num', -count)
+        events.unread_changed(user.id)
+    return count
@@ -0,0 +1,179 @@
+import datetime
+import json
+import random
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import Resolver404, resolve, reverse
+from django.test import Client
+
+from people.models import Member
+from question.management.commands.seed_forum import EMAIL_PATTERN, PASSWORD
+from question.models import Node, Topic
+
+# (路由名, 权重, 是否需要登录)
+ROUTES = [
+    ('question:index', 20, False),
+    ('question:recent', 8, False),
+    ('question:node', 10, False),
+    ('question:topic', 30, False),
+    ('question:notice', 4, True),
+    ('question:reply', 3, True),
+    ('question:new', 1, True),
+    ('user:fav_topic_list', 2, True),
+    ('user:following', 2, True),
+    ('user:au_top', 2, False),
+    ('user:user', 5, True),
+    ('user:user_topics', 3, False),
+    ('user:user_comments', 3, False),
+]
+LOGIN_ROUTES = {name for name, weight, login in ROUTES if login}
+# 提交成功后重定向到新的主题页，其余路由直接返回页面
+POST_ROUTES = {'question:reply', 'question:new'}
+
+
+def percentile(values, p):
+    """最近秩法的百分位数，values 需已排序"""
+    if not values:
+        return None
+    index = max(int(round(p / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('按权重回放 question 和 people 的路由（包括回复和发帖的 POST），'
+            '统计每个路由的吞吐量和 p50/p95/p99 延迟并写入 JSON 文件。'
+            '只使用 seed_forum 生成的账号登录，会向当前数据库写入数据，请在 seed_forum 生成的测试库上运行')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='请求总数')
+        parser.add_argument('--warmup', type=int, default=100, help='预热请求数，不计入结果')
+        parser.add_argument('--users', type=int, default=50, help='参与回放的登录用户数')
+        parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+        parser.add_argument('--output', default='benchmark.json', help='结果文件')
+        parser.add_argument('--baseline', default=None, help='与之比较的上一次结果文件')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.serial = 0
+        self.load_samples(options['users'])
+        if not (self.topic_ids and self.node_slugs and self.users):
+            raise CommandError('数据库里没有 seed_forum 生成的数据，请先运行 seed_forum')
+
+        self.anonymous = Client(HTTP_HOST='localhost')
+        self.clients = []
+        for user in self.users:
+            client = Client(HTTP_HOST='localhost')
+            if not client.login(username=user.email, password=PASSWORD):
+                raise CommandError('无法登录 {}，请确认数据来自 seed_forum'.format(user.email))
+            self.clients.append(client)
+
+        names = [name for name, weight, login in ROUTES]
+        weights = [weight for name, weight, login in ROUTES]
+        for name in self.rng.choices(names, weights=weights, k=options['warmup']):
+            self.request(name)
+
+        timings = defaultdict(list)
+        errors = defaultdict(int)
+        started = time.perf_counter()
+        for name in self.rng.choices(names, weights=weights, k=options['requests']):
+            begin = time.perf_counter()
+            response = self.request(name)
+            timings[name].append((time.perf_counter() - begin) * 1000)
+            if not self.succeeded(name, response):
+                errors[name] += 1
+        elapsed = time.perf_counter() - started
+
+        result = self.summarize(timings, errors, elapsed, options)
+        with open(options['output'], 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        self.report(result, options['baseline'])
+        self.stdout.write('结果已写入 {}'.format(options['output']))
+
+    def load_samples(self, num_users):
+        """取出回放时用到的主题、节点和用户；热门主题（评论多的）被访问得更多"""
+        self.topic_ids = list(Topic.objects.order_by('-num_comments').values_list('id', flat=True)[:1000])
+        self.node_slugs = list(Node.objects.order_by('-num_topics').values_list('slug', flat=True))
+        # 只用 seed_forum 生成的账号，不碰真实用户
+        self.users = list(Member.objects.filter(is_active=True, email__regex=EMAIL_PATTERN)
+                          .order_by('-au')[:num_users])
+
+    def skewed(self, items):
+        weights = [1.0 / (rank + 1) for rank in range(len(items))]
+        return self.rng.choices(items, weights=weights)[0]
+
+    def request(self, name):
+        # 需要登录的路由用登录用户访问，其余路由 30% 的请求来自登录用户
+        client = self.rng.choice(self.clients) if name in LOGIN_ROUTES or self.rng.random() < 0.3 \
+            else self.anonymous
+        self.serial += 1
+
+        if name in ('question:index', 'question:recent', 'question:notice', 'user:fav_topic_list',
+                    'user:following', 'user:au_top'):
+            response = client.get(reverse(name))
+        elif name == 'question:node':
+            response = client.get(reverse(name, kwargs={'node_slug': self.skewed(self.node_slugs)}))
+        elif name == 'question:topic':
+            response = client.get(reverse(name, kwargs={'topic_id': self.skewed(self.topic_ids)}))
+        elif name == 'question:reply':
+            response = client.post(reverse(name, args=[self.skewed(self.topic_ids)]),
+                                   {'content': '性能测试回复 {}'.format(self.serial)})
+        elif name == 'question:new':
+            response = client.post(reverse(name, args=[self.skewed(self.node_slugs)]),
+                                   {'title': '性能测试主题 {}'.format(self.serial), 'content': '性能测试'})
+        else:
+            response = client.get(reverse(name, kwargs={'uid': self.rng.choice(self.users).id}))
+        return response
+
+    def succeeded(self, name, response):
+        """页面应返回 200；提交应重定向到主题页，重定向到登录页或别处都算错误"""
+        if name not in POST_ROUTES:
+            return response.status_code == 200
+        if response.status_code != 302:
+            return False
+        try:
+            return resolve(urlparse(response.url).path).view_name == 'question:topic'
+        except Resolver404:
+            return False
+
+    def summarize(self, timings, errors, elapsed, options):
+        """吞吐量是实际完成的请求数除以整个回放的耗时（次/秒），不是平均延迟的倒数"""
+        routes = {}
+        for name, values in sorted(timings.items()):
+            values.sort()
+            routes[name] = {
+                'requests': len(values),
+                'errors': errors[name],
+                'throughput': round(len(values) / elapsed, 2),
+                'mean': round(sum(values) / len(values), 2),
+                'p50': round(percentile(values, 50), 2),
+                'p95': round(percentile(values, 95), 2),
+                'p99': round(percentile(values, 99), 2),
+            }
+        return {
+            'time': datetime.datetime.now().isoformat(),
+            'options': {key: options[key] for key in ('requests', 'warmup', 'users', 'seed')},
+            'requests': sum(len(values) for values in timings.values()),
+            'elapsed': round(elapsed, 3),
+            'throughput': round(sum(len(values) for values in timings.values()) / elapsed, 2),
+            'routes': routes,
+        }
+
+    def report(self, result, baseline_path):
+        baseline = {}
+        if baseline_path:
+            with open(baseline_path) as f:
+                baseline = json.load(f).get('routes', {})
+
+        self.stdout.write('{:<24}{:>8}{:>8}{:>10}{:>10}{:>10}{:>10}'.format(
+            '路由', '请求', '错误', '次/秒', 'p50', 'p95', 'p99'))
+        for name, row in result['routes'].items():
+            line = '{:<24}{:>8}{:>8}{:>10}{:>10}{:>10}{:>10}'.format(
+                name, row['requests'], row['errors'], row['throughput'], row['p50'], row['p95'], row['p99'])
+            if name in baseline and baseline[name]['p95']:
+                line += '  p95 {:+.1f}%'.format((row['p95'] / baseline[name]['p95'] - 1) * 100)
+            self.stdout.write(line)
+        self.stdout.write('共 {} 个请求，{} 秒，{} 次/秒'.format(
+            result['requests'], result['elapsed'], result['throughput']))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from people.models import Member, Follower
+from question import hot
+from question.models import Node, Topic, Comment, Notice, FavoritedTopic, Timeline
+
+
+def count_of(queryset, field):
+    """按 field 关联到外层行的 COUNT 子查询，没有记录时为 0"""
+    subquery = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field)\
+        .annotate(count=Count('id')).values('count')
+    return Coalesce(Subquery(subquery), 0)
+
+
+class Command(BaseCommand):
+    help = '根据原始数据重新计算节点、主题和用户的各项计数'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            nodes = Node.objects.update(num_topics=count_of(Topic.objects.all(), 'node'))
+            topics = Topic.objects.update(num_comments=count_of(Comment.objects.all(), 'topic'),
+                                          num_favorites=count_of(FavoritedTopic.objects.all(), 'topic'))
+            members = Member.objects.update(
+                topic_num=count_of(Topic.objects.all(), 'author'),
+                comment_num=count_of(Comment.objects.all(), 'author'),
+                fav_num=count_of(FavoritedTopic.objects.all(), 'user'),
+                following_num=count_of(Follower.objects.all(), 'user_a'),
+                follower_num=count_of(Follower.objects.all(), 'user_b'),
+                unread_notice_num=count_of(Notice.objects.filter(is_readed=False, is_deleted=False), 'to_user'),
+            )
+            # 活跃度由帖子数和评论数算出，等上面的 UPDATE 完成后再算
+            Member.objects.update(au=F('topic_num') * Member.AU_PER_TOPIC + F('comment_num') * Member.AU_PER_COMMENT)
+            # 写过读扩散动态的用户，粉丝读取时要合并这些记录
+            Member.objects.filter(id__in=Timeline.objects.filter(user__isnull=True).values('actor'))\
+                .update(feed_broadcast=True)
+        hot.rebuild()
+        self.stdout.write('已重新计算 {} 个节点、{} 个主题、{} 位用户的计数'.format(nodes, topics, members))
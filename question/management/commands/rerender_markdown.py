@@ -0,0 +1,63 @@
+import os
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from question.models import Topic, Comment
+from question.render import RENDER_VERSION, render
+
+
+def render_chunk(args):
+    """在子进程中渲染一批 (id, content)"""
+    flag, rows = args
+    return [(pk, render(content, flag)) for pk, content in rows]
+
+
+class Command(BaseCommand):
+    help = '用多进程分批重新渲染渲染器版本过期的主题和评论'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='每批的行数')
+        parser.add_argument('--processes', type=int, default=None, help='渲染进程数，默认等于 CPU 数')
+        parser.add_argument('--all', action='store_true', help='重新渲染所有行，而不只是版本过期的行')
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or os.cpu_count() or 1
+        with Pool(processes) as pool:
+            for model in (Topic, Comment):
+                total = 0
+                chunks = self.iter_chunks(model, options['chunk_size'], options['all'])
+                # 读写数据库都留在主线程，每轮给每个进程分一批
+                while True:
+                    batch = [chunk for _, chunk in zip(range(processes), chunks)]
+                    if not batch:
+                        break
+                    for rendered in pool.map(render_chunk, batch):
+                        self.save_chunk(model, rendered, options['all'])
+                        total += len(rendered)
+                self.stdout.write('{}: 重新渲染 {} 条'.format(model.__name__, total))
+
+    def stale(self, model, rerender_all):
+        queryset = model.objects.all()
+        if not rerender_all:
+            queryset = queryset.exclude(render_version=RENDER_VERSION)
+        return queryset
+
+    def iter_chunks(self, model, chunk_size, rerender_all):
+        # 按 id 递增取批次，不使用 OFFSET
+        last_id = 0
+        while True:
+            rows = list(self.stale(model, rerender_all).filter(id__gt=last_id)
+                        .order_by('id').values_list('id', 'content')[:chunk_size])
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield model.render_flag, rows
+
+    def save_chunk(self, model, rendered, rerender_all):
+        with transaction.atomic():
+            for pk, content_html in rendered:
+                # 渲染期间被编辑过的行已经是新版本，不要用旧内容覆盖
+                self.stale(model, rerender_all).filter(id=pk).update(
+                    content_html=content_html, render_version=RENDER_VERSION)
@@ -0,0 +1,182 @@
+import datetime
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from people.models import Member, Follower
+from question.models import Category, Node, Topic, Comment, Notice, FavoritedTopic
+from question.render import RENDER_VERSION, render
+
+PASSWORD = 'password'
+# 生成的用户邮箱，benchmark 只用这些账号登录
+EMAIL_TEMPLATE = 'bench{}_{}@example.com'
+EMAIL_PATTERN = r'^bench[0-9]+_[0-9]+@example\.com$'
+
+# 每条 UPDATE 改写的行数，参数个数要在 SQLite 的上限（999）以内
+UPDATE_CHUNK = 300
+
+WORDS = ('Python Django 数据库 索引 缓存 查询 模板 部署 性能 并发 事务 分页 '
+         'Linux Nginx Redis 测试 重构 接口 前端 后端 算法 内存 线程 进程').split()
+
+
+def skewed_choices(items, k, rng, exponent=1.1):
+    """按 Zipf 分布抽样：排在前面的元素被抽中的次数远多于后面的"""
+    weights = [1.0 / (rank + 1) ** exponent for rank in range(len(items))]
+    return rng.choices(items, weights=weights, k=k)
+
+
+class Command(BaseCommand):
+    help = '用 bulk_create 生成大规模的示例论坛数据，用于性能测试；所有用户的密码都是 {}'.format(PASSWORD)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=8)
+        parser.add_argument('--nodes', type=int, default=40)
+        parser.add_argument('--topics', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=int, default=20, help='每个用户平均关注的人数')
+        parser.add_argument('--favorites', type=int, default=10, help='每个用户平均收藏的主题数')
+        parser.add_argument('--days', type=int, default=365, help='数据分布在最近多少天内')
+        parser.add_argument('--batch-size', type=int, default=2000, help='评论每攒够多少条写入一次')
+        parser.add_argument('--seed', type=int, default=0, help='随机数种子，相同的种子生成相同的数据')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.start = self.now - datetime.timedelta(days=options['days'])
+
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'])
+            node_ids = self.create_nodes(options['categories'], options['nodes'])
+            topics = self.create_topics(options['topics'], user_ids, node_ids)
+            self.create_comments(options['comments'], user_ids, topics)
+            self.create_followers(user_ids, options['follows'])
+            self.create_favorites(user_ids, [topic_id for topic_id, author_id, created_on in topics],
+                                  options['favorites'])
+
+        # 计数字段统一用聚合重新计算
+        call_command('repair_counters', stdout=self.stdout)
+        self.stdout.write('完成。搜索索引需要另外运行 rebuild_search_index 建立')
+
+    def new_ids(self, model, before):
+        return list(model.objects.filter(id__gt=before).order_by('id').values_list('id', flat=True))
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    def set_created_on(self, model, ids, times):
+        """created_on 是 auto_now_add，bulk_create 时都成了当前时间，写入后按 id 改成生成的时间"""
+        for start in range(0, len(ids), UPDATE_CHUNK):
+            rows = list(zip(ids[start:start + UPDATE_CHUNK], times[start:start + UPDATE_CHUNK]))
+            model.objects.filter(id__in=[pk for pk, created_on in rows]).update(
+                created_on=Case(*[When(id=pk, then=Value(created_on)) for pk, created_on in rows],
+                                output_field=DateTimeField()))
+
+    def random_time(self, after=None):
+        start = after or self.start
+        return start + (self.now - start) * self.rng.random()
+
+    def sentence(self, n):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(n))
+
+    def create_users(self, num):
+        before = self.last_id(Member)
+        password = make_password(PASSWORD)     # 哈希很慢，所有用户共用一个
+        Member.objects.bulk_create([
+            Member(email=EMAIL_TEMPLATE.format(before, i), username='b{}_{}'.format(before, i)[:16],
+                   password=password, date_joined=self.random_time())
+            for i in range(num)
+        ])
+        user_ids = self.new_ids(Member, before)
+        self.stdout.write('用户 {}'.format(len(user_ids)))
+        return user_ids
+
+    def create_nodes(self, num_categories, num_nodes):
+        before = self.last_id(Category)
+        Category.objects.bulk_create([Category(name='类别 {}'.format(before + i)) for i in range(num_categories)])
+        category_ids = self.new_ids(Category, before)
+
+        before = self.last_id(Node)
+        Node.objects.bulk_create([
+            Node(name='节点 {}'.format(before + i), slug='node-{}'.format(before + i),
+                 category_id=category_ids[i % len(category_ids)])
+            for i in range(num_nodes)
+        ])
+        node_ids = self.new_ids(Node, before)
+        self.stdout.write('类别 {}，节点 {}'.format(len(category_ids), len(node_ids)))
+        return node_ids
+
+    def create_topics(self, num, user_ids, node_ids):
+        """返回 [(id, 作者 id, 发表时间)]，按热度从高到低排列"""
+        before = self.last_id(Topic)
+        authors = skewed_choices(user_ids, num, self.rng)
+        nodes = skewed_choices(node_ids, num, self.rng)
+        objs = []
+        for author_id, node_id in zip(authors, nodes):
+            content = self.sentence(self.rng.randint(10, 80))
+            created_on = self.random_time()
+            objs.append(Topic(title=self.sentence(self.rng.randint(2, 8))[:100], content=content,
+                              content_html=render(content, 'topic'), render_version=RENDER_VERSION,
+                              node_id=node_id, author_id=author_id, last_reply_id=author_id,
+                              created_on=created_on, updated_on=created_on))
+        times = [obj.created_on for obj in objs]
+        Topic.objects.bulk_create(objs)
+        topic_ids = self.new_ids(Topic, before)
+        self.set_created_on(Topic, topic_ids, times)
+
+        topics = list(zip(topic_ids, authors, times))
+        self.rng.shuffle(topics)
+        self.stdout.write('主题 {}'.format(len(topics)))
+        return topics
+
+    def create_comments(self, num, user_ids, topics):
+        """评论集中在少数热门主题上，每 10 条评论给主题作者发一条通知"""
+        # 评论内容从一个小的集合里取，只需渲染这些
+        contents = [self.sentence(self.rng.randint(3, 40)) for _ in range(200)]
+        rendered = {content: render(content, 'comment') for content in contents}
+
+        comments, notices = [], []
+        for i, (topic_id, topic_author_id, topic_created_on) in enumerate(skewed_choices(topics, num, self.rng)):
+            author_id = self.rng.choice(user_ids)
+            content = self.rng.choice(contents)
+            created_on = self.random_time(topic_created_on)
+            comments.append(Comment(content=content, content_html=rendered[content], render_version=RENDER_VERSION,
+                                    author_id=author_id, topic_id=topic_id, created_on=created_on))
+            if i % 10 == 0 and author_id != topic_author_id:
+                notices.append(Notice(from_user_id=author_id, to_user_id=topic_author_id, topic_id=topic_id,
+                                      content=content, is_readed=self.rng.random() < 0.7))
+            if len(comments) >= self.batch_size:
+                self.save_comments(comments)
+                comments = []
+        self.save_comments(comments)
+        Notice.objects.bulk_create(notices)
+        self.stdout.write('评论 {}，通知 {}'.format(num, len(notices)))
+
+    def save_comments(self, comments):
+        before = self.last_id(Comment)
+        times = [comment.created_on for comment in comments]
+        Comment.objects.bulk_create(comments)
+        self.set_created_on(Comment, self.new_ids(Comment, before), times)
+
+    def create_followers(self, user_ids, per_user):
+        pairs = set()
+        for user_id in user_ids:
+            for followed_id in skewed_choices(user_ids, self.rng.randint(0, per_user * 2), self.rng):
+                if followed_id != user_id:
+                    pairs.add((user_id, followed_id))
+        Follower.objects.bulk_create([Follower(user_a_id=a, user_b_id=b) for a, b in pairs])
+        self.stdout.write('关注 {}'.format(len(pairs)))
+
+    def create_favorites(self, user_ids, topic_ids, per_user):
+        pairs = set()
+        for user_id in user_ids:
+            for topic_id in skewed_choices(topic_ids, self.rng.randint(0, per_user * 2), self.rng):
+                pairs.add((user_id, topic_id))
+        FavoritedTopic.objects.bulk_create([FavoritedTopic(user_id=u, topic_id=t) for u, t in pairs])
+        self.stdout.write('收藏 {}'.format(len(pairs)))
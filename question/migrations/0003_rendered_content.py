@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question', '0002_auto_20180605_1859'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='content_html',
+            field=models.TextField(blank=True, default='', verbose_name='渲染后的内容'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='render_version',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='渲染器版本'),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='content_html',
+            field=models.TextField(blank=True, default='', verbose_name='渲染后的内容'),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='render_version',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='渲染器版本'),
+        ),
+    ]
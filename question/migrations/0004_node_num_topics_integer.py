@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question', '0003_rendered_content'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='node',
+            name='num_topics',
+            field=models.IntegerField(default=0, verbose_name='主题数'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 20:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question', '0007_topic_updated_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotTopicCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.IntegerField(verbose_name='小时')),
+                ('num_comments', models.IntegerField(default=0, verbose_name='评论数')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='question.Topic', verbose_name='主题')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='hottopiccount',
+            unique_together=set([('hour', 'topic')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 20:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_favorites(apps, schema_editor):
+    Topic = apps.get_model('question', 'Topic')
+    FavoritedTopic = apps.get_model('question', 'FavoritedTopic')
+    favorites = FavoritedTopic.objects.filter(topic=OuterRef('pk')).order_by().values('topic')\
+        .annotate(count=Count('id')).values('count')
+    Topic.objects.update(num_favorites=Coalesce(Subquery(favorites), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question', '0008_hot_topic_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='num_favorites',
+            field=models.IntegerField(default=0, verbose_name='收藏数'),
+        ),
+        migrations.RunPython(count_favorites, migrations.RunPython.noop),
+    ]
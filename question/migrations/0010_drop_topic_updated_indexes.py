@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 20:44
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('question', '0009_topic_num_favorites'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='topic',
+            name='topic_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='topic',
+            name='topic_node_updated_idx',
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.utils.safestring import mark_safe
 from people.models import Member
+from question.render import RENDER_VERSION, render as render_markdown
 
 
 class Category(models.Model):
@@ -17,14 +19,57 @@ class Node(models.Model):
     slug = models.SlugField(max_length=100, verbose_name='url标识符')
     created_on = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_on = models.DateTimeField(auto_now=True, null=True, blank=True, verbose_name='更新时间')
-    num_topics = models.SmallIntegerField(default=0, verbose_name='主题数')
+    num_topics = models.IntegerField(default=0, verbose_name='主题数')
     category = models.ForeignKey(Category, verbose_name='所属类别')
 
     def __str__(self):
         return self.name
 
 
-class Topic(models.Model):
+class RenderedContent(models.Model):
+    """保存时把 content 渲染成 HTML 存起来，页面不再逐次渲染 Markdown"""
+    content_html = models.TextField(blank=True, default='', verbose_name='渲染后的内容')
+    render_version = models.PositiveSmallIntegerField(default=0, verbose_name='渲染器版本')
+
+    render_flag = 'topic'
+
+    class Meta:
+        abstract = True
+
+    def __init__(self, *args, **kwargs):
+        super(RenderedContent, self).__init__(*args, **kwargs)
+        # 记下渲染结果对应的原文，保存时原文没变就不再渲染；content 被 defer 时不在 __dict__ 里
+        self._rendered_source = self.__dict__.get('content')
+
+    def render_content(self):
+        self.content_html = render_markdown(self.content, self.render_flag)
+        self.render_version = RENDER_VERSION
+        self._rendered_source = self.content
+
+    def needs_render(self):
+        if self.render_version != RENDER_VERSION:
+            return True
+        if 'content' not in self.__dict__:
+            return False    # 没有加载也没有修改过 content
+        return self.content != self._rendered_source
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None or 'content' in update_fields) and self.needs_render():
+            self.render_content()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'content_html', 'render_version'}
+        super(RenderedContent, self).save(*args, **kwargs)
+
+    @property
+    def rendered_content(self):
+        # 旧版本渲染器生成的内容在重新渲染之前，先临时渲染
+        if self.render_version != RENDER_VERSION:
+            return mark_safe(render_markdown(self.content, self.render_flag))
+        return mark_safe(self.content_html)
+
+
+class Topic(RenderedContent):
     """主题"""
     title = models.CharField(max_length=100, verbose_name='标题')
     content = models.TextField(verbose_name='内容')
@@ -32,21 +77,39 @@ class Topic(models.Model):
     author = models.ForeignKey(Member, verbose_name='作者')
     num_views = models.IntegerField(default=0, verbose_name='浏览量')
     num_comments = models.IntegerField(default=0, verbose_name='评论数')
+    num_favorites = models.IntegerField(default=0, verbose_name='收藏数')
     last_reply = models.ForeignKey(Member, related_name='+', verbose_name='最后回复者', null=True, blank=True)
     created_on = models.DateTimeField(auto_now_add=True, verbose_name='发表时间')
     updated_on = models.DateTimeField(blank=True, null=True, verbose_name='更新时间')
 
+    class Meta:
+        # 列表按 (created_on, id) 排序和翻页
+        indexes = [
+            models.Index(fields=['created_on', 'id'], name='topic_created_idx'),
+            models.Index(fields=['node', 'created_on', 'id'], name='topic_node_created_idx'),
+            models.Index(fields=['author', 'created_on', 'id'], name='topic_author_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
 
-class Comment(models.Model):
+class Comment(RenderedContent):
     """评论"""
     content = models.TextField(verbose_name='内容')
     author = models.ForeignKey(Member, verbose_name='作者')
     topic = models.ForeignKey(Topic, verbose_name='所属主题')
     created_on = models.DateTimeField(auto_now_add=True, verbose_name='评论时间')
 
+    render_flag = 'comment'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['topic', 'created_on', 'id'], name='comment_topic_created_idx'),
+            models.Index(fields=['created_on'], name='comment_created_idx'),    # 今日热议
+            models.Index(fields=['author', 'created_on', 'id'], name='comment_author_created_idx'),
+        ]
+
     def __str__(self):
         return self.content
 
@@ -61,10 +124,50 @@ class Notice(models.Model):
     is_readed = models.BooleanField(default=False, verbose_name='是否以读')
     is_deleted = models.BooleanField(default=False, verbose_name='是否删除')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['to_user', 'is_deleted', 'time', 'id'], name='notice_inbox_idx'),
+            models.Index(fields=['to_user', 'is_deleted', 'is_readed', 'time'], name='notice_unread_idx'),
+        ]
+
     def __str__(self):
         return self.content
 
 
+class Timeline(models.Model):
+    """
+    关注动态。关注的人发帖或回复时给每个粉丝写一行（user 为粉丝）；
+    粉丝很多的用户只写一行 user 为空的记录，由粉丝读取时合并。
+    """
+    user = models.ForeignKey(Member, related_name='+', null=True, blank=True, verbose_name='接收用户')
+    actor = models.ForeignKey(Member, related_name='+', verbose_name='发布用户')
+    topic = models.ForeignKey(Topic, verbose_name='主题')
+    comment = models.ForeignKey(Comment, null=True, blank=True, verbose_name='回复')
+    time = models.DateTimeField(verbose_name='发布时间')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'time', 'id'], name='timeline_user_time_idx'),
+            models.Index(fields=['actor', 'time', 'id'], name='timeline_actor_time_idx'),
+        ]
+
+    def __str__(self):
+        return '{} -> {}'.format(self.actor_id, self.user_id)
+
+
+class HotTopicCount(models.Model):
+    """今日热议：每个主题每小时的评论数，hour 为 Unix 时间戳整除 3600"""
+    hour = models.IntegerField(verbose_name='小时')
+    topic = models.ForeignKey(Topic, verbose_name='主题')
+    num_comments = models.IntegerField(default=0, verbose_name='评论数')
+
+    class Meta:
+        unique_together = ('hour', 'topic')
+
+    def __str__(self):
+        return '{}@{}'.format(self.topic_id, self.hour)
+
+
 class FavoritedTopic(models.Model):
     """记录用户最爱的主题"""
     user = models.ForeignKey(Member, verbose_name='用户')
@@ -74,19 +177,23 @@ class FavoritedTopic(models.Model):
         return str(self.id)
 
 
-def create_notice(sender, **kwargs):
-    """
-    如果评论者是这个主题的作者，就不通知这个作者。
-    也就是，自己给自己的主题评论，就不通知自己。
-    """
-    comment = kwargs.get('instance', None)
-    if comment and comment.author != comment.topic.author:
-        Notice.objects.create(
-            from_user=comment.author,
-            to_user=comment.topic.author,
-            topic=comment.topic,
-            content=comment.content,
-        )
+def notice_created(sender, **kwargs):
+    notice = kwargs.get('instance', None)
+    if notice and kwargs.get('created', False) and not notice.is_readed and not notice.is_deleted:
+        Member.objects.incr_counter(notice.to_user_id, 'unread_notice_num')
+
+
+def favorited_topic_created(sender, **kwargs):
+    if kwargs.get('created', False):
+        Member.objects.incr_counter(kwargs['instance'].user_id, 'fav_num')
+        Topic.objects.filter(id=kwargs['instance'].topic_id).update(num_favorites=models.F('num_favorites') + 1)
+
+
+def favorited_topic_deleted(sender, **kwargs):
+    Member.objects.incr_counter(kwargs['instance'].user_id, 'fav_num', -1)
+    Topic.objects.filter(id=kwargs['instance'].topic_id).update(num_favorites=models.F('num_favorites') - 1)
 
 
-post_save.connect(create_notice, sender=Comment)
+post_save.connect(notice_created, sender=Notice)
+post_save.connect(favorited_topic_created, sender=FavoritedTopic)
+post_delete.connect(favorited_topic_deleted, sender=FavoritedTopic)
@@ -0,0 +1,55 @@
+"""
+回复产生的通知。
+
+一条回复的所有通知（给主题作者的回复通知、给被 @ 用户的提及通知）在一起处理：
+被 @ 的用户名用一条 IN 查询解析，通知用一次 bulk_create 写入，未读计数用一条 UPDATE 增加。
+每条回复最多通知 MAX_MENTIONS 个被 @ 的用户。
+"""
+import re
+
+from django.conf import settings
+
+from people.models import Member
+from question import events
+from question.models import Notice
+
+MAX_MENTIONS = getattr(settings, 'MAX_MENTIONS', 10)
+
+MENTION_PATTERN = re.compile(r'(?<=@)([0-9a-zA-Z_.]+)', re.UNICODE)     # 正则获取@后面的字符串
+
+
+def mentioned_names(content):
+    """按出现顺序去重后的被 @ 用户名，最多 MAX_MENTIONS 个"""
+    names = []
+    for name in MENTION_PATTERN.findall(content):
+        if name not in names:
+            names.append(name)
+            if len(names) >= MAX_MENTIONS:
+                break
+    return names
+
+
+def notify_reply(comment):
+    """为一条新回复生成全部通知，返回通知数"""
+    topic = comment.topic
+    skip_ids = {comment.author_id, topic.author_id}
+    recipient_ids = []
+    if comment.author_id != topic.author_id:
+        recipient_ids.append(topic.author_id)
+
+    # 回复者自己和主题作者不会收到提及通知
+    names = mentioned_names(comment.content)
+    if names:
+        recipient_ids.extend(Member.objects.filter(username__in=names).exclude(id__in=skip_ids)
+                             .values_list('id', flat=True))
+    if not recipient_ids:
+        return 0
+
+    # bulk_create 不会触发 post_save，未读计数在这里一并增加
+    Notice.objects.bulk_create([
+        Notice(from_user_id=comment.author_id, to_user_id=user_id, topic=topic, content=comment.content)
+        for user_id in recipient_ids
+    ])
+    Member.objects.incr_counter(recipient_ids, 'unread_notice_num')
+    events.unread_changed(*recipient_ids)
+    return len(recipient_ids)
@@ -0,0 +1,121 @@
+"""
+未登录用户的整页缓存。
+
+未登录访客看到的首页、最近主题和节点页完全相同，直接缓存整个响应。
+缓存键包含完整的 URL（页码或游标都在查询参数里）和相关的版本号：
+首页和最近主题依赖全站版本，节点页只依赖该节点的版本。
+发帖、回复、编辑时调用 invalidate() 把版本号加一，旧的缓存条目不再被命中，随超时自然淘汰；
+节点分类变化时调用 invalidate_all() 让所有页面失效，删除主题时由信号自动失效。
+API 的主题列表也用这些版本号作 ETag（list_version），轮询时不用查数据库。
+响应头 X-Page-Cache 为 HIT / MISS / BYPASS，用于统计命中率。
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db.models.signals import post_delete
+from django.http import HttpResponse
+
+from question.models import Topic
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 3600)
+
+GLOBAL_VERSION_KEY = 'page_cache_version'
+ALL_VERSION_KEY = 'page_cache_version_all'
+HEADER = 'X-Page-Cache'
+
+
+def _node_version_key(node_slug):
+    return 'page_cache_version_node_{}'.format(node_slug)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)     # 不存在时视为 1
+
+
+def invalidate(node=None):
+    """列表内容发生变化：全站版本加一，给出 node 时该节点的版本也加一"""
+    _bump(GLOBAL_VERSION_KEY)
+    if node is not None:
+        _bump(_node_version_key(node.slug))
+
+
+def invalidate_all():
+    """所有页面共用的内容（如节点分类）发生变化"""
+    _bump(ALL_VERSION_KEY)
+    _bump(GLOBAL_VERSION_KEY)
+
+
+def version():
+    """全站版本号，也用于模板片段缓存的键"""
+    return cache.get(GLOBAL_VERSION_KEY, 1)
+
+
+def list_version(node_slug=None):
+    """主题列表（给出 node_slug 时为该节点）的版本号；
+    缓存中没有时用当前时间初始化，缓存被清空后不会与清空前的版本号重复"""
+    keys = [ALL_VERSION_KEY, _node_version_key(node_slug) if node_slug else GLOBAL_VERSION_KEY]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, int(time.time() * 1000), None)
+            versions[key] = cache.get(key, 0)
+    return '.'.join(str(versions[key]) for key in keys)
+
+
+def _page_key(request, version_keys):
+    versions = cache.get_many(version_keys)
+    version = '.'.join(str(versions.get(key, 1)) for key in version_keys)
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return 'page_cache_{}_{}'.format(path, version)
+
+
+def _cacheable(request):
+    # 登录用户的页面有个人信息；带提示消息的页面只应显示一次
+    return (request.method in ('GET', 'HEAD') and not request.user.is_authenticated()
+            and not len(get_messages(request)))
+
+
+def anonymous_page(view):
+    """缓存未登录用户看到的页面，视图参数里有 node_slug 时是节点页"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable(request):
+            response = view(request, *args, **kwargs)
+            response[HEADER] = 'BYPASS'
+            return response
+
+        if 'node_slug' in kwargs:
+            version_keys = [ALL_VERSION_KEY, _node_version_key(kwargs['node_slug'])]
+        else:
+            version_keys = [ALL_VERSION_KEY, GLOBAL_VERSION_KEY]
+        key = _page_key(request, version_keys)
+
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response[HEADER] = 'HIT'
+            return response
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming and not response.cookies:
+            cache.set(key, (response.content, response['Content-Type']), PAGE_CACHE_TIMEOUT)
+        response[HEADER] = 'MISS'
+        return response
+    return wrapper
+
+
+def topic_deleted(sender, **kwargs):
+    topic = kwargs.get('instance', None)
+    if topic:
+        invalidate(topic.node)
+
+
+post_delete.connect(topic_deleted, sender=Topic)
@@ -0,0 +1,211 @@
+"""
+列表分页。
+
+数据量小的列表沿用页码分页；数据量大的列表使用基于 (created_on, id) 的游标分页，
+翻页时只做一次索引范围查询，不需要 COUNT(*)，也不会随页数加深而变慢。
+游标是不透明的字符串，里面记录了边界条目的时间、id 和它在列表中的序号（用于显示楼层），
+并用 SECRET_KEY 签名，客户端改动游标（比如伪造楼层号）时按无效游标处理。
+"""
+import base64
+import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Paginator, Page, PageNotAnInteger, EmptyPage
+from django.db.models import Q
+from django.utils import timezone
+
+KEYSET_PAGINATE_THRESHOLD = getattr(settings, 'KEYSET_PAGINATE_THRESHOLD', 1000)
+
+CURSOR_PARAMS = ('page', 'before', 'after')
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+_signer = signing.Signer(salt='question.paginator')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(value, pk, index):
+    value = value.astimezone(timezone.utc).strftime(TIME_FORMAT)
+    raw = '{}|{}|{}'.format(value, pk, index).encode('utf-8')
+    return _signer.sign(base64.urlsafe_b64encode(raw).decode('ascii').rstrip('='))
+
+
+def decode_cursor(cursor):
+    try:
+        cursor = _signer.unsign(cursor)
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        value, pk, index = raw.split('|')
+        value = datetime.datetime.strptime(value, TIME_FORMAT).replace(tzinfo=timezone.utc)
+        pk, index = int(pk), int(index)
+    except (signing.BadSignature, TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if index < 1:
+        raise InvalidCursor(cursor)
+    return value, pk, index
+
+
+def _query(params, key, value):
+    params = params.copy()
+    params[key] = value
+    return params.urlencode()
+
+
+class NumberPage(Page):
+    """页码分页，补充与 KeysetPage 相同的翻页链接参数"""
+    params = None
+
+    @property
+    def previous_query(self):
+        return _query(self.params, 'page', self.previous_page_number())
+
+    @property
+    def next_query(self):
+        return _query(self.params, 'page', self.next_page_number())
+
+
+class NumberPaginator(Paginator):
+    def __init__(self, object_list, per_page, params, **kwargs):
+        super(NumberPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.params = params
+
+    def _get_page(self, *args, **kwargs):
+        page = NumberPage(*args, **kwargs)
+        page.params = self.params
+        return page
+
+
+class KeysetPage(object):
+    """游标分页的一页，接口与 Django 的 Page 保持一致，但没有页码和总数"""
+    number = None
+    paginator = None
+
+    def __init__(self, object_list, start, has_previous, has_next, paginator):
+        self.object_list = object_list
+        self.start = start
+        self._has_previous = has_previous
+        self._has_next = has_next
+        self.keyset = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_other_pages(self):
+        return self._has_previous or self._has_next
+
+    def start_index(self):
+        return self.start
+
+    def end_index(self):
+        return self.start + len(self.object_list) - 1
+
+    @property
+    def previous_query(self):
+        first = self.object_list[0]
+        return _query(self.keyset.params, 'before', self.keyset.cursor_for(first, self.start))
+
+    @property
+    def next_query(self):
+        last = self.object_list[-1]
+        return _query(self.keyset.params, 'after', self.keyset.cursor_for(last, self.end_index()))
+
+
+class KeysetPaginator(object):
+    """
+    按 (field, id) 排序的游标分页。
+    descending 为 True 时新的在前（主题列表），为 False 时旧的在前（评论楼层）。
+    queryset 也可以是几个 queryset 的列表（如关注动态的多个来源）：每个来源各自做一次
+    取 per_page + 1 条的索引范围查询，再在内存中按 (field, id) 合并。
+    """
+
+    def __init__(self, queryset, per_page, params, field='created_on', descending=True):
+        self.per_page = int(per_page)
+        self.params = params
+        self.field = field
+        self.descending = descending
+        prefix, reverse_prefix = ('-', '') if descending else ('', '-')
+        sources = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+        self.querysets = [source.order_by(prefix + field, prefix + 'id') for source in sources]
+        self.reverse_querysets = [source.order_by(reverse_prefix + field, reverse_prefix + 'id')
+                                  for source in sources]
+
+    def _fetch(self, querysets, condition=None, reverse=False):
+        """各来源中排在最前的 per_page + 1 条，reverse 表示 querysets 是反向排序的"""
+        items = []
+        for queryset in querysets:
+            if condition is not None:
+                queryset = queryset.filter(condition)
+            items.extend(queryset[:self.per_page + 1])
+        if len(querysets) > 1:
+            items.sort(key=lambda obj: (getattr(obj, self.field), obj.pk), reverse=self.descending != reverse)
+        return items[:self.per_page + 1]
+
+    def cursor_for(self, obj, index):
+        return encode_cursor(getattr(obj, self.field), obj.pk, index)
+
+    def _beyond(self, cursor, forward):
+        """游标之后（forward）或之前的条目"""
+        value, pk, index = cursor
+        op = 'lt' if forward == self.descending else 'gt'
+        return (Q(**{'{}__{}'.format(self.field, op): value}) |
+                Q(**{self.field: value, 'id__{}'.format(op): pk}))
+
+    def page(self, before=None, after=None):
+        # 游标指向的条目已被删除到列表尽头时，回到第一页
+        if after:
+            cursor = decode_cursor(after)
+            items = self._fetch(self.querysets, self._beyond(cursor, True))
+            if items:
+                return KeysetPage(items[:self.per_page], cursor[2] + 1, True, len(items) > self.per_page, self)
+        elif before:
+            cursor = decode_cursor(before)
+            items = self._fetch(self.reverse_querysets, self._beyond(cursor, False), reverse=True)
+            if items:
+                has_previous = len(items) > self.per_page
+                items = items[:self.per_page][::-1]
+                return KeysetPage(items, max(cursor[2] - len(items), 1), has_previous, True, self)
+        items = self._fetch(self.querysets)
+        return KeysetPage(items[:self.per_page], 1, False, len(items) > self.per_page, self)
+
+
+def paginate(request, queryset, per_page, count=None, field='created_on', descending=True):
+    """
+    分页入口。count 是事先知道的总数（来自计数字段），
+    总数较小时使用页码分页，未知或较大时使用游标分页。
+    """
+    params = request.GET.copy()
+    for key in CURSOR_PARAMS:
+        params.pop(key, None)
+
+    before = request.GET.get('before')
+    after = request.GET.get('after')
+    if count is not None and count <= KEYSET_PAGINATE_THRESHOLD and not (before or after):
+        prefix = '-' if descending else ''
+        paginator = NumberPaginator(queryset.order_by(prefix + field, prefix + 'id'), per_page, params)
+        page = request.GET.get('page', 1)
+        try:
+            return paginator.page(page)
+        except PageNotAnInteger:
+            return paginator.page(1)
+        except EmptyPage:
+            return paginator.page(paginator.num_pages)
+
+    paginator = KeysetPaginator(queryset, per_page, params, field=field, descending=descending)
+    try:
+        return paginator.page(before=before, after=after)
+    except InvalidCursor:
+        return paginator.page()
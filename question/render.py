@@ -0,0 +1,52 @@
+"""
+Markdown 渲染。
+
+主题和评论的 HTML 在保存时渲染并存入数据库，页面直接读取存好的结果。
+修改渲染器的输出时需要把 RENDER_VERSION 加一，再运行 rerender_markdown 命令重新渲染旧数据。
+"""
+import misaka
+
+from django.utils.encoding import force_text
+
+RENDER_VERSION = 1
+
+EXTENSIONS = (
+    misaka.EXT_NO_INTRA_EMPHASIS | misaka.EXT_FENCED_CODE | misaka.EXT_AUTOLINK |
+    misaka.EXT_TABLES | misaka.EXT_STRIKETHROUGH | misaka.EXT_SUPERSCRIPT
+)
+
+
+class BaseRenderer(misaka.HtmlRenderer):
+    def autolink(self, link, is_email):
+        if is_email:
+            return '<a href="mailto:{link}">{link}<a>'.format(link=link)
+        content = link.replace('http://', '').replace('https://', '')
+        return '<a href="{}" target="_blank">{}</a>'.format(link, content)
+
+
+class CommentRenderer(BaseRenderer):
+    def header(self, text, level):
+        if level < 4:
+            return '<p>#{}</p>'.format(text)
+        return '<h{}>{}<h{}>'.format(level, text, level)
+
+
+class TopicRenderer(BaseRenderer):
+    pass
+
+
+_markdowns = {}
+
+
+def _get_markdown(flag):
+    # 渲染器与 Markdown 对象只在每个进程里创建一次
+    if flag not in _markdowns:
+        renderer_class = CommentRenderer if flag == 'comment' else TopicRenderer
+        renderer = renderer_class(flags=misaka.HTML_ESCAPE | misaka.HTML_HARD_WRAP)
+        _markdowns[flag] = misaka.Markdown(renderer, extensions=EXTENSIONS)
+    return _markdowns[flag]
+
+
+def render(value, flag):
+    """flag 为 'comment' 时使用评论的渲染规则，否则使用主题的"""
+    return _get_markdown(flag)(force_text(value))
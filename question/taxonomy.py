@@ -0,0 +1,40 @@
+"""
+节点分类树：[{'category_id', 'category_name', 'category_nodes': [{'name', 'slug'}]}]
+"""
+from django.db.models.signals import post_save, post_delete
+
+from QA.taxonomy import Taxonomy
+from question import pagecache
+from question.models import Category, Node
+
+
+def load_nodes():
+    nodes = {}
+    for node in Node.objects.order_by('id').values('name', 'slug', 'category_id'):
+        nodes.setdefault(node.pop('category_id'), []).append(node)
+    return [{'category_id': category['id'],
+             'category_name': category['name'],
+             'category_nodes': nodes.get(category['id'], [])}
+            for category in Category.objects.order_by('id').values('id', 'name')]
+
+
+node_tree = Taxonomy('question_nodes', load_nodes)
+
+
+def category_nodes(category_id):
+    """同一类别下的节点，用于节点页侧栏"""
+    for category in node_tree.get():
+        if category['category_id'] == category_id:
+            return category
+    return None
+
+
+def taxonomy_changed(sender, **kwargs):
+    # 首页和节点页都显示分类树
+    pagecache.invalidate_all()
+
+
+node_tree.watch(Category, Node)
+for model in (Category, Node):
+    post_save.connect(taxonomy_changed, sender=model)
+    post_delete.connect(taxonomy_changed, sender=model)
@@ -0,0 +1,73 @@
+"""
+测试辅助：示例数据和查询数预算。
+
+示例数据的主题数、评论数都多于一页，列表页如果逐条查询关联对象（N+1），查询数会明显超出预算。
+"""
+from django.core.cache import cache
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+from people import lastseen
+from people.models import Member, Follower
+from question import notices, viewcount
+from question.models import Category, Node, Topic, Comment, FavoritedTopic
+
+PASSWORD = 'password'
+
+
+def seed_forum(num_users=3, num_topics=15, num_comments=15):
+    """建立用户、节点、主题、评论、收藏、关注和通知，返回 (用户列表, 节点, 第一个主题)"""
+    users = [Member.objects.create_user(email='user{}@example.com'.format(i), username='user{}'.format(i),
+                                        password=PASSWORD) for i in range(num_users)]
+    category = Category.objects.create(name='技术')
+    node = Node.objects.create(name='Python', slug='python', category=category, num_topics=num_topics)
+
+    topics = []
+    for i in range(num_topics):
+        author = users[i % num_users]
+        topics.append(Topic.objects.create(title='主题 {}'.format(i), content='内容 **{}**'.format(i),
+                                           node=node, author=author, last_reply=author))
+    topic = topics[0]
+    for i in range(num_comments):
+        # 其余用户回复第一个用户的主题，第一个用户会收到通知
+        author = users[1 + i % (num_users - 1)]
+        comment = Comment.objects.create(content='回复 {}'.format(i), author=author, topic=topic)
+        notices.notify_reply(comment)
+    Topic.objects.filter(id=topic.id).update(num_comments=num_comments)
+
+    for other in users[1:]:
+        FavoritedTopic.objects.create(user=users[0], topic=other.topic_set.first())
+        Follower.objects.create(user_a=users[0], user_b=other)
+
+    Member.objects.filter(id__in=[user.id for user in users]).update(topic_num=num_topics // num_users)
+    return users, node, topic
+
+
+class QueryBudgetMixin(object):
+    """assertQueryBudget(budget, url) 请求 url，断言查询数不超过预算，超出时列出所有 SQL"""
+
+    def setUp(self):
+        super(QueryBudgetMixin, self).setUp()
+        cache.clear()
+        # 丢弃写回缓冲，避免请求中途触发写回，让查询数保持稳定
+        viewcount.reset()
+        lastseen.reset()
+
+    def assertQueryBudget(self, budget, url, method='get', data=None, status_code=200):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data or {})
+        self.assertEqual(response.status_code, status_code)
+        sqls = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(len(context), budget,
+                             '{} 执行了 {} 次查询，预算 {}：\n{}'.format(url, len(context), budget, sqls))
+        return response
+
+
+class TestRunner(DiscoverRunner):
+    """测试数据库销毁前丢弃写回缓冲，进程退出时不会把测试中的计数写进正式数据库"""
+
+    def teardown_databases(self, old_config, **kwargs):
+        viewcount.reset()
+        lastseen.reset()
+        super(TestRunner, self).teardown_databases(old_config, **kwargs)
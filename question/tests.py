@@ -1,3 +1,1132 @@
-from django.test import TestCase
+import datetime
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.contrib.staticfiles.templatetags.staticfiles import static
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import reverse
+from django.db import DatabaseError, connection, connections
+from django.db.models import F
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from QA import dbrouter
+from people import lastseen
+from people.models import Follower, Member
+from question import checks, events, feed, hot, inbox, notices, pagecache, taxonomy, viewcount
+from question.models import Topic, Comment, FavoritedTopic, HotTopicCount, Node, Notice, Timeline
+from question.paginator import InvalidCursor, KeysetPaginator, decode_cursor, encode_cursor
+from question.render import RENDER_VERSION
+from question.testing import PASSWORD, QueryBudgetMixin, seed_forum
+
+
+@override_settings(QUERY_STATS=False)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """每个视图的查询数预算；LargeSeedQueryBudgetTests 用几倍的数据再跑一遍，查询数随条目数增加时超出预算"""
+    SEED = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(**cls.SEED)
+
+    def login(self, user=None):
+        user = user or self.users[0]
+        self.client.login(username=user.email, password=PASSWORD)
+
+    def test_anonymous(self):
+        self.assertQueryBudget(5, reverse('question:index'))
+        self.assertQueryBudget(1, reverse('question:recent'))
+        self.assertQueryBudget(3, reverse('question:node', kwargs={'node_slug': self.node.slug}))
+        self.assertQueryBudget(4, reverse('question:topic', kwargs={'topic_id': self.topic.id}))
+
+    def test_logged_in(self):
+        self.login()
+        self.assertQueryBudget(7, reverse('question:index'))
+        self.assertQueryBudget(3, reverse('question:recent'))
+        self.assertQueryBudget(5, reverse('question:node', kwargs={'node_slug': self.node.slug}))
+        self.assertQueryBudget(6, reverse('question:topic', kwargs={'topic_id': self.topic.id}))
+        self.assertQueryBudget(3, reverse('question:notice'))
+        self.assertQueryBudget(3, reverse('user:fav_topic_list'))
+        self.assertQueryBudget(4, reverse('question:timeline'))
+
+    def test_forms(self):
+        self.login()
+        self.assertQueryBudget(6, reverse('question:reply', args=[self.topic.id]))
+        self.assertQueryBudget(3, reverse('question:new', args=[self.node.slug]))
+        self.assertQueryBudget(5, reverse('question:edit', args=[self.topic.id]))
+
+    def test_reply(self):
+        self.login(self.users[1])
+        url = reverse('question:reply', args=[self.topic.id])
+        self.assertQueryBudget(25, url, method='post', data={'content': '新的回复'}, status_code=302)
+
+    def test_new(self):
+        self.login(self.users[1])
+        url = reverse('question:new', args=[self.node.slug])
+        self.assertQueryBudget(22, url, method='post', data={'title': '新的主题', 'content': '内容'}, status_code=302)
+
+    def test_edit(self):
+        self.login()
+        url = reverse('question:edit', args=[self.topic.id])
+        self.assertQueryBudget(18, url, method='post', data={'title': '改过的主题', 'content': '新的内容'},
+                               status_code=302)
+
+    def test_favorite(self):
+        self.login(self.users[1])
+        self.assertQueryBudget(2, reverse('question:fav_topic', args=[self.topic.id]), status_code=302)
+        self.assertQueryBudget(2, reverse('question:unfav_topic', args=[self.topic.id]), status_code=302)
+
+
+class LargeSeedQueryBudgetTests(QueryBudgetTests):
+    SEED = {'num_users': 6, 'num_topics': 60, 'num_comments': 60}
+
+
+class QueryStatsMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(QUERY_STATS=True)
+    def test_headers(self):
+        with self.assertLogs('QA.querystats', 'INFO') as logs:
+            response = self.client.get(reverse('question:recent'))
+        self.assertEqual(response['X-Query-Count'], '1')
+        self.assertIn('X-Query-Time', response)
+        self.assertEqual(response['X-Query-Duplicates'], '0')
+        self.assertIn('queries=1', logs.output[0])
+
+    @override_settings(QUERY_STATS=True, DATABASE_REPLICAS=['replica'])
+    def test_replica_queries_counted_once(self):
+        # 测试时副本是主库的镜像，同一个连接不能重复计数
+        with self.assertLogs('QA.querystats', 'INFO'):
+            response = self.client.get(reverse('question:recent'))
+        self.assertEqual(response['X-Query-Count'], '1')
+        self.assertFalse(any(conn.force_debug_cursor for conn in connections.all()))
+
+    def test_disabled(self):
+        # 测试时默认关闭
+        response = self.client.get(reverse('question:recent'))
+        self.assertNotIn('X-Query-Count', response)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', '查询计划的格式与数据库有关，这里只检查 SQLite')
+class QueryPlanTests(TestCase):
+    """热点查询必须走对应的索引，并且不需要额外排序"""
+
+    def assertUsesIndex(self, queryset, index):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def keyset(self, queryset, descending=True, field='created_on'):
+        return KeysetPaginator(queryset, 10, {}, field=field, descending=descending).querysets[0][:11]
+
+    def test_topic_lists(self):
+        self.assertUsesIndex(self.keyset(Topic.objects.all()), 'topic_created_idx')
+        self.assertUsesIndex(self.keyset(Topic.objects.filter(node_id=1)), 'topic_node_created_idx')
+        self.assertUsesIndex(self.keyset(Topic.objects.filter(author_id=1)), 'topic_author_created_idx')
+
+    def test_comment_lists(self):
+        self.assertUsesIndex(self.keyset(Comment.objects.filter(topic_id=1), descending=False),
+                             'comment_topic_created_idx')
+        self.assertUsesIndex(self.keyset(Comment.objects.filter(author_id=1)), 'comment_author_created_idx')
+        since = timezone.now() - datetime.timedelta(hours=24)
+        self.assertUsesIndex(Comment.objects.filter(created_on__gte=since), 'comment_created_idx')
+
+    def test_timeline_sources(self):
+        user = Member.objects.create_user('fan', 'fan@example.com', PASSWORD)
+        popular = Member.objects.create_user('popular', 'popular@example.com', PASSWORD)
+        Member.objects.filter(id=popular.id).update(feed_broadcast=True)
+        Follower.objects.create(user_a=user, user_b=popular)
+        own, broadcast = feed.timeline_sources(user)
+        self.assertUsesIndex(self.keyset(own, field='time'), 'timeline_user_time_idx')
+        self.assertUsesIndex(self.keyset(broadcast, field='time'), 'timeline_actor_time_idx')
+
+    def test_notices(self):
+        inbox = Notice.objects.filter(to_user_id=1, is_deleted=False)
+        self.assertUsesIndex(self.keyset(inbox, field='time'), 'notice_inbox_idx')
+        unread = Notice.objects.filter(to_user_id=1, is_deleted=False, is_readed=False)
+        self.assertUsesIndex(unread.order_by('-time'), 'notice_unread_idx')
+
+
+@override_settings(QUERY_STATS=False)
+class StaticFilesTests(TestCase):
+    """collectstatic 之后的静态文件带哈希、预压缩并长期缓存"""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(STATIC_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_hashed_file(self):
+        url = static('css/main.css')
+        self.assertRegex(url, r'^/static/css/main\.[0-9a-f]{12}\.css$')
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        with staticfiles_storage.open(url[len('/static/'):]) as f:
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), f.read())
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_unhashed_file(self):
+        response = self.client.get('/static/css/main.css')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+        response = self.client.get('/static/css/main.css', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], QUERY_STATS=False)
+class ReplicaRouterTests(TransactionTestCase):
+    """replica 在测试中是 default 的镜像，用 TransactionTestCase 让它看到已提交的数据"""
+
+    def setUp(self):
+        cache.clear()
+        self.users, self.node, self.topic = seed_forum()
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connection) as primary:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(replica), len(primary)
+
+    def test_listing_reads_replica(self):
+        replica, primary = self.get(reverse('question:node', kwargs={'node_slug': self.node.slug}))
+        self.assertGreater(replica, 0)
+        self.assertEqual(primary, 0)
+
+    def test_other_views_read_primary(self):
+        replica, primary = self.get(reverse('question:topic', kwargs={'topic_id': self.topic.id}))
+        self.assertEqual(replica, 0)
+
+    def test_pinned_after_write(self):
+        self.client.login(username=self.users[1].email, password=PASSWORD)
+        response = self.client.post(reverse('question:reply', args=[self.topic.id]), {'content': '新的回复'})
+        self.assertIn('pin_primary', response.cookies)
+
+        replica, primary = self.get(reverse('user:user_comments', kwargs={'uid': self.users[1].id}))
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+    def test_one_replica_per_request(self):
+        with mock.patch('QA.dbrouter.random.choice', side_effect=lambda aliases: aliases[0]) as choice:
+            replica, primary = self.get(reverse('question:node', kwargs={'node_slug': self.node.slug}))
+        self.assertGreater(replica, 1)
+        self.assertEqual(choice.call_count, 1)
+
+    @mock.patch('question.viewcount.VIEW_FLUSH_THRESHOLD', 1)
+    @mock.patch('people.lastseen.LAST_SEEN_FLUSH_INTERVAL', 0)
+    def test_counter_flushes_do_not_pin(self):
+        self.client.login(username=self.users[1].email, password=PASSWORD)
+        response = self.client.get(reverse('question:topic', kwargs={'topic_id': self.topic.id}))
+        self.assertEqual(Topic.objects.get(id=self.topic.id).num_views, self.topic.num_views + 1)
+        self.assertIsNotNone(Member.objects.get(id=self.users[1].id).last_seen)
+        self.assertNotIn('pin_primary', response.cookies)
+
+    def test_session_saves_do_not_pin(self):
+        router = dbrouter.ReplicaRouter()
+        dbrouter._state.wrote = False
+        router.db_for_write(Session)
+        self.assertFalse(dbrouter._state.wrote)
+        router.db_for_write(Topic)
+        self.assertTrue(dbrouter._state.wrote)
+        dbrouter._state.wrote = False
+
+
+class EventStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum()
+
+    def test_publish_wakes_subscribers(self):
+        channels = [events.topic_channel(self.topic.id)]
+        event = events.subscribe(channels)
+        events.publish(events.user_channel(self.users[0].id))
+        self.assertFalse(event.is_set())
+        events.publish(*channels)
+        self.assertTrue(event.is_set())
+        events.unsubscribe(event, channels)
+        self.assertNotIn(channels[0], events._subscribers)
+
+    def test_changes(self):
+        user = self.users[0]
+        stream = events.Stream(user.id, topic_id=self.topic.id)
+        self.assertEqual(len(stream.changes()), 1)     # 未读数
+        self.assertEqual(stream.changes(), [])
+
+        comment = Comment.objects.create(content='新的回复', author=self.users[1], topic=self.topic)
+        Notice.objects.create(from_user=self.users[1], to_user=user, topic=self.topic, content='新的回复')
+        messages = stream.changes()
+        self.assertEqual(len(messages), 2)
+        self.assertIn('event: unread', messages[0])
+        self.assertIn('id: {}\nevent: comment'.format(stream.event_id()), messages[1])
+
+        # 重连时带回事件 id，没有新的变化就不再推送
+        stream = events.Stream(user.id, topic_id=self.topic.id, last_event_id=stream.event_id())
+        self.assertEqual(stream.last_comment_id, comment.id)
+        self.assertEqual(stream.changes(), [])
+
+    def read(self, response):
+        content = b''.join(response.streaming_content).decode()
+        response.close()
+        return content
+
+    def test_view(self):
+        url = reverse('question:events')
+        self.assertEqual(self.client.get(url, {'topic': self.topic.id}).status_code, 204)    # 未登录
+
+        self.client.login(username=self.users[0].email, password=PASSWORD)
+        response = self.client.get(url, {'topic': self.topic.id})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = self.read(response)
+        self.assertTrue(content.startswith('retry:'))
+        self.assertIn('event: unread', content)
+
+    @mock.patch('question.events.EVENTS_STREAM_TIMEOUT', 0.01)
+    def test_ends_without_changes(self):
+        self.client.login(username=self.users[0].email, password=PASSWORD)
+        stream = events.Stream(self.users[0].id, topic_id=self.topic.id)
+        stream.changes()
+        content = self.read(self.client.get(reverse('question:events'), {'topic': self.topic.id},
+                                            HTTP_LAST_EVENT_ID=stream.event_id()))
+        self.assertEqual(content, 'retry: {}\n\n'.format(events.EVENTS_RETRY))
+        self.assertFalse(events._subscribers)
+
+    def test_only_opened_for_users_on_topic_and_notice_pages(self):
+        topic_url = reverse('question:topic', kwargs={'topic_id': self.topic.id})
+        self.assertNotContains(self.client.get(topic_url), 'data-events')
+        self.client.login(username=self.users[0].email, password=PASSWORD)
+        self.assertContains(self.client.get(topic_url), 'data-events')
+        self.assertContains(self.client.get(reverse('question:notice')), 'data-events')
+        self.assertNotContains(self.client.get(reverse('question:index')), 'data-events')
+
+
+@override_settings(QUERY_STATS=False)
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_nodes(self):
+        response = self.client.get(reverse('api:nodes'))
+        self.assertEqual(response.json()['results'][0]['category_nodes'], [{'name': 'Python', 'slug': 'python'}])
+        response = self.client.get(reverse('api:nodes'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    @mock.patch('question.api.API_PAGE_SIZE', 10)
+    def test_topics_cursor(self):
+        data = self.client.get(reverse('api:topics'), {'node': 'python'}).json()
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(set(data['results'][0]), {'id', 'title', 'node', 'author', 'last_reply', 'num_comments',
+                                                   'created_on', 'updated_on'})
+        data = self.client.get(reverse('api:topics'), {'node': 'python', 'after': data['next']}).json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertIsNone(data['next'])
+        self.assertEqual(self.client.get(reverse('api:topics'), {'after': '!'}).status_code, 400)
+
+    def test_topic_not_modified(self):
+        url = reverse('api:topic', kwargs={'topic_id': self.topic.id})
+        response = self.client.get(url)
+        self.assertEqual(response.json()['content_html'], self.topic.content_html)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        etag = response['ETag']
+        Topic.objects.filter(id=self.topic.id).update(updated_on=timezone.now())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(reverse('api:topic', kwargs={'topic_id': 0})).status_code, 404)
+
+    def test_comments(self):
+        url = reverse('api:comments', kwargs={'topic_id': self.topic.id})
+        data = self.client.get(url).json()
+        self.assertEqual([comment['content_html'].strip() for comment in data['results'][:2]],
+                         ['<p>回复 0</p>', '<p>回复 1</p>'])
+
+    def assertModified(self, url, etag, params=None):
+        response = self.client.get(url, params or {}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_topics_etag_changes_on_delete(self):
+        url = reverse('api:topics')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # 删除的不是最近更新的主题，updated_on 的最大值不变
+        oldest = Topic.objects.exclude(id=self.topic.id).order_by('updated_on').first()
+        oldest.delete()
+        self.assertModified(url, etag)
+
+    def test_node_topics_etag(self):
+        url, params = reverse('api:topics'), {'node': self.node.slug}
+        etag = self.client.get(url, params)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        pagecache.invalidate(Node(slug='go'))     # 其他节点有新主题
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        pagecache.invalidate(self.node)
+        self.assertModified(url, etag, params)
+
+    def test_etags_change_on_rename(self):
+        urls = [reverse('api:topics'), reverse('api:topic', kwargs={'topic_id': self.topic.id}),
+                reverse('api:comments', kwargs={'topic_id': self.topic.id})]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        author = Member.objects.get(id=self.topic.author_id)
+        author.save(update_fields=['last_login'])
+        self.assertEqual([self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+                          for url, etag in zip(urls, etags)], [304] * 3)
+
+        author.username = 'renamed'
+        author.save()
+        for url, etag in zip(urls, etags):
+            self.assertModified(url, etag)
+        self.assertEqual(self.client.get(urls[1]).json()['author']['username'], 'renamed')
+
+    def test_topic_etag_includes_render_version(self):
+        url = reverse('api:topic', kwargs={'topic_id': self.topic.id})
+        etag = self.client.get(url)['ETag']
+        Topic.objects.filter(id=self.topic.id).update(render_version=0)
+        etag = self.assertModified(url, etag)
+        with mock.patch('question.api.RENDER_VERSION', RENDER_VERSION + 1):
+            self.assertModified(url, etag)
+
+
+@override_settings(QUERY_STATS=False)
+class ConditionalTopicTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum()
+
+    def setUp(self):
+        viewcount.reset()
+        self.url = reverse('question:topic', kwargs={'topic_id': self.topic.id})
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response['ETag'].startswith('W/'))
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        views = viewcount.pending(self.topic.id)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(viewcount.pending(self.topic.id), views + 1)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_comment(self):
+        etag = self.client.get(self.url)['ETag']
+        Comment.objects.create(content='新的回复', author=self.users[1], topic=self.topic)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_favorite_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        favorite = FavoritedTopic.objects.create(user=self.users[1], topic=self.topic)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['faved_num'], 1)
+        etag = response['ETag']
+        favorite.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(Topic.objects.get(id=self.topic.id).num_favorites, 0)
+
+    def test_render_version_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with mock.patch('question.views.RENDER_VERSION', RENDER_VERSION + 1):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        Topic.objects.filter(id=self.topic.id).update(render_version=0)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_logged_in(self):
+        self.client.login(username=self.users[0].email, password=PASSWORD)
+        self.assertFalse(self.client.get(self.url).has_header('ETag'))
+
+
+class ViewCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_topics=3, num_comments=0)
+        cls.topics = list(Topic.objects.order_by('id'))
+
+    def setUp(self):
+        viewcount.reset()
+        self.addCleanup(viewcount.reset)
+
+    def views(self):
+        return list(Topic.objects.order_by('id').values_list('num_views', flat=True))
+
+    def test_buffered_until_flush(self):
+        for topic in self.topics:
+            viewcount.incr(topic.id)
+        viewcount.incr(self.topics[0].id)
+        self.assertEqual(viewcount.pending(self.topics[0].id), 2)
+        self.assertEqual(self.views(), [0, 0, 0])
+
+        self.assertEqual(viewcount.flush(), 4)
+        self.assertEqual(self.views(), [2, 1, 1])
+        self.assertEqual(viewcount.pending(self.topics[0].id), 0)
+
+    def test_grouped_updates(self):
+        # 增量相同的主题合并成一条 UPDATE
+        viewcount.incr(self.topics[0].id, 3)
+        viewcount.incr(self.topics[1].id, 3)
+        viewcount.incr(self.topics[2].id, 5)
+        with CaptureQueriesContext(connection) as context:
+            viewcount.flush()
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(self.views(), [3, 3, 5])
+
+    @mock.patch('question.viewcount.VIEW_FLUSH_THRESHOLD', 3)
+    def test_threshold(self):
+        viewcount.incr(self.topics[0].id)
+        viewcount.incr(self.topics[1].id)
+        self.assertEqual(self.views(), [0, 0, 0])
+        viewcount.incr(self.topics[1].id)
+        self.assertEqual(self.views(), [1, 2, 0])
+
+    @mock.patch('question.viewcount.VIEW_FLUSH_THRESHOLD', 1)
+    def test_failed_flush_keeps_counts(self):
+        with mock.patch('django.db.models.query.QuerySet.update', side_effect=DatabaseError), \
+                self.assertLogs('question.viewcount', 'ERROR'):
+            viewcount.incr(self.topics[0].id)
+        self.assertEqual(viewcount.pending(self.topics[0].id), 1)
+
+
+class HotTopicsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_topics=3, num_comments=0)
+        cls.topics = list(Topic.objects.order_by('id'))
+
+    def setUp(self):
+        cache.clear()
+
+    def comment(self, topic, hours_ago=0):
+        comment = Comment.objects.create(topic=topic, author=self.users[0], content='回复')
+        if hours_ago:
+            # created_on 是 auto_now_add，保存后再改，模拟较早的评论
+            created_on = timezone.now() - datetime.timedelta(hours=hours_ago)
+            Comment.objects.filter(id=comment.id).update(created_on=created_on)
+            HotTopicCount.objects.filter(topic=topic).update(hour=hot._hour(created_on))
+        return comment
+
+    def test_counts_are_incremented_in_place(self):
+        for i in range(3):
+            self.comment(self.topics[1])
+        self.comment(self.topics[0])
+        self.assertEqual(HotTopicCount.objects.get(topic=self.topics[1]).num_comments, 3)
+        self.assertEqual(hot.top_topic_ids(), [self.topics[1].id, self.topics[0].id])
+
+    def test_sliding_window(self):
+        self.comment(self.topics[0], hours_ago=hot.HOT_TOPICS_HOURS + 1)
+        self.comment(self.topics[0], hours_ago=hot.HOT_TOPICS_HOURS + 1)
+        self.comment(self.topics[2], hours_ago=hot.HOT_TOPICS_HOURS - 2)
+        self.assertEqual(hot.top_topic_ids(), [self.topics[2].id])
+
+        # 新的一小时第一次写入时删掉滑出窗口的行
+        self.comment(self.topics[1])
+        self.assertFalse(HotTopicCount.objects.filter(topic=self.topics[0]).exists())
+
+    def test_rebuild(self):
+        self.comment(self.topics[0])
+        self.comment(self.topics[2])
+        self.comment(self.topics[2])
+        Comment.objects.filter(topic=self.topics[0]).update(
+            created_on=timezone.now() - datetime.timedelta(hours=hot.HOT_TOPICS_HOURS + 1))
+        HotTopicCount.objects.update(num_comments=99)
+
+        self.assertEqual(hot.rebuild(), 1)
+        self.assertEqual(list(HotTopicCount.objects.values_list('topic', 'num_comments')),
+                         [(self.topics[2].id, 2)])
+        self.assertEqual(hot.top_topic_ids(), [self.topics[2].id])
+
+    def test_result_is_cached(self):
+        self.comment(self.topics[0])
+        hot.top_topic_ids()
+        with self.assertNumQueries(0):
+            hot.top_topic_ids()
+
+
+class KeysetPaginatorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_topics=3, num_comments=12)
+        cls.comment_ids = list(Comment.objects.filter(topic=cls.topic).order_by('created_on', 'id')
+                               .values_list('id', flat=True))
+
+    def paginator(self, descending=False):
+        return KeysetPaginator(Comment.objects.filter(topic=self.topic), 5, {}, descending=descending)
+
+    def ids(self, page):
+        return [comment.id for comment in page]
+
+    def test_forward_and_back(self):
+        paginator = self.paginator()
+        first = paginator.page()
+        self.assertEqual(self.ids(first), self.comment_ids[:5])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+        second = paginator.page(after=paginator.cursor_for(first[-1], first.end_index()))
+        self.assertEqual(self.ids(second), self.comment_ids[5:10])
+        third = paginator.page(after=paginator.cursor_for(second[-1], second.end_index()))
+        self.assertEqual(self.ids(third), self.comment_ids[10:])
+        self.assertFalse(third.has_next())
+
+        back = paginator.page(before=paginator.cursor_for(third[0], third.start_index()))
+        self.assertEqual(self.ids(back), self.comment_ids[5:10])
+        self.assertTrue(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_descending(self):
+        paginator = self.paginator(descending=True)
+        first = paginator.page()
+        second = paginator.page(after=paginator.cursor_for(first[-1], first.end_index()))
+        self.assertEqual(self.ids(first) + self.ids(second), self.comment_ids[::-1][:10])
+
+    def test_floor_numbers(self):
+        paginator = self.paginator()
+        first = paginator.page()
+        self.assertEqual((first.start_index(), first.end_index()), (1, 5))
+        second = paginator.page(after=paginator.cursor_for(first[-1], first.end_index()))
+        self.assertEqual((second.start_index(), second.end_index()), (6, 10))
+        back = paginator.page(before=paginator.cursor_for(second[0], second.start_index()))
+        self.assertEqual(back.start_index(), 1)
+
+    def test_tampered_cursor(self):
+        paginator = self.paginator()
+        cursor = paginator.cursor_for(paginator.page()[-1], 5)
+        value, pk, index = decode_cursor(cursor)
+        self.assertEqual(index, 5)
+
+        payload, signature = cursor.rsplit(':', 1)
+        forged = encode_cursor(value, pk, 9999).rsplit(':', 1)[0] + ':' + signature
+        for bad in (forged, payload, '!', cursor[:-1]):
+            with self.assertRaises(InvalidCursor):
+                paginator.page(after=bad)
+
+    def test_invalid_cursor_in_view_falls_back_to_first_page(self):
+        response = self.client.get(reverse('question:topic', kwargs={'topic_id': self.topic.id}),
+                                   {'after': 'forged'})
+        self.assertEqual(response.status_code, 200)
+
+
+class RenderedContentTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_topics=3, num_comments=2)
+
+    def test_rendered_on_create(self):
+        self.assertEqual(self.topic.content_html.strip(), '<p>内容 <strong>0</strong></p>')
+        self.assertEqual(self.topic.render_version, RENDER_VERSION)
+
+    def test_unchanged_content_is_not_rerendered(self):
+        topic = Topic.objects.get(id=self.topic.id)
+        with mock.patch('question.models.render_markdown') as render:
+            topic.title = '新标题'
+            topic.save()
+            Topic.objects.only('id', 'title', 'render_version').get(id=self.topic.id).save()
+        self.assertFalse(render.called)
+
+    def test_changed_content_is_rerendered(self):
+        topic = Topic.objects.get(id=self.topic.id)
+        topic.content = '*新内容*'
+        topic.save()
+        self.assertEqual(Topic.objects.get(id=topic.id).content_html.strip(), '<p><em>新内容</em></p>')
+
+        topic.content = '**更新**'
+        topic.save(update_fields=['content'])
+        self.assertEqual(Topic.objects.get(id=topic.id).content_html.strip(), '<p><strong>更新</strong></p>')
+
+    def test_stale_version_is_rerendered_on_save(self):
+        Topic.objects.filter(id=self.topic.id).update(content_html='旧', render_version=0)
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertEqual(topic.rendered_content.strip(), '<p>内容 <strong>0</strong></p>')
+        topic.save()
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertEqual((topic.content_html.strip(), topic.render_version),
+                         ('<p>内容 <strong>0</strong></p>', RENDER_VERSION))
+
+    def test_rerender_markdown_command(self):
+        Topic.objects.update(content_html='旧', render_version=0)
+        Comment.objects.filter(id=Comment.objects.order_by('id')[0].id).update(content_html='旧', render_version=0)
+        out = StringIO()
+        call_command('rerender_markdown', processes=1, chunk_size=2, stdout=out)
+        self.assertIn('Topic: 重新渲染 3 条', out.getvalue())
+        self.assertIn('Comment: 重新渲染 1 条', out.getvalue())
+        self.assertFalse(Topic.objects.exclude(render_version=RENDER_VERSION).exists())
+        self.assertFalse(Comment.objects.filter(content_html='旧').exists())
+        self.assertEqual(Topic.objects.get(id=self.topic.id).content_html.strip(), '<p>内容 <strong>0</strong></p>')
+
+
+class FavoriteAndNoticeViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_comments=2)
+
+    def test_duplicate_favorite(self):
+        user = self.users[1]
+        self.client.login(username=user.email, password=PASSWORD)
+        url = reverse('question:fav_topic', kwargs={'topic_id': self.topic.id})
+        self.client.post(url)
+        self.client.post(url)
+        self.assertEqual(FavoritedTopic.objects.filter(user=user, topic=self.topic).count(), 1)
+        self.assertEqual(Member.objects.get(id=user.id).fav_num, 1)
+
+    def test_notice_delete_only_own(self):
+        owner, other = self.users[0], self.users[1]
+        notice = Notice.objects.filter(to_user=owner).first()
+        unread = Member.objects.get(id=owner.id).unread_notice_num
+
+        self.client.login(username=other.email, password=PASSWORD)
+        response = self.client.get(reverse('question:notice_delete', args=[notice.id]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Notice.objects.get(id=notice.id).is_deleted)
+
+        self.client.login(username=owner.email, password=PASSWORD)
+        url = reverse('question:notice_delete', args=[notice.id])
+        self.client.get(url)
+        self.client.get(url)
+        self.assertTrue(Notice.objects.get(id=notice.id).is_deleted)
+        self.assertEqual(Member.objects.get(id=owner.id).unread_notice_num, unread - 1)
+
+
+class NotifyReplyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_comments=0)
+        cls.others = [Member.objects.create_user('m{}'.format(i), 'm{}@example.com'.format(i), PASSWORD)
+                      for i in range(3)]
+
+    def reply(self, author, content):
+        return Comment.objects.create(topic=self.topic, author=author, content=content)
+
+    def recipients(self, comment):
+        return sorted(Notice.objects.filter(content=comment.content).values_list('to_user', flat=True))
+
+    def unread(self, user):
+        return Member.objects.get(id=user.id).unread_notice_num
+
+    def test_fan_out(self):
+        before = [self.unread(user) for user in self.others]
+        comment = self.reply(self.users[1], '@m0 @m1 看看这个')
+        with self.assertNumQueries(3):
+            self.assertEqual(notices.notify_reply(comment), 3)
+        self.assertEqual(self.recipients(comment), sorted([self.users[0].id, self.others[0].id, self.others[1].id]))
+        self.assertEqual([self.unread(user) for user in self.others], [before[0] + 1, before[1] + 1, before[2]])
+
+    def test_duplicates_and_self_mentions(self):
+        author = self.users[1]
+        comment = self.reply(author, '@m0 @m0 @{} @{}'.format(author.username, self.users[0].username))
+        self.assertEqual(notices.notify_reply(comment), 2)
+        self.assertEqual(self.recipients(comment), sorted([self.users[0].id, self.others[0].id]))
+
+    @mock.patch('question.notices.MAX_MENTIONS', 2)
+    def test_mention_cap(self):
+        self.assertEqual(notices.mentioned_names('@m0 @m1 @m0 @m2'), ['m0', 'm1'])
+        comment = self.reply(self.users[0], '@m0 @m1 @m2')
+        self.assertEqual(notices.notify_reply(comment), 2)
+        self.assertEqual(self.recipients(comment), sorted([self.others[0].id, self.others[1].id]))
+
+    def test_no_recipients(self):
+        comment = self.reply(self.users[0], '自己回复 @nobody')
+        with self.assertNumQueries(1):
+            self.assertEqual(notices.notify_reply(comment), 0)
+
+    def test_reply_view_notifies_topic_author(self):
+        url = reverse('question:reply', args=[self.topic.id])
+        before = self.unread(self.users[0])
+        self.client.login(username=self.users[1].email, password=PASSWORD)
+        self.client.post(url, {'content': '通过页面回复'})
+        notice = Notice.objects.get(content='通过页面回复')
+        self.assertEqual((notice.from_user_id, notice.to_user_id, notice.topic_id),
+                         (self.users[1].id, self.users[0].id, self.topic.id))
+        self.assertEqual(self.unread(self.users[0]), before + 1)
+
+        # 主题作者自己回复不产生通知
+        self.client.login(username=self.users[0].email, password=PASSWORD)
+        self.client.post(url, {'content': '作者自己回复'})
+        self.assertFalse(Notice.objects.filter(content='作者自己回复').exists())
+
+
+@mock.patch('question.inbox.NUM_NOTICE_PAGE', 5)
+class InboxTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # 第一个用户收到 12 条回复通知
+        cls.users, cls.node, cls.topic = seed_forum(num_comments=12)
+        cls.user = cls.users[0]
+        cls.notice_ids = list(Notice.objects.filter(to_user=cls.user).order_by('id').values_list('id', flat=True))
+
+    def unread(self):
+        return Member.objects.get(id=self.user.id).unread_notice_num
+
+    def test_mark_read_up_to(self):
+        self.assertEqual(inbox.mark_read(self.user, self.notice_ids[4]), 5)
+        self.assertEqual(self.unread(), 7)
+        self.assertEqual(Notice.objects.filter(to_user=self.user, is_readed=False).count(), 7)
+        self.assertEqual(inbox.mark_read(self.user, self.notice_ids[4]), 0)
+        self.assertEqual(self.unread(), 7)
+
+    def test_mark_all_decrements_by_marked_rows(self):
+        # 另一个请求刚给计数加了一，通知行还没有写入
+        Member.objects.incr_counter(self.user.id, 'unread_notice_num')
+        self.assertEqual(inbox.mark_read(self.user), 12)
+        self.assertEqual(self.unread(), 1)
+
+    def test_watermark_covers_whole_inbox(self):
+        self.client.login(username=self.user.email, password=PASSWORD)
+        first = self.client.get(reverse('question:notice'))
+        self.assertEqual(first.context['up_to'], self.notice_ids[-1])
+
+        page = first.context['notices']
+        second = self.client.get(reverse('question:notice') + '?' + page.next_query)
+        self.assertNotIn(self.notice_ids[-1], [notice.id for notice in second.context['notices']])
+        self.assertEqual(second.context['up_to'], self.notice_ids[-1])
+
+        self.client.post(reverse('question:notice_read'), {'up_to': second.context['up_to']})
+        self.assertEqual(self.unread(), 0)
+        self.assertFalse(Notice.objects.filter(to_user=self.user, is_readed=False).exists())
+
+    def test_newer_notices_stay_unread(self):
+        self.client.login(username=self.user.email, password=PASSWORD)
+        up_to = self.client.get(reverse('question:notice')).context['up_to']
+        Notice.objects.create(from_user=self.users[1], to_user=self.user, topic=self.topic, content='稍后到达')
+        self.client.post(reverse('question:notice_read'), {'up_to': up_to})
+        self.assertEqual(self.unread(), 1)
+
+
+@override_settings(QUERY_STATS=False)
+class PageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_comments=2)
+
+    def setUp(self):
+        cache.clear()
+
+    def status(self, url):
+        return self.client.get(url)[pagecache.HEADER]
+
+    def test_hit_and_miss(self):
+        url = reverse('question:recent')
+        self.assertEqual(self.status(url), 'MISS')
+        self.assertEqual(self.status(url), 'HIT')
+        self.assertEqual(self.status(url + '?page=2'), 'MISS')
+
+    def test_logged_in_bypass(self):
+        self.client.login(username=self.users[0].email, password=PASSWORD)
+        url = reverse('question:recent')
+        self.assertEqual(self.status(url), 'BYPASS')
+        self.assertEqual(self.status(url), 'BYPASS')
+
+    def test_invalidated_after_reply(self):
+        index = reverse('question:index')
+        node = reverse('question:node', kwargs={'node_slug': self.node.slug})
+        self.status(index)
+        self.status(node)
+        self.assertEqual(self.status(index), 'HIT')
+
+        self.client.login(username=self.users[1].email, password=PASSWORD)
+        self.client.post(reverse('question:reply', args=[self.topic.id]), {'content': '新的回复'})
+        self.client.logout()
+
+        self.assertEqual(self.status(index), 'MISS')
+        response = self.client.get(node)
+        self.assertEqual(response[pagecache.HEADER], 'MISS')
+        self.assertContains(response, self.users[1].username)
+
+    def test_node_version_is_separate(self):
+        other = Node.objects.create(name='Go', slug='go', category=self.node.category)
+        url = reverse('question:node', kwargs={'node_slug': self.node.slug})
+        self.status(url)
+        pagecache.invalidate(other)
+        self.assertEqual(self.status(url), 'HIT')
+        pagecache.invalidate_all()
+        self.assertEqual(self.status(url), 'MISS')
+
+
+class SharedCacheCheckTests(TestCase):
+
+    def test_local_cache_is_an_error_on_deploy(self):
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([error.id for error in checks.check_shared_cache(None)], ['question.E001'])
+        memcached = {'default': {'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+                                 'LOCATION': '127.0.0.1:11211'}}
+        with self.settings(CACHES=memcached):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+@override_settings(QUERY_STATS=False)
+class PostCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_comments=3)
+
+    def member(self, user):
+        return Member.objects.get(id=user.id)
+
+    def updates(self, context):
+        return [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+
+    def test_new_topic(self):
+        user = self.member(self.users[1])
+        num_topics = Node.objects.get(id=self.node.id).num_topics
+        self.client.login(username=user.email, password=PASSWORD)
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('question:new', args=[self.node.slug]), {'title': '新主题', 'content': '内容'})
+
+        self.assertEqual(Node.objects.get(id=self.node.id).num_topics, num_topics + 1)
+        after = self.member(user)
+        self.assertEqual((after.topic_num, after.au), (user.topic_num + 1, user.au + Member.AU_PER_TOPIC))
+        # 计数用 SET x = x + 1 更新，不写回读出的旧值
+        updates = '\n'.join(self.updates(context))
+        self.assertIn('"num_topics" = ("question_node"."num_topics" + 1)', updates)
+        self.assertIn('"topic_num" = ("people_member"."topic_num" + 1)', updates)
+
+    def test_reply(self):
+        user = self.member(self.users[2])
+        before = Topic.objects.get(id=self.topic.id)
+        self.client.login(username=user.email, password=PASSWORD)
+        self.client.post(reverse('question:reply', args=[self.topic.id]), {'content': '新的回复'})
+
+        topic = Topic.objects.get(id=self.topic.id)
+        self.assertEqual((topic.num_comments, topic.last_reply_id), (before.num_comments + 1, user.id))
+        self.assertGreater(topic.updated_on, before.created_on)
+        after = self.member(user)
+        self.assertEqual((after.comment_num, after.au), (user.comment_num + 1, user.au + Member.AU_PER_COMMENT))
+
+    def test_increments_from_stale_rows_are_not_lost(self):
+        first, second = self.member(self.users[1]), self.member(self.users[1])
+        Member.objects.incr_posts(first.id, comments=1)
+        Member.objects.incr_posts(second.id, comments=1)
+        self.assertEqual(self.member(self.users[1]).comment_num, first.comment_num + 2)
+
+    def test_repair_counters(self):
+        empty = Node.objects.create(name='Go', slug='go', category=self.node.category, num_topics=5)
+        Node.objects.update(num_topics=99)
+        Topic.objects.update(num_comments=99, num_favorites=99)
+        Member.objects.update(topic_num=99, comment_num=99, au=0)
+
+        call_command('repair_counters', stdout=StringIO())
+        self.assertEqual(Node.objects.get(id=self.node.id).num_topics, Topic.objects.count())
+        # 没有主题的节点由 Coalesce 得到 0，而不是 NULL
+        self.assertEqual(Node.objects.get(id=empty.id).num_topics, 0)
+        self.assertEqual(Topic.objects.get(id=self.topic.id).num_comments, 3)
+        self.assertEqual(Topic.objects.exclude(id=self.topic.id).filter(num_comments=0).count(),
+                         Topic.objects.count() - 1)
+        for topic in Topic.objects.all():
+            self.assertEqual(topic.num_favorites, FavoritedTopic.objects.filter(topic=topic).count())
+        for user in Member.objects.all():
+            topics = Topic.objects.filter(author=user).count()
+            comments = Comment.objects.filter(author=user).count()
+            self.assertEqual((user.topic_num, user.comment_num), (topics, comments))
+            self.assertEqual(user.au, topics * Member.AU_PER_TOPIC + comments * Member.AU_PER_COMMENT)
+
+
+@override_settings(ALLOWED_HOSTS=['localhost'])
+class BenchmarkCommandTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        viewcount.reset()
+        lastseen.reset()
+        self.addCleanup(viewcount.reset)
+        self.addCleanup(lastseen.reset)
+
+    def seed(self):
+        call_command('seed_forum', users=6, categories=1, nodes=2, topics=12, comments=40, follows=2, favorites=2,
+                     days=30, stdout=StringIO())
+
+    def test_seed_keeps_generated_times(self):
+        self.seed()
+        week_ago = timezone.now() - datetime.timedelta(days=7)
+        self.assertTrue(Topic.objects.filter(created_on__lt=week_ago).exists())
+        self.assertTrue(Comment.objects.filter(created_on__lt=week_ago).exists())
+        # 评论不早于所属主题
+        self.assertFalse(Comment.objects.filter(created_on__lt=F('topic__created_on')).exists())
+
+    def test_benchmark(self):
+        self.seed()
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark', requests=40, warmup=5, users=3, output=output.name, stdout=StringIO())
+            result = json.load(open(output.name))
+        self.assertEqual(result['requests'], 40)
+        self.assertEqual(sum(row['errors'] for row in result['routes'].values()), 0)
+        # 各路由的吞吐量按整个回放的耗时计算，加起来等于总吞吐量
+        self.assertAlmostEqual(sum(row['throughput'] for row in result['routes'].values()),
+                               result['throughput'], delta=0.1 * len(result['routes']))
+
+    def test_benchmark_only_uses_seeded_accounts(self):
+        seed_forum(num_comments=0)
+        with self.assertRaises(CommandError):
+            call_command('benchmark', requests=1, warmup=0, stdout=StringIO())
+
+
+class NodeTreeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_comments=0)
+        cls.admin = Member.objects.create_superuser('admin', 'admin@example.com', PASSWORD)
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username=self.admin.email, password=PASSWORD)
+
+    def names(self):
+        return [node['name'] for category in taxonomy.node_tree.get() for node in category['category_nodes']]
+
+    def test_cached(self):
+        self.assertEqual(self.names(), ['Python'])
+        with self.assertNumQueries(0):
+            taxonomy.node_tree.get()
+
+    def test_admin_node_save_refreshes_tree(self):
+        self.assertEqual(self.names(), ['Python'])
+        version = taxonomy.node_tree.version()
+        response = self.client.post(reverse('admin:question_node_change', args=[self.node.id]), {
+            'name': 'Python 3', 'slug': self.node.slug, 'category': self.node.category_id, 'num_topics': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertGreater(taxonomy.node_tree.version(), version)
+        self.assertEqual(self.names(), ['Python 3'])
+
+    def test_admin_category_add_refreshes_tree(self):
+        taxonomy.node_tree.get()
+        self.client.post(reverse('admin:question_category_add'), {'name': '生活'})
+        self.assertEqual([category['category_name'] for category in taxonomy.node_tree.get()], ['技术', '生活'])
+
+    def test_bounded_timeout(self):
+        with mock.patch('QA.taxonomy.cache.set') as cache_set:
+            taxonomy.node_tree.get()
+        self.assertEqual(cache_set.call_args[0][2], taxonomy.node_tree.timeout)
+        self.assertIsNotNone(taxonomy.node_tree.timeout)
+
+
+@mock.patch('question.feed.FEED_FANOUT_LIMIT', 1)
+class FeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_comments=0)
+        cls.popular, cls.normal, cls.fan, cls.other = [
+            Member.objects.create_user('f{}'.format(i), 'f{}@example.com'.format(i), PASSWORD) for i in range(4)]
+        for fan in (cls.fan, cls.other):
+            Follower.objects.create(user_a=fan, user_b=cls.popular)
+        Follower.objects.create(user_a=cls.fan, user_b=cls.normal)
+
+    def post(self, author, title, minutes_ago=0):
+        author = Member.objects.get(id=author.id)
+        topic = Topic.objects.create(title=title, content='内容', node=self.node, author=author)
+        Topic.objects.filter(id=topic.id).update(created_on=timezone.now() - datetime.timedelta(minutes=minutes_ago))
+        topic.refresh_from_db()
+        feed.publish_topic(topic)
+        return topic
+
+    def timeline(self, user):
+        return [entry.topic.title for entry in feed.timeline_page(RequestFactory().get('/'), user)]
+
+    def test_fan_out(self):
+        self.post(self.normal, '普通用户的主题')
+        self.assertEqual(list(Timeline.objects.filter(actor=self.normal).values_list('user', flat=True)),
+                         [self.fan.id])
+
+    def test_broadcast_writes_one_row(self):
+        self.post(self.popular, '热门用户的主题')
+        self.assertEqual(list(Timeline.objects.filter(actor=self.popular).values_list('user', flat=True)), [None])
+        self.assertTrue(Member.objects.get(id=self.popular.id).feed_broadcast)
+
+    def test_merge_and_order(self):
+        self.post(self.popular, '热门 1', minutes_ago=30)
+        self.post(self.normal, '普通 1', minutes_ago=20)
+        self.post(self.popular, '热门 2', minutes_ago=10)
+        self.assertEqual(self.timeline(self.fan), ['热门 2', '普通 1', '热门 1'])
+        self.assertEqual(self.timeline(self.other), ['热门 2', '热门 1'])
+        self.assertEqual(self.timeline(self.normal), [])
+
+    @mock.patch('question.feed.NUM_TIMELINE_PAGE', 2)
+    def test_pages_merge_each_source(self):
+        second = Member.objects.create_user('f4', 'f4@example.com', PASSWORD)
+        for fan in (self.fan, self.other):
+            Follower.objects.create(user_a=fan, user_b=second)
+        titles = ['热门 1', '普通 1', '热门二 1', '热门 2', '普通 2', '热门二 2']
+        for i, (author, title) in enumerate(zip([self.popular, self.normal, second] * 2, titles)):
+            self.post(author, title, minutes_ago=60 - i)
+
+        pages, params = [], {}
+        while True:
+            # 关注的读扩散用户 1 次、自己的记录 1 次、每个读扩散用户各 1 次
+            with self.assertNumQueries(4):
+                page = feed.timeline_page(RequestFactory().get('/', params), self.fan)
+            pages.append([entry.topic.title for entry in page])
+            if not page.has_next():
+                break
+            params = QueryDict(page.next_query)
+        self.assertEqual(pages, [titles[:3:-1], titles[3:1:-1], titles[1::-1]])
+
+        previous = feed.timeline_page(RequestFactory().get('/', QueryDict(page.previous_query)), self.fan)
+        self.assertEqual([entry.topic.title for entry in previous], pages[1])
+
+    def test_dropping_below_limit_keeps_past_entries(self):
+        self.post(self.popular, '热门时发的', minutes_ago=10)
+        Follower.objects.get(user_a=self.other, user_b=self.popular).delete()
+        self.assertEqual(Member.objects.get(id=self.popular.id).follower_num, 1)
+
+        self.post(self.popular, '粉丝变少后发的')
+        self.assertEqual(Timeline.objects.filter(actor=self.popular, user=self.fan).count(), 1)
+        self.assertEqual(self.timeline(self.fan), ['粉丝变少后发的', '热门时发的'])
+        self.assertEqual(self.timeline(self.other), [])
+
+    def test_unfollow_removes_entries(self):
+        self.post(self.normal, '普通用户的主题')
+        Follower.objects.get(user_a=self.fan, user_b=self.normal).delete()
+        self.assertEqual(self.timeline(self.fan), [])
+
+    def test_repair_marks_broadcasting_authors(self):
+        self.post(self.popular, '热门用户的主题')
+        Member.objects.update(feed_broadcast=False)
+        call_command('repair_counters', stdout=StringIO())
+        self.assertEqual(list(Member.objects.filter(feed_broadcast=True).values_list('id', flat=True)),
+                         [self.popular.id])
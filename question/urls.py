@@ -11,8 +11,12 @@ urlpatterns = [
     url(r'^node/([\w-]+)/new/$', views.new, name='new'),
     url(r'^t/(\d+)/edit/$', views.edit, name='edit'),
 
+    url(r'^timeline/$', views.timeline, name='timeline'),
+
     url(r'^notice/$', views.notice, name='notice'),
+    url(r'^notice/read/$', views.notice_read, name='notice_read'),
     url(r'^notice/(\d+)/delete/$', views.notice_delete, name='notice_delete'),
+    url(r'^events/$', views.event_stream, name='events'),
 
     url(r'^t/fav/(?P<topic_id>\d+)/$', views.fav_topic, name='fav_topic'),
     url(r'^t/unfav/(?P<topic_id>\d+)/$', views.unfav_topic, name='unfav_topic'),
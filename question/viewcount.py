@@ -0,0 +1,92 @@
+"""
+主题浏览量的写回缓冲。
+
+每次浏览只在进程内累加，隔一段时间（或累计到一定数量）再按增量分组，
+用 F('num_views') + n 批量写回数据库，避免每次浏览都重写整行 Topic。
+进程退出时通过 atexit 写回剩余的计数；自定义的 worker 退出钩子也可以直接调用 flush()。
+请求中顺带的写回失败时只记日志，计数留在缓冲里等下次再写，不影响页面。
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from QA.dbrouter import unpinned
+
+VIEW_FLUSH_INTERVAL = getattr(settings, 'VIEW_FLUSH_INTERVAL', 30)
+VIEW_FLUSH_THRESHOLD = getattr(settings, 'VIEW_FLUSH_THRESHOLD', 500)
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = Counter()
+_last_flush = time.time()
+
+
+def incr(topic_id, n=1):
+    """记录一次浏览，到达时间间隔或数量阈值时顺带写回"""
+    with _lock:
+        _pending[int(topic_id)] += n
+        due = (sum(_pending.values()) >= VIEW_FLUSH_THRESHOLD or
+               time.time() - _last_flush >= VIEW_FLUSH_INTERVAL)
+    if due:
+        try:
+            flush()
+        except DatabaseError:
+            logger.exception('写回浏览量失败，稍后重试')
+
+
+def pending(topic_id):
+    """尚未写回数据库的浏览量，用于页面显示"""
+    with _lock:
+        return _pending.get(int(topic_id), 0)
+
+
+def flush():
+    """把缓冲的浏览量写回数据库，返回写回的浏览次数"""
+    from question.models import Topic
+
+    global _last_flush
+    with _lock:
+        batch = _pending.copy()
+        _pending.clear()
+        _last_flush = time.time()
+    if not batch:
+        return 0
+
+    # 增量相同的主题合并成一条 UPDATE
+    groups = defaultdict(list)
+    for topic_id, n in batch.items():
+        groups[n].append(topic_id)
+    try:
+        with unpinned(), transaction.atomic():
+            for n, topic_ids in groups.items():
+                Topic.objects.filter(id__in=topic_ids).update(num_views=F('num_views') + n)
+    except DatabaseError:
+        with _lock:
+            _pending.update(batch)
+        raise
+    return sum(batch.values())
+
+
+def reset():
+    """丢弃尚未写回的计数，供测试在切换数据库前后调用"""
+    global _last_flush
+    with _lock:
+        _pending.clear()
+        _last_flush = time.time()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except DatabaseError:
+        logger.exception('进程退出时写回浏览量失败')
+
+
+atexit.register(_flush_at_exit)
@@ -1,19 +1,21 @@
-import datetime
-import re
+from functools import wraps
 
 from django.shortcuts import render, redirect
-from django.http import Http404
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.conf import settings
-from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
 from django.utils import timezone
-from django.db.models import Count
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
 from django.contrib import messages
+from QA.dbrouter import replica_reads
 from question.models import *
 from question.forms import *
+from question import events, feed, hot, inbox, notices, pagecache, taxonomy, viewcount
+from question.paginator import paginate
+from question.render import RENDER_VERSION
 from people.models import Member
 
 NUM_TOPICS_PAGE = settings.NUM_TOPIC_PAGE
@@ -21,105 +23,115 @@ NUM_COMMENT_PAGE = settings.NUM_COMMENT_PAGE
 
 
 @require_http_methods(['GET', 'POST'])
+@pagecache.anonymous_page
+@replica_reads
 def index(request):
     # 获取主题列表
-    topic_list = Topic.objects.all().order_by('-created_on')[:NUM_TOPICS_PAGE]
-    nodes = cache.get('index_nodes')
-
-    # 节点及类别
-    if not nodes:
-        nodes = []
-        category_list = Category.objects.all()
-        for category in category_list:
-            node = {}
-            category_nodes = Node.objects.filter(category=category)
-            node['category_name'] = category.name
-            node['category_nodes'] = category_nodes
-            nodes.append(node)
-        cache.set('index_nodes', nodes, 60)     # 缓存设置60秒
+    topic_list = Topic.objects.select_related('author', 'node', 'last_reply').order_by('-created_on')[:NUM_TOPICS_PAGE]
+    nodes = taxonomy.node_tree.get()
 
     # 今日热议
-    hot_topics = cache.get('index_hot_topics')
-    if not hot_topics:
-        now = timezone.now()
-        start_time = now - datetime.timedelta(hours=23, minutes=59, seconds=59)
-        hot_comments = Comment.objects.filter(created_on__gt=start_time).values('topic')\
-                           .annotate(count=Count('topic')).order_by('-count')[:NUM_COMMENT_PAGE]
-        hot_topics = []
-        for comment in hot_comments:
-            topic = Topic.objects.get(id=comment['topic'])
-            hot_topics.append(topic)
-        cache.set('index_hot_topic', hot_topics, 60)
+    hot_topics = hot.top_topics()
 
     return render(request, 'question/index.html', {'topic_list': topic_list,
                                                    'nodes': nodes,
-                                                   'hot_topics': hot_topics})
+                                                   'hot_topics': hot_topics,
+                                                   'list_version': pagecache.version()})
 
 
 @require_http_methods(['GET', 'POST'])
+@pagecache.anonymous_page
+@replica_reads
 def recent(request):
-    topic_list = Topic.objects.all().order_by('-created_on')
-    paginator = Paginator(topic_list, NUM_TOPICS_PAGE)
-    page = request.GET.get('page', 1)
-
-    try:
-        topic_list = paginator.page(page)
-    except PageNotAnInteger:
-        topic_list = paginator.page(1)
-    except EmptyPage:
-        topic_list = paginator.page(paginator.num_pages)
-
+    topic_list = paginate(request, Topic.objects.select_related('author', 'node', 'last_reply'), NUM_TOPICS_PAGE)
     return render(request, 'question/recent.html', {'topic_list': topic_list})
 
 
 @require_http_methods(['GET', 'POST'])
+@pagecache.anonymous_page
+@replica_reads
 def node(request, node_slug):
     try:
         node = Node.objects.get(slug=node_slug)
     except Node.DoesNotExist:
         raise Http404
-    topic_list = Topic.objects.filter(node=node).order_by('-created_on')
-    paginator = Paginator(topic_list, NUM_TOPICS_PAGE)
-    page = request.GET.get('page', 1)
-
-    try:
-        topic_list = paginator.page(page)
-    except PageNotAnInteger:
-        topic_list = paginator.page(1)
-    except EmptyPage:
-        topic_list = paginator.page(paginator.num_pages)
-
-    return render(request, 'question/node.html', {'topic_list': topic_list, 'node': node})
+    topics = Topic.objects.filter(node=node).select_related('author', 'node', 'last_reply')
+    topic_list = paginate(request, topics, NUM_TOPICS_PAGE, count=node.num_topics)
+    sidebar = taxonomy.category_nodes(node.category_id)
+    return render(request, 'question/node.html', {'topic_list': topic_list, 'node': node, 'sidebar': sidebar})
+
+
+def _comment_page(request, topic):
+    """主题下的一页评论，按楼层顺序"""
+    return paginate(request, Comment.objects.filter(topic=topic).select_related('author'), NUM_COMMENT_PAGE,
+                    count=topic.num_comments, descending=False)
+
+
+def _topic_state(request, topic_id):
+    """
+    条件请求用的 (ETag, 最后修改时间)，一条查询取出主题的更新时间、评论数、收藏数、渲染版本和最新评论时间；
+    收藏不改变任何时间，渲染器升级也不改变，所以收藏数和渲染版本要放进 ETag。
+    只对未登录用户的 GET 生效：登录用户的页面里有未读数、收藏状态等个人信息。
+    页面上的浏览量不参与比较，因此是弱 ETag。
+    """
+    if not hasattr(request, '_topic_state'):
+        request._topic_state = None
+        if request.method in ('GET', 'HEAD') and not request.user.is_authenticated() \
+                and not len(messages.get_messages(request)):
+            last_comment = Comment.objects.filter(topic=OuterRef('pk')).order_by('-created_on')
+            row = Topic.objects.filter(id=topic_id)\
+                .annotate(last_comment_on=Subquery(last_comment.values('created_on')[:1]))\
+                .values_list('created_on', 'updated_on', 'last_comment_on', 'num_comments', 'num_favorites',
+                             'render_version').first()
+            if row is not None:
+                modified = max(time for time in row[:3] if time is not None)
+                etag = 'W/"topic-{}-{}-{}-{}-{}.{}"'.format(topic_id, int(modified.timestamp() * 1000),
+                                                             row[3], row[4], row[5], RENDER_VERSION)
+                request._topic_state = (etag, modified)
+    return request._topic_state
+
+
+def _topic_etag(request, topic_id):
+    state = _topic_state(request, topic_id)
+    return state and state[0]
+
+
+def _topic_last_modified(request, topic_id):
+    state = _topic_state(request, topic_id)
+    return state and state[1]
+
+
+def _count_not_modified(view):
+    """返回 304 时视图没有执行，浏览量在这里记录（只在进程内累加）"""
+    @wraps(view)
+    def wrapper(request, topic_id):
+        response = view(request, topic_id)
+        if response.status_code == 304:
+            viewcount.incr(topic_id)
+        return response
+    return wrapper
 
 
 @require_http_methods(['GET', 'POST'])
+@_count_not_modified
+@condition(etag_func=_topic_etag, last_modified_func=_topic_last_modified)
 def topic(request, topic_id):
     try:
-        topic = Topic.objects.get(id=topic_id)
+        topic = Topic.objects.select_related('author', 'node').get(id=topic_id)
     except Topic.DoesNotExist:
         raise Http404
 
-    topic.num_views += 1
-    topic.save()
+    viewcount.incr(topic.id)
+    topic.num_views += viewcount.pending(topic.id)
 
-    faved_num = FavoritedTopic.objects.filter(topic=topic).count()
+    faved_num = topic.num_favorites
     if request.user.is_authenticated():
         try:
             faved_topic = FavoritedTopic.objects.filter(user=request.user, topic=topic).first()
         except (Member.DoesNotExist, FavoritedTopic.DoesNotExist):
             faved_topic = None
 
-    comment_list = Comment.objects.filter(topic=topic).order_by('created_on')
-    paginator = Paginator(comment_list, NUM_COMMENT_PAGE)
-    page = request.GET.get('page', 1)
-
-    try:
-        comment_list = paginator.page(page)
-    except PageNotAnInteger:
-        comment_list = paginator.page(1)
-    except EmptyPage:
-        comment_list = paginator.page(paginator.num_pages)
-
+    comment_list = _comment_page(request, topic)
     reply_form = ReplyForm()
 
     return render(request, 'question/topic.html', locals())
@@ -130,17 +142,7 @@ def topic(request, topic_id):
 def reply(request, topic_id):
     """回复"""
     try:
-        topic = Topic.objects.get(id=topic_id)
-        comment_list = Comment.objects.filter(topic=topic).order_by('created_on')
-        paginator = Paginator(comment_list, NUM_COMMENT_PAGE)
-        page = request.GET.get('page', 1)
-
-        try:
-            comment_list = paginator.page(page)
-        except PageNotAnInteger:
-            comment_list = paginator.page(1)
-        except EmptyPage:
-            comment_list = paginator.page(paginator.num_pages)
+        topic = Topic.objects.select_related('node').get(id=topic_id)
     except Topic.DoesNotExist:
         raise Http404
 
@@ -152,40 +154,22 @@ def reply(request, topic_id):
                 messages.error(request, '不可以提交两次重复的回复！')
             else:
                 comment = form.save(commit=False)
-                request.user.comment_num += 1
-                request.user.calculate_au()
-                request.user.save()
                 comment.author = request.user
-
-                try:
-                    topic = Topic.objects.get(id=topic_id)
-                except Topic.DoesNotExist:
-                    raise Http404
-
                 comment.topic = topic
-                comment.save()
-
-                team_name_pattern = re.compile('(?<=@)([0-9a-zA-Z_.]+)', re.UNICODE)    # 正则获取@后面的字符串
-                at_name_list = set(re.findall(team_name_pattern, comment.content))      # 获取@的用户
-                if at_name_list:
-                    for at_name in at_name_list:
-                        if at_name != comment.author.username and at_name != comment.topic.author.username:
-                            try:
-                                at_user = Member.objects.get(username=at_name)
-                                if at_user:
-                                    notice = Notice(from_user=comment.author, to_user=at_user, topic=comment.topic, content=comment.content)
-                                    notice.save()
-                            except Notice.DoesNotExist:
-                                pass
-
-                topic.num_comments += 1
-                topic.updated_on = timezone.now()
-                topic.last_reply = request.user
-                topic.save()
+                with transaction.atomic():
+                    comment.save()
+                    Member.objects.incr_posts(request.user.id, comments=1)
+                    Topic.objects.filter(id=topic.id).update(num_comments=F('num_comments') + 1,
+                                                             updated_on=timezone.now(),
+                                                             last_reply=request.user)
+                    notices.notify_reply(comment)
+                    feed.publish_comment(comment)
+                pagecache.invalidate(topic.node)
                 return redirect(reverse('question:topic', kwargs={'topic_id': topic_id}))
     else:
         form = ReplyForm()
-    return render(request, 'question/topic.html', {'node': node, 'topic': topic, 'form': form, 'comment_list': comment_list, 'paginator': paginator})
+    comment_list = _comment_page(request, topic)
+    return render(request, 'question/topic.html', {'topic': topic, 'form': form, 'comment_list': comment_list})
 
 
 @login_required
@@ -207,15 +191,16 @@ def new(request, node_slug):
             else:
                 topic = form.save(commit=False)
                 topic.node = node
-                request.user.topic_num += 1
-                request.user.calculate_au()
-                request.user.save()
                 topic.author = request.user
                 topic.last_reply = request.user
                 topic.updated_on = timezone.now()
-                topic.save()
-                node.num_topics += 1
-                node.save()
+                with transaction.atomic():
+                    topic.save()
+                    Member.objects.incr_posts(request.user.id, topics=1)
+                    Node.objects.filter(id=node.id).update(num_topics=F('num_topics') + 1,
+                                                           updated_on=timezone.now())
+                    feed.publish_topic(topic)
+                pagecache.invalidate(node)
                 return redirect(reverse('question:topic', kwargs={'topic_id': topic.id}))
     else:
         form = TopicForm()
@@ -239,37 +224,72 @@ def edit(request, topic_id):
             topic.content = form.cleaned_data.get('content', '')
             topic.updated_on = timezone.now()
             topic.save()
+            pagecache.invalidate(topic.node)
         return redirect(reverse('question:topic', kwargs={'topic_id': topic_id}))
     else:
         form = TopicForm(instance=topic)
     return render(request, 'question/edit.html', {'form': form, 'topic': topic})
 
 
+@login_required
+def timeline(request):
+    """关注的人发表的主题和回复"""
+    entries = feed.timeline_page(request, request.user)
+    return render(request, 'question/timeline.html', {'entries': entries})
+
+
 @login_required
 def notice(request):
     context = {}
     if request.method == 'GET':
-        notices = Notice.objects.filter(to_user=request.user, is_deleted=False).order_by('-time')
-        context['notices'] = notices
+        context['notices'] = inbox.notice_page(request, request.user)
+        context['up_to'] = inbox.watermark(request.user, context['notices'])
         return render(request, 'question/notice.html', context)
 
 
+@login_required
+@require_http_methods(['POST'])
+def notice_read(request):
+    """标记已读，up_to 为打开页面时收件箱中最新一条通知的 id"""
+    up_to = request.POST.get('up_to', '')
+    inbox.mark_read(request.user, int(up_to) if up_to.isdigit() else None)
+    return redirect(reverse('question:notice'))
+
+
 @login_required
 def notice_delete(request, notice_id):
     if request.method == 'GET':
         try:
-            notice = Notice.objects.get(id=notice_id)
+            notice = Notice.objects.get(id=notice_id, to_user=request.user)
         except Notice.DoesNotExist:
             raise Http404
-        notice.is_deleted = True
-        notice.save()
+        deleted = Notice.objects.filter(id=notice.id, is_deleted=False).update(is_deleted=True)
+        if deleted and not notice.is_readed:
+            Member.objects.incr_counter(request.user.id, 'unread_notice_num', -1)
+            events.unread_changed(request.user.id)
     return redirect(reverse('question:notice'))
 
 
+@require_http_methods(['GET'])
+def event_stream(request):
+    """推送登录用户的未读通知数和 topic 参数指定主题的新回复"""
+    if not request.user.is_authenticated():
+        return HttpResponse(status=204)     # 浏览器收到 204 后不再重连
+    topic_id = request.GET.get('topic', '')
+    stream = events.Stream(request.user.id, topic_id=int(topic_id) if topic_id.isdigit() else None,
+                           last_event_id=request.META.get('HTTP_LAST_EVENT_ID'))
+
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'    # 让 nginx 不缓冲
+    return response
+
+
 @login_required
 def fav_topic_list(request):
     """查看所有主题"""
-    faved_topic = FavoritedTopic.objects.filter(user=request.user).all()
+    faved_topic = FavoritedTopic.objects.filter(user=request.user)\
+        .select_related('topic__author', 'topic__node', 'topic__last_reply')
     return render(request, 'question/fav_topic.html', locals())
 
 
@@ -283,7 +303,8 @@ def fav_topic(request, topic_id):
         topic = Topic.objects.get(pk=topic_id)
         if FavoritedTopic.objects.filter(user=request.user, topic=topic).first():
             messages.error(request, '该主题已经关注！')
-        FavoritedTopic.objects.create(user=request.user, topic=topic)
+        else:
+            FavoritedTopic.objects.create(user=request.user, topic=topic)
     except Topic.DoesNotExist:
         messages.error(request, '主题不存在！')
         return redirect(reverse('question:index'))
@@ -0,0 +1,153 @@
+"""
+全文索引的维护与查询。
+
+主题（标题 + 内容）和评论各自是一篇文档，保存时重新计算该文档的词权重并更新倒排记录，
+查询时只读倒排表：每个词沿 (term, -weight) 索引取权重最高的 SEARCH_TERM_POSTINGS 条记录，
+再按主题汇总命中的词数和得分。常见词的记录再多，一次查询读取的行数也有上限。
+"""
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_save, post_delete, pre_delete
+
+from question.models import Topic, Comment
+from search.models import Term, Posting
+from search.tokenizer import tokenize
+
+SEARCH_MAX_TERMS = getattr(settings, 'SEARCH_MAX_TERMS', 10)
+SEARCH_MAX_RESULTS = getattr(settings, 'SEARCH_MAX_RESULTS', 200)
+SEARCH_TERM_POSTINGS = getattr(settings, 'SEARCH_TERM_POSTINGS', 1000)
+
+TITLE_BOOST = 3.0
+CONTENT_BOOST = 1.0
+COMMENT_BOOST = 0.5
+
+
+def _weights(*fields):
+    """fields 为 (文本, 加权) 对，返回 {词: 权重}"""
+    weights = Counter()
+    for text, boost in fields:
+        for term, tf in Counter(tokenize(text)).items():
+            weights[term] += boost * (1 + math.log(tf))
+    return weights
+
+
+def topic_weights(title, content):
+    return _weights((title, TITLE_BOOST), (content, CONTENT_BOOST))
+
+
+def comment_weights(content):
+    return _weights((content, COMMENT_BOOST))
+
+
+def get_terms(words):
+    """取出（必要时创建）词表中的词，返回 {词: id}"""
+    terms = dict(Term.objects.filter(term__in=words).values_list('term', 'id'))
+    missing = [word for word in words if word not in terms]
+    if missing:
+        try:
+            with transaction.atomic():
+                Term.objects.bulk_create([Term(term=word) for word in missing])
+        except IntegrityError:
+            pass    # 并发写入时别的进程已经建好了
+        terms.update(Term.objects.filter(term__in=missing).values_list('term', 'id'))
+    return terms
+
+
+def index_document(kind, object_id, topic_id, weights):
+    old = dict(Posting.objects.filter(kind=kind, object_id=object_id).values_list('term__term', 'weight'))
+    if old.keys() == weights.keys() and all(abs(old[term] - weights[term]) < 1e-6 for term in old):
+        return      # 内容没变（如只更新了计数），不必改写
+
+    with transaction.atomic():
+        Posting.objects.filter(kind=kind, object_id=object_id).delete()
+        terms = get_terms(list(weights))
+        added = [terms[term] for term in weights if term not in old]
+        removed = [term for term in old if term not in weights]
+        if added:
+            Term.objects.filter(id__in=added).update(df=F('df') + 1)
+        if removed:
+            Term.objects.filter(term__in=removed).update(df=F('df') - 1)
+        Posting.objects.bulk_create([
+            Posting(term_id=terms[term], topic_id=topic_id, kind=kind, object_id=object_id, weight=weight)
+            for term, weight in weights.items()
+        ])
+
+
+def unindex_document(kind, object_id):
+    with transaction.atomic():
+        term_ids = list(Posting.objects.filter(kind=kind, object_id=object_id).values_list('term', flat=True))
+        if term_ids:
+            Term.objects.filter(id__in=term_ids).update(df=F('df') - 1)
+            Posting.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def index_topic(topic):
+    index_document(Posting.KIND_TOPIC, topic.id, topic.id, topic_weights(topic.title, topic.content))
+
+
+def index_comment(comment):
+    index_document(Posting.KIND_COMMENT, comment.id, comment.topic_id, comment_weights(comment.content))
+
+
+def topic_saved(sender, **kwargs):
+    topic = kwargs.get('instance', None)
+    update_fields = kwargs.get('update_fields')
+    if topic and (update_fields is None or {'title', 'content'} & set(update_fields)):
+        index_topic(topic)
+
+
+def comment_saved(sender, **kwargs):
+    comment = kwargs.get('instance', None)
+    update_fields = kwargs.get('update_fields')
+    if comment and (update_fields is None or 'content' in update_fields):
+        index_comment(comment)
+
+
+def topic_deleting(sender, **kwargs):
+    # 主题删除时倒排记录随外键级联删除，这里先把词频减掉
+    topic = kwargs.get('instance', None)
+    if topic:
+        rows = Posting.objects.filter(topic=topic).values('term').annotate(count=Count('id')).order_by()
+        for row in rows:
+            Term.objects.filter(id=row['term']).update(df=F('df') - row['count'])
+
+
+def comment_deleted(sender, **kwargs):
+    comment = kwargs.get('instance', None)
+    if comment:
+        unindex_document(Posting.KIND_COMMENT, comment.id)
+
+
+def search(query):
+    """
+    返回 [(topic_id, 命中词数, 得分)]，命中词数多的在前，其次按得分。
+    词的权重乘以 1 / log(2 + df)，越少见的词越重要。
+    """
+    words = list(dict.fromkeys(tokenize(query)))[:SEARCH_MAX_TERMS]
+    if not words:
+        return []
+    terms = list(Term.objects.filter(term__in=words, df__gt=0).values_list('id', 'df'))
+
+    hits = defaultdict(set)
+    scores = Counter()
+    for term_id, df in terms:
+        idf = 1 / math.log(2 + df)
+        postings = Posting.objects.filter(term_id=term_id).order_by('-weight')\
+            .values_list('topic', 'weight')[:SEARCH_TERM_POSTINGS]
+        for topic_id, weight in postings:
+            hits[topic_id].add(term_id)
+            scores[topic_id] += weight * idf
+
+    results = sorted(((topic_id, len(hits[topic_id]), score) for topic_id, score in scores.items()),
+                     key=lambda row: (-row[1], -row[2], row[0]))
+    return results[:SEARCH_MAX_RESULTS]
+
+
+post_save.connect(topic_saved, sender=Topic)
+post_save.connect(comment_saved, sender=Comment)
+pre_delete.connect(topic_deleting, sender=Topic)
+post_delete.connect(comment_deleted, sender=Comment)
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from question.models import Topic, Comment
+from search import indexer
+from search.models import Term, Posting
+
+
+class Command(BaseCommand):
+    help = '清空并重建主题和评论的全文索引'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批索引的文档数')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        Posting.objects.all().delete()
+        Term.objects.all().delete()
+
+        total = 0
+        for rows in self.iter_chunks(Topic.objects.values_list('id', 'title', 'content'), chunk_size):
+            self.save_chunk([
+                (Posting.KIND_TOPIC, pk, pk, indexer.topic_weights(title, content))
+                for pk, title, content in rows
+            ])
+            total += len(rows)
+        self.stdout.write('主题: 索引 {} 篇'.format(total))
+
+        total = 0
+        for rows in self.iter_chunks(Comment.objects.values_list('id', 'topic_id', 'content'), chunk_size):
+            self.save_chunk([
+                (Posting.KIND_COMMENT, pk, topic_id, indexer.comment_weights(content))
+                for pk, topic_id, content in rows
+            ])
+            total += len(rows)
+        self.stdout.write('评论: 索引 {} 篇'.format(total))
+
+        # 词频最后用一条聚合 UPDATE 算出
+        df = Posting.objects.filter(term=OuterRef('pk')).order_by().values('term')\
+            .annotate(count=Count('id')).values('count')
+        Term.objects.update(df=Coalesce(Subquery(df), 0))
+
+    def iter_chunks(self, queryset, chunk_size):
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).order_by('id')[:chunk_size])
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield rows
+
+    def save_chunk(self, documents):
+        with transaction.atomic():
+            terms = indexer.get_terms(list({term for _, _, _, weights in documents for term in weights}))
+            Posting.objects.bulk_create([
+                Posting(term_id=terms[term], topic_id=topic_id, kind=kind, object_id=object_id, weight=weight)
+                for kind, object_id, topic_id, weights in documents
+                for term, weight in weights.items()
+            ])
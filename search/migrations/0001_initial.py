@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 19:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('question', '0003_rendered_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Posting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('t', '主题'), ('c', '评论')], max_length=1, verbose_name='文档类型')),
+                ('object_id', models.IntegerField(verbose_name='文档id')),
+                ('weight', models.FloatField(verbose_name='权重')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Term',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40, unique=True, verbose_name='词')),
+                ('df', models.IntegerField(default=0, verbose_name='包含该词的文档数')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='posting',
+            name='term',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='search.Term', verbose_name='词'),
+        ),
+        migrations.AddField(
+            model_name='posting',
+            name='topic',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='question.Topic', verbose_name='所属主题'),
+        ),
+        migrations.AlterIndexTogether(
+            name='posting',
+            index_together=set([('kind', 'object_id'), ('term', 'topic', 'weight')]),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 20:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='posting',
+            index_together=set([('kind', 'object_id')]),
+        ),
+        migrations.AddIndex(
+            model_name='posting',
+            index=models.Index(fields=['term', '-weight'], name='posting_term_weight_idx'),
+        ),
+    ]
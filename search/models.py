@@ -0,0 +1,39 @@
+from django.db import models
+from question.models import Topic
+
+
+class Term(models.Model):
+    """索引词"""
+    term = models.CharField(max_length=40, unique=True, verbose_name='词')
+    df = models.IntegerField(default=0, verbose_name='包含该词的文档数')
+
+    def __str__(self):
+        return self.term
+
+
+class Posting(models.Model):
+    """倒排记录：词在一篇文档（主题或评论）中的权重，按所属主题汇总排序"""
+    KIND_TOPIC = 't'
+    KIND_COMMENT = 'c'
+    KIND_CHOICES = (
+        (KIND_TOPIC, '主题'),
+        (KIND_COMMENT, '评论'),
+    )
+
+    term = models.ForeignKey(Term, verbose_name='词')
+    topic = models.ForeignKey(Topic, verbose_name='所属主题')
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES, verbose_name='文档类型')
+    object_id = models.IntegerField(verbose_name='文档id')
+    weight = models.FloatField(verbose_name='权重')
+
+    class Meta:
+        index_together = [
+            ('kind', 'object_id'),
+        ]
+        indexes = [
+            # 每个词的倒排记录按权重从高到低读取，查询只取前 SEARCH_TERM_POSTINGS 条
+            models.Index(fields=['term', '-weight'], name='posting_term_weight_idx'),
+        ]
+
+    def __str__(self):
+        return '{}:{}{}'.format(self.term_id, self.kind, self.object_id)
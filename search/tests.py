@@ -0,0 +1,152 @@
+import unittest
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from question.models import Topic, Comment
+from question.testing import QueryBudgetMixin, seed_forum
+from search import indexer
+from search.models import Term, Posting
+from search.tokenizer import tokenize
+
+
+class TokenizerTests(TestCase):
+
+    def test_cjk_bigrams(self):
+        self.assertEqual(tokenize('问答社区'), ['问答', '答社', '社区'])
+        self.assertEqual(tokenize('书'), ['书'])
+
+    def test_words(self):
+        self.assertEqual(tokenize('Django ORM, django_orm!'), ['django', 'orm', 'django', 'orm'])
+        self.assertEqual(tokenize('Python3 与 Go'), ['python3', '与', 'go'])
+
+    def test_long_words_are_dropped(self):
+        self.assertEqual(tokenize('a' * 41 + ' ok'), ['ok'])
+
+
+class IndexerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(num_topics=3, num_comments=0)
+
+    def create_topic(self, title, content='正文'):
+        return Topic.objects.create(title=title, content=content, node=self.node, author=self.users[0])
+
+    def df(self, term):
+        return Term.objects.get(term=term).df
+
+    def test_index_on_save(self):
+        topic = self.create_topic('redis 缓存')
+        self.assertEqual(set(Posting.objects.filter(kind=Posting.KIND_TOPIC, object_id=topic.id)
+                             .values_list('term__term', flat=True)), {'redis', '缓存', '正文'})
+        self.assertEqual(self.df('redis'), 1)
+
+        Comment.objects.create(topic=topic, author=self.users[1], content='redis 集群')
+        self.assertEqual(self.df('redis'), 2)
+        self.assertEqual(self.df('集群'), 1)
+
+    def test_reindex_on_edit(self):
+        topic = self.create_topic('redis 缓存')
+        topic.title = 'memcached 缓存'
+        topic.save()
+        self.assertEqual(self.df('redis'), 0)
+        self.assertEqual(self.df('memcached'), 1)
+        self.assertEqual(self.df('缓存'), 1)
+
+        # 只更新计数时不改写倒排记录
+        with mock.patch('search.indexer.index_document') as index_document:
+            topic.save(update_fields=['num_comments'])
+        self.assertFalse(index_document.called)
+
+    def test_unindex_on_delete(self):
+        topic = self.create_topic('redis 缓存')
+        comment = Comment.objects.create(topic=topic, author=self.users[1], content='redis 集群')
+        comment.delete()
+        self.assertEqual(self.df('redis'), 1)
+        self.assertEqual(self.df('集群'), 0)
+
+        Comment.objects.create(topic=topic, author=self.users[1], content='redis 集群')
+        topic.delete()
+        self.assertEqual(self.df('redis'), 0)
+        self.assertFalse(Posting.objects.filter(topic_id=topic.id).exists())
+
+    def test_ranking(self):
+        in_content = self.create_topic('其他', 'redis')
+        in_title = self.create_topic('redis')
+        both = self.create_topic('redis', '集群')
+        Comment.objects.create(topic=in_content, author=self.users[1], content='集群')
+
+        results = indexer.search('redis 集群')
+        # 命中两个词的在前，其中标题命中的得分更高；只命中一个词时标题权重高于内容
+        self.assertEqual([topic_id for topic_id, hits, score in results], [both.id, in_content.id, in_title.id])
+        self.assertEqual([hits for topic_id, hits, score in results], [2, 2, 1])
+
+    def test_rare_terms_score_higher(self):
+        common = [self.create_topic('redis') for i in range(3)]
+        rare = self.create_topic('memcached')
+        results = dict((topic_id, score) for topic_id, hits, score in indexer.search('redis memcached'))
+        self.assertGreater(results[rare.id], results[common[0].id])
+
+    def test_no_match(self):
+        self.assertEqual(indexer.search('不存在的词'), [])
+        self.assertEqual(indexer.search('!!!'), [])
+
+    @mock.patch('search.indexer.SEARCH_TERM_POSTINGS', 2)
+    def test_postings_per_term_are_capped(self):
+        low = self.create_topic('其他', 'redis')
+        high = [self.create_topic('redis') for i in range(2)]
+        results = [topic_id for topic_id, hits, score in indexer.search('redis')]
+        self.assertEqual(sorted(results), sorted(topic.id for topic in high))
+        self.assertNotIn(low.id, results)
+
+    def test_rebuild_command(self):
+        topic = self.create_topic('redis 缓存')
+        Comment.objects.create(topic=topic, author=self.users[1], content='redis 集群')
+        Term.objects.update(df=99)
+        call_command('rebuild_search_index', chunk_size=2, stdout=StringIO())
+        self.assertEqual(self.df('redis'), 2)
+        self.assertEqual(indexer.search('集群')[0][0], topic.id)
+
+    def test_view(self):
+        topic = self.create_topic('redis 缓存')
+        response = self.client.get(reverse('search:search'), {'q': 'redis'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['topic_list'], [topic])
+
+
+@override_settings(QUERY_STATS=False)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """搜索页的查询数预算；每个主题都能搜到，结果多于一页，查询数不随结果数增加"""
+    SEED = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.node, cls.topic = seed_forum(**cls.SEED)
+
+    def test_search(self):
+        response = self.assertQueryBudget(3, reverse('search:search'), data={'q': '主题'})
+        self.assertEqual(len(response.context['topic_list']), settings.NUM_TOPIC_PAGE)
+        self.assertQueryBudget(3, reverse('search:search'), data={'q': '主题', 'page': 2})
+
+
+class LargeSeedQueryBudgetTests(QueryBudgetTests):
+    SEED = {'num_users': 6, 'num_topics': 60, 'num_comments': 60}
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', '查询计划的格式与数据库有关，这里只检查 SQLite')
+class SearchQueryPlanTests(TestCase):
+
+    def test_postings_use_weight_index(self):
+        queryset = Posting.objects.filter(term_id=1).order_by('-weight').values_list('topic', 'weight')[:10]
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('posting_term_weight_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
@@ -0,0 +1,26 @@
+"""
+分词。
+
+中日韩文字没有空格分隔，连续的一段按相邻两字切成二元词（“问答社区” -> 问答、答社、社区），
+只有一个字时保留单字；其他文字按单词切分并转成小写。
+"""
+import re
+
+CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+TOKEN_PATTERN = re.compile('([{cjk}]+)|([^\\W_{cjk}]+)'.format(cjk=CJK))
+
+MAX_TOKEN_LENGTH = 40
+
+
+def tokenize(text):
+    """按出现顺序返回所有词（可重复）"""
+    tokens = []
+    for cjk, word in TOKEN_PATTERN.findall(text.lower()):
+        if cjk:
+            if len(cjk) == 1:
+                tokens.append(cjk)
+            else:
+                tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        elif len(word) <= MAX_TOKEN_LENGTH:
+            tokens.append(word)
+    return tokens
@@ -0,0 +1,37 @@
+from django.shortcuts import render
+from django.conf import settings
+from django.core.paginator import PageNotAnInteger, EmptyPage
+from django.views.decorators.http import require_http_methods
+
+from question.models import Topic
+from question.paginator import NumberPaginator
+from search import indexer
+
+NUM_TOPICS_PAGE = settings.NUM_TOPIC_PAGE
+
+
+@require_http_methods(['GET'])
+def search(request):
+    """搜索主题和评论，结果按主题排列"""
+    query = request.GET.get('q', '').strip()[:100]
+    results = indexer.search(query) if query else []
+
+    params = request.GET.copy()
+    params.pop('page', None)
+    paginator = NumberPaginator(results, NUM_TOPICS_PAGE, params)
+    page = request.GET.get('page', 1)
+    try:
+        result_list = paginator.page(page)
+    except PageNotAnInteger:
+        result_list = paginator.page(1)
+    except EmptyPage:
+        result_list = paginator.page(paginator.num_pages)
+
+    # 只取出当前页的主题
+    topic_ids = [topic_id for topic_id, hits, score in result_list]
+    topics = Topic.objects.select_related('author', 'node', 'last_reply').in_bulk(topic_ids)
+    topic_list = [topics[topic_id] for topic_id in topic_ids if topic_id in topics]
+
+    return render(request, 'search/index.html', {'query': query,
+                                                 'result_list': result_list,
+                                                 'topic_list': topic_list})
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SitesConfig(AppConfig):
     name = 'sites'
+
+    def ready(self):
+        from sites import taxonomy     # noqa 注册信号
@@ -0,0 +1,17 @@
+"""
+酷站分类树：[{'category_name', 'category_sites': [{'name', 'url', 'description'}]}]
+"""
+from QA.taxonomy import Taxonomy
+from sites.models import Category, CoolSite
+
+
+def load_sites():
+    sites = {}
+    for site in CoolSite.objects.order_by('id').values('name', 'url', 'description', 'category_id'):
+        sites.setdefault(site.pop('category_id'), []).append(site)
+    return [{'category_name': category['name'], 'category_sites': sites.get(category['id'], [])}
+            for category in Category.objects.order_by('id').values('id', 'name')]
+
+
+site_tree = Taxonomy('sites_categorys', load_sites)
+site_tree.watch(Category, CoolSite)
@@ -1,3 +1,34 @@
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
 from django.test import TestCase
 
-# Create your tests here.
+from people.models import Member
+from sites.models import Category, CoolSite
+from sites.taxonomy import site_tree
+
+
+class SiteTreeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='工具')
+        cls.site = CoolSite.objects.create(category=cls.category, name='Django', url='https://www.djangoproject.com/')
+        cls.admin = Member.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index(self):
+        with self.assertNumQueries(2):
+            self.client.get(reverse('sites:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('sites:index'))
+        self.assertContains(response, 'https://www.djangoproject.com/')
+
+    def test_admin_save_refreshes_tree(self):
+        site_tree.get()
+        self.client.login(username=self.admin.email, password='password')
+        self.client.post(reverse('admin:sites_coolsite_change', args=[self.site.id]), {
+            'category': self.category.id, 'name': 'Django 文档', 'url': 'https://docs.djangoproject.com/',
+        })
+        self.assertEqual(site_tree.get()[0]['category_sites'][0]['name'], 'Django 文档')
@@ -1,18 +1,6 @@
 from django.shortcuts import render
-from django.core.cache import cache
-from sites.models import Category, CoolSite
+from sites.taxonomy import site_tree
 
 
 def index(request):
-    categorys = cache.get('sites_categorys')
-    if not categorys:
-        category_list = Category.objects.all()
-        categorys = []
-        for category in category_list:
-            sites = {
-                'category_name': category.name,
-                'category_sites': CoolSite.objects.filter(category=category),
-            }
-            categorys.append(sites)
-        cache.set('sites_categorys', categorys, 120)
-    return render(request, 'sites/index.html', {'categorys': categorys})
+    return render(request, 'sites/index.html', {'categorys': site_tree.get()})
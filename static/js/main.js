@@ -51,4 +51,21 @@ function gotofloor(floor){
 	new_element.addClass("light");
 	old_element = new_element;
 
-}
\ No newline at end of file
+}
+// 未读通知数和当前主题新回复的推送
+$(function(){
+	var url = $("body").data("events");
+	if (!url || !window.EventSource) {
+		return;
+	};
+	var source = new EventSource(url);
+	source.addEventListener("unread", function(e){
+		var count = JSON.parse(e.data).count;
+		$("#unread-notice").text(count > 0 ? count + " 条未读信息" : "暂无未读消息");
+	});
+	var newComments = 0;
+	source.addEventListener("comment", function(e){
+		newComments += JSON.parse(e.data).count;
+		$("#new-comments").text(newComments + " 条新回复，点击刷新").removeClass("hidden");
+	});
+});